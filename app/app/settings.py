@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+from datetime import timedelta
 from pathlib import Path
 import os
 
@@ -51,15 +52,22 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.HealthCheckMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
+    'core.middleware.CompressionMiddleware',
+    'core.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
-    'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
-    'django.contrib.messages.middleware.MessageMiddleware',
+    'core.middleware.CsrfViewMiddleware',
+    'core.middleware.AuthenticationMiddleware',
+    'core.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.middleware.QueryPlanMiddleware',
 ]
 
+# Paths served without sessions, CSRF cookies, request.user or messages.
+# The API authenticates with tokens; only the admin needs those.
+SESSIONLESS_PATH_PREFIXES = ['/api/']
+
 ROOT_URLCONF = 'app.urls'
 
 TEMPLATES = [
@@ -91,6 +99,45 @@ DATABASES = {
         'NAME': os.environ.get('DB_NAME'),
         'USER': os.environ.get('DB_USER'),
         'PASSWORD': os.environ.get('DB_PASS'),
+        # Keep connections open between requests instead of reconnecting.
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        'OPTIONS': {
+            'connect_timeout': int(os.environ.get('DB_CONNECT_TIMEOUT', 2)),
+        },
+    }
+}
+
+# Shards
+# Recipes, tags, ingridients and their history live on one database of
+# DATABASE_SHARDS per user; users, tokens and everything else live on
+# GLOBAL_DATABASE. DB_SHARDS lists extra shard aliases, each a database
+# named DB_NAME_<ALIAS>, on DB_HOST_<ALIAS> if set. Ids on the shard at
+# index i start at i * SHARD_ID_BLOCK, so rows keep their ids when a
+# user moves between shards.
+
+GLOBAL_DATABASE = 'default'
+DATABASE_SHARDS = ['default']
+for shard in filter(None, os.environ.get('DB_SHARDS', '').split(',')):
+    DATABASES[shard] = {
+        **DATABASES['default'],
+        'HOST': os.environ.get(f'DB_HOST_{shard.upper()}',
+                               DATABASES['default']['HOST']),
+        'NAME': os.environ.get(f'DB_NAME_{shard.upper()}'),
+    }
+    DATABASE_SHARDS.append(shard)
+
+DATABASE_ROUTERS = ['core.sharding.ShardRouter']
+SHARD_ID_BLOCK = 10 ** 12
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
     }
 }
 
@@ -145,4 +192,147 @@ AUTH_USER_MODEL = 'core.User'
 
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    'DEFAULT_RENDERER_CLASSES': [
+        'core.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'core.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+    'DEFAULT_THROTTLE_CLASSES': [
+        'core.throttling.UserThrottle',
+        'core.throttling.TokenThrottle',
+        'core.throttling.ExpensiveThrottle',
+    ],
+    # Requests per user, per token, and per user for expensive actions.
+    # Counters live in the default cache, so it must be shared between
+    # processes (CACHE_BACKEND) for the limits to hold across workers.
+    'DEFAULT_THROTTLE_RATES': {
+        'user': os.environ.get('THROTTLE_RATE_USER', '600/min'),
+        'token': os.environ.get('THROTTLE_RATE_TOKEN', '300/min'),
+        'expensive': os.environ.get('THROTTLE_RATE_EXPENSIVE', '60/min'),
+    },
 }
+
+# Response compression
+# JSON responses above COMPRESSION_MIN_SIZE bytes are sent with brotli
+# (when installed) or gzip, depending on the client's Accept-Encoding.
+
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', 1024))
+COMPRESSION_GZIP_LEVEL = int(os.environ.get('COMPRESSION_GZIP_LEVEL', 6))
+COMPRESSION_BROTLI_QUALITY = int(
+    os.environ.get('COMPRESSION_BROTLI_QUALITY', 4))
+COMPRESSION_CONTENT_TYPES = [
+    'application/json',
+    'application/vnd.oai.openapi',
+    'application/vnd.oai.openapi+json',
+]
+
+# OpenAPI schema
+# build_schema writes the schema for APP_VERSION (or a digest of the
+# sources when unset) to SCHEMA_ROOT during deploy.
+
+APP_VERSION = os.environ.get('APP_VERSION', '')
+SCHEMA_ROOT = os.environ.get('SCHEMA_ROOT', '/vol/web/schema')
+SCHEMA_CACHE_MAX_AGE = int(os.environ.get('SCHEMA_CACHE_MAX_AGE', 3600))
+
+# Health checks
+# Readiness results are reused for HEALTH_CHECK_CACHE_SECONDS so probe
+# storms don't turn into database load.
+
+HEALTH_CHECK_LIVENESS_PATH = '/healthz'
+HEALTH_CHECK_READINESS_PATH = '/readyz'
+HEALTH_CHECK_CACHE_SECONDS = float(
+    os.environ.get('HEALTH_CHECK_CACHE_SECONDS', 1))
+
+# Auth tokens
+# Tokens expire AUTH_TOKEN_TTL after issue or AUTH_TOKEN_IDLE_TTL after
+# their last use. last_used is written at most once per interval. Logging
+# in revokes the least recently used tokens beyond AUTH_TOKEN_MAX_PER_USER,
+# which is at least 1.
+
+AUTH_TOKEN_TTL = timedelta(
+    hours=int(os.environ.get('AUTH_TOKEN_TTL_HOURS', 24 * 30)))
+AUTH_TOKEN_IDLE_TTL = timedelta(
+    hours=int(os.environ.get('AUTH_TOKEN_IDLE_TTL_HOURS', 24 * 7)))
+AUTH_TOKEN_LAST_USED_INTERVAL = timedelta(
+    seconds=int(os.environ.get('AUTH_TOKEN_LAST_USED_INTERVAL', 300)))
+AUTH_TOKEN_MAX_PER_USER = int(os.environ.get('AUTH_TOKEN_MAX_PER_USER', 10))
+
+# Account deletion
+# Deleting an account removes its rows ACCOUNT_DELETION_BATCH_SIZE at a
+# time, in a background thread unless ACCOUNT_DELETION_ASYNC is off.
+# resume_deletions picks up jobs without progress for
+# ACCOUNT_DELETION_STALE_AFTER, e.g. after a worker restart.
+
+ACCOUNT_DELETION_ASYNC = bool(
+    int(os.environ.get('ACCOUNT_DELETION_ASYNC', 1)))
+ACCOUNT_DELETION_BATCH_SIZE = int(
+    os.environ.get('ACCOUNT_DELETION_BATCH_SIZE', 1000))
+ACCOUNT_DELETION_STALE_AFTER = timedelta(
+    minutes=int(os.environ.get('ACCOUNT_DELETION_STALE_MINUTES', 10)))
+
+# Idempotency keys
+# Responses to writes sent with an Idempotency-Key header are replayed
+# for IDEMPOTENCY_KEY_TTL; purge_idempotency_keys removes older ones.
+
+IDEMPOTENCY_KEY_TTL = timedelta(
+    hours=int(os.environ.get('IDEMPOTENCY_KEY_TTL_HOURS', 24)))
+
+# Delta sync
+# Tombstones of deleted rows are kept for SYNC_TOMBSTONE_TTL; clients
+# with an older sync token must start over with a full sync. Changes are
+# only served once they are SYNC_SAFETY_LAG old, which must be longer
+# than any write transaction, plus clock skew between servers.
+
+SYNC_PAGE_SIZE = int(os.environ.get('SYNC_PAGE_SIZE', 500))
+SYNC_TOMBSTONE_TTL = timedelta(
+    days=int(os.environ.get('SYNC_TOMBSTONE_TTL_DAYS', 30)))
+SYNC_SAFETY_LAG = timedelta(
+    seconds=int(os.environ.get('SYNC_SAFETY_LAG_SECONDS', 30)))
+
+# Migrations
+# BatchedBackfill updates this many rows per statement and sleeps
+# MIGRATION_BACKFILL_PAUSE seconds between them.
+
+MIGRATION_BACKFILL_BATCH_SIZE = int(
+    os.environ.get('MIGRATION_BACKFILL_BATCH_SIZE', 1000))
+MIGRATION_BACKFILL_PAUSE = float(
+    os.environ.get('MIGRATION_BACKFILL_PAUSE', 0.05))
+
+# Recipe archive
+# archive_recipes moves the recipes of users inactive for
+# RECIPE_ARCHIVE_AFTER into the archive table; they are restored on the
+# user's next authenticated request.
+
+RECIPE_ARCHIVE_AFTER = timedelta(
+    days=int(os.environ.get('RECIPE_ARCHIVE_AFTER_DAYS', 180)))
+RECIPE_ARCHIVE_BATCH_SIZE = int(
+    os.environ.get('RECIPE_ARCHIVE_BATCH_SIZE', 1000))
+
+# Change events
+# Writes to recipes, tags and ingridients are announced with NOTIFY on
+# CHANGE_EVENTS_CHANNEL and streamed to clients of the ASGI app at
+# CHANGE_EVENTS_PATH. A stream more than CHANGE_EVENTS_QUEUE_SIZE events
+# behind is told to resync instead.
+
+CHANGE_EVENTS_PATH = '/api/events/'
+CHANGE_EVENTS_CHANNEL = os.environ.get(
+    'CHANGE_EVENTS_CHANNEL', 'recipe_changes')
+CHANGE_EVENTS_QUEUE_SIZE = int(
+    os.environ.get('CHANGE_EVENTS_QUEUE_SIZE', 100))
+CHANGE_EVENTS_HEARTBEAT = float(
+    os.environ.get('CHANGE_EVENTS_HEARTBEAT', 15))
+
+# Query plans
+# With QUERY_PLAN_CAPTURE on, SELECTs run by views of
+# QUERY_PLAN_NAMESPACES slower than QUERY_PLAN_THRESHOLD milliseconds are
+# run again under EXPLAIN ANALYZE for the slow_queries report, each query
+# shape at most once per QUERY_PLAN_INTERVAL seconds per process.
+
+QUERY_PLAN_CAPTURE = bool(int(os.environ.get('QUERY_PLAN_CAPTURE', 0)))
+QUERY_PLAN_THRESHOLD = float(os.environ.get('QUERY_PLAN_THRESHOLD', 100))
+QUERY_PLAN_INTERVAL = float(os.environ.get('QUERY_PLAN_INTERVAL', 300))
+QUERY_PLAN_NAMESPACES = ['recipe', 'user']
@@ -0,0 +1,56 @@
+"""
+Django settings for running the test suite.
+
+    python manage.py test --settings=app.settings_test
+
+Passwords are hashed with MD5 instead of PBKDF2, the cache is local
+memory and throttling is off unless a test turns it on. Set
+TEST_DB=sqlite to run against in-memory SQLite databases instead of
+the Postgres container. A second database, shard1, is there for tests
+that opt into sharding with override_settings(DATABASE_SHARDS=...).
+"""
+import os
+
+from app.settings import *  # noqa: F401,F403
+from app.settings import DATABASES, REST_FRAMEWORK
+
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+if os.environ.get('TEST_DB') != 'sqlite':
+    DATABASES = {
+        **DATABASES,
+        'shard1': {
+            **DATABASES['default'],
+            'NAME': f'{DATABASES["default"]["NAME"]}_shard1',
+        },
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': ':memory:',
+        },
+        'shard1': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': ':memory:',
+        },
+    }
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+REST_FRAMEWORK = {
+    **REST_FRAMEWORK,
+    'DEFAULT_THROTTLE_RATES': {
+        'user': None,
+        'token': None,
+        'expensive': None,
+    },
+}
+
+TEST_RUNNER = 'app.test_runner.TimedTestRunner'
+TEST_TIMINGS_FILE = os.environ.get(
+    'TEST_TIMINGS_FILE', '/tmp/taomnoma24-test-timings.json')
@@ -0,0 +1,70 @@
+"""
+Test runner running the suite in parallel and reporting wall-clock time
+"""
+import json
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.test.runner import DiscoverRunner, default_test_processes
+
+
+class TimedTestRunner(DiscoverRunner):
+    """
+    Run tests in parallel and keep the test database between runs.
+
+    Each worker gets its own clone of the migrated test database, so
+    migrations run once rather than once per worker, and with keepdb
+    not at all on later runs. Pass --parallel 1 or --no-keepdb to opt
+    out. The wall-clock time is printed next to the last run in the
+    other mode, serial or parallel.
+    """
+
+    @classmethod
+    def add_arguments(cls, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            '--no-keepdb', action='store_false', dest='keepdb',
+            help='Destroy the test database after the run.',
+        )
+        parser.set_defaults(parallel=default_test_processes(), keepdb=True)
+
+    def run_tests(self, *args, **kwargs):
+        start = time.perf_counter()
+        result = super().run_tests(*args, **kwargs)
+        self.report(time.perf_counter() - start)
+        return result
+
+    def mode(self):
+        return 'parallel' if self.parallel > 1 else 'serial'
+
+    def report(self, elapsed):
+        """Print elapsed time and compare it with the other mode."""
+        timings = self.load_timings()
+        run = f'{connection.vendor}-{self.mode()}'
+        timings[run] = {'seconds': elapsed, 'workers': self.parallel}
+        self.save_timings(timings)
+
+        line = (f'Wall-clock time: {elapsed:.2f}s '
+                f'({self.mode()}, {self.parallel} worker(s), '
+                f'{connection.vendor})')
+        other = 'serial' if self.parallel > 1 else 'parallel'
+        previous = timings.get(f'{connection.vendor}-{other}')
+        if previous:
+            line += (f'; last {other} run {previous["seconds"]:.2f}s, '
+                     f'{previous["seconds"] / elapsed:.1f}x')
+        print(line)
+
+    def load_timings(self):
+        try:
+            with open(settings.TEST_TIMINGS_FILE) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_timings(self, timings):
+        try:
+            with open(settings.TEST_TIMINGS_FILE, 'w') as f:
+                json.dump(timings, f)
+        except OSError:
+            pass
@@ -19,13 +19,13 @@ from django.urls import path, include
 from django. conf import settings
 from django.conf.urls.static import static
 
-from drf_spectacular.views import (
-    SpectacularAPIView,
-    SpectacularSwaggerView)
+from drf_spectacular.views import SpectacularSwaggerView
+
+from core.views import SchemaView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('api/schema/', SpectacularAPIView.as_view(), name='api-schema'),
+    path('api/schema/', SchemaView.as_view(), name='api-schema'),
     path('api/docs/', SpectacularSwaggerView.as_view(url_name='api-schema'),
          name='api-docs'),
     path('api/user/', include('user.urls')),
@@ -0,0 +1,66 @@
+"""
+Benchmarks for the API.
+
+Run them from the app directory as modules, for example::
+
+    python -m benchmarks.bench_compression
+"""
+import os
+import timeit
+from contextlib import contextmanager
+
+
+def setup_django(settings_module='app.settings'):
+    """Configure Django so benchmarks can import project code."""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    import django
+    django.setup()
+
+
+@contextmanager
+def test_database(verbosity=0):
+    """Create a throwaway test database for the duration of the block."""
+    from django.db import connection
+    from django.test.utils import (
+        setup_test_environment,
+        teardown_test_environment,
+    )
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=verbosity)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+        teardown_test_environment()
+
+
+def measure(func, number=None, repeat=5):
+    """Return the best time per call of func in seconds."""
+    timer = timeit.Timer(func)
+    if number is None:
+        number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def recipe_payload(count, tags=4, ingridients=8):
+    """Return a list shaped like the recipe list endpoint response."""
+    return [
+        {
+            'id': recipe_id,
+            'title': f'Recipe number {recipe_id}',
+            'time_minutes': 10 + recipe_id % 50,
+            'price': 500 + recipe_id % 1000,
+            'link': f'https://example.com/recipes/{recipe_id}',
+            'tags': [
+                {'id': tag_id, 'name': f'Tag {tag_id}'}
+                for tag_id in range(recipe_id % 20, recipe_id % 20 + tags)
+            ],
+            'ingridients': [
+                {'id': ing_id, 'name': f'Ingredient {ing_id}'}
+                for ing_id in range(
+                    recipe_id % 40, recipe_id % 40 + ingridients)
+            ],
+        }
+        for recipe_id in range(1, count + 1)
+    ]
@@ -0,0 +1,59 @@
+"""
+Benchmark one user's recipe page as the recipe table grows, and after
+everyone else's recipes are moved to the archive.
+
+Seeds synthetic users in steps, timing the query behind the first page
+of the recipe list for one fixed user after each step. Run it against
+PostgreSQL for meaningful numbers; the seeded rows live in a throwaway
+test database.
+"""
+import sys
+
+from benchmarks import measure, setup_django, test_database
+
+STEPS = (20000, 80000, 320000)
+PAGE = 50
+
+
+def main(steps=STEPS):
+    setup_django()
+
+    from django.contrib.auth import get_user_model
+
+    from core.archive import archive_user
+    from core.models import Recipe
+    from core.seeding import Seeder
+
+    with test_database():
+        user = get_user_model().objects.create_user(
+            'bench@example.com', 'benchpass123')
+        Recipe.objects.bulk_create([
+            Recipe(user=user, title=f'Recipe {i}', time_minutes=5, price=1)
+            for i in range(500)
+        ])
+
+        def page():
+            list(Recipe.objects.filter(user=user).order_by(
+                '-id').prefetch_related('tags', 'ingredients')[:PAGE])
+
+        print(f'{"hot recipes":>12} {"ms/page":>8}')
+        seeded = 0
+        for seed, total in enumerate(steps):
+            Seeder(
+                users=max(total // 50, 1), recipes=total - seeded,
+                tags=total // 10, ingridients=total // 5, seed=seed,
+            ).run()
+            seeded = total
+            print(f'{Recipe.objects.count():>12} {measure(page) * 1e3:>8.2f}')
+
+        others = get_user_model().objects.exclude(pk=user.pk).values_list(
+            'pk', flat=True)
+        for user_id in others.iterator():
+            for _ in archive_user(user_id):
+                pass
+        print(f'{Recipe.objects.count():>12} {measure(page) * 1e3:>8.2f}'
+              f'  (others archived)')
+
+
+if __name__ == '__main__':
+    main(tuple(int(arg) for arg in sys.argv[1:]) or STEPS)
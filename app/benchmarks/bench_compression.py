@@ -0,0 +1,57 @@
+"""
+Benchmark response compression of recipe list payloads.
+
+Reports bytes on the wire and CPU time per response for each encoder
+and level across a range of response sizes.
+"""
+import json
+import zlib
+
+from benchmarks import measure, recipe_payload
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+SIZES = (1, 10, 100, 1000, 5000)
+
+
+def gzip_encoder(level):
+    def encode(data):
+        compressor = zlib.compressobj(level, zlib.DEFLATED,
+                                      16 + zlib.MAX_WBITS)
+        return compressor.compress(data) + compressor.flush()
+    return encode
+
+
+def brotli_encoder(quality):
+    def encode(data):
+        return brotli.compress(data, quality=quality)
+    return encode
+
+
+def encoders():
+    yield 'identity', lambda data: data
+    for level in (1, 6, 9):
+        yield f'gzip-{level}', gzip_encoder(level)
+    if brotli is not None:
+        for quality in (1, 4, 11):
+            yield f'br-{quality}', brotli_encoder(quality)
+
+
+def main():
+    print(f'{"recipes":>8} {"encoding":>10} {"bytes":>10} '
+          f'{"ratio":>7} {"cpu us":>10}')
+    for size in SIZES:
+        data = json.dumps(recipe_payload(size)).encode()
+        for name, encode in encoders():
+            encoded = encode(data)
+            seconds = measure(lambda: encode(data))
+            print(f'{size:>8} {name:>10} {len(encoded):>10} '
+                  f'{len(encoded) / len(data):>7.3f} '
+                  f'{seconds * 1e6:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+"""
+Benchmark liveness and readiness probes through the WSGI handler and
+full middleware stack, compared with an ordinary API view.
+"""
+import io
+
+from benchmarks import measure, setup_django
+
+PATHS = ('/healthz', '/readyz', '/api/recipe/')
+
+
+def main():
+    setup_django()
+
+    from django.core.handlers.wsgi import WSGIHandler
+
+    handler = WSGIHandler()
+    statuses = {}
+
+    def request(path):
+        environ = {
+            'REQUEST_METHOD': 'GET',
+            'PATH_INFO': path,
+            'SERVER_NAME': 'localhost',
+            'SERVER_PORT': '80',
+            'HTTP_HOST': 'localhost',
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': io.BytesIO(),
+        }
+        response = handler(
+            environ, lambda status, headers: statuses.update({path: status}))
+        b''.join(response)
+        response.close()
+
+    print(f'{"path":>14} {"status":>16} {"us/request":>11}')
+    for path in PATHS:
+        seconds = measure(lambda: request(path))
+        print(f'{path:>14} {statuses[path]:>16} {seconds * 1e6:>11.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+Benchmark the stock middleware stack against the path-aware one.
+
+Times each session related middleware on its own for an API request
+that carries a session cookie, then runs full requests to the API root
+(which uses DRF's default session authentication) and counts queries.
+"""
+from benchmarks import measure, setup_django, test_database
+
+STOCK = {
+    'session': 'django.contrib.sessions.middleware.SessionMiddleware',
+    'csrf': 'django.middleware.csrf.CsrfViewMiddleware',
+    'auth': 'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'messages': 'django.contrib.messages.middleware.MessageMiddleware',
+}
+TRIMMED = {
+    'session': 'core.middleware.SessionMiddleware',
+    'csrf': 'core.middleware.CsrfViewMiddleware',
+    'auth': 'core.middleware.AuthenticationMiddleware',
+    'messages': 'core.middleware.MessageMiddleware',
+}
+API_PATH = '/api/recipe/'
+
+
+def time_middleware(request_factory):
+    """Return {name: (stock us, trimmed us)} for each middleware alone."""
+    from django.contrib.sessions.backends.db import SessionStore
+    from django.http import HttpResponse
+    from django.utils.module_loading import import_string
+
+    results = {}
+    for name in STOCK:
+        timings = []
+        for dotted_path in (STOCK[name], TRIMMED[name]):
+            def get_response(request):
+                return HttpResponse()
+
+            middleware = import_string(dotted_path)(get_response)
+
+            def run():
+                request = request_factory()
+                # Messages need the session set up by SessionMiddleware.
+                request.session = SessionStore()
+                if hasattr(middleware, 'process_view'):
+                    middleware.process_view(request, get_response, (), {})
+                middleware(request)
+
+            timings.append(measure(run) * 1e6)
+        results[name] = timings
+    return results
+
+
+def main():
+    setup_django()
+
+    from django.conf import settings
+    from django.contrib.auth import get_user_model
+    from django.db import connection, reset_queries
+    from django.test import Client, RequestFactory, override_settings
+    from django.test.utils import CaptureQueriesContext
+
+    with test_database():
+        user = get_user_model().objects.create_user(
+            'bench@example.com', 'benchpass123')
+        client = Client()
+        client.force_login(user)
+        cookie = client.cookies[settings.SESSION_COOKIE_NAME].value
+
+        factory = RequestFactory()
+
+        def api_request():
+            return factory.get(API_PATH, HTTP_COOKIE='%s=%s' % (
+                settings.SESSION_COOKIE_NAME, cookie))
+
+        print(f'{"middleware":>10} {"stock us":>10} {"trimmed us":>11} '
+              f'{"saved us":>9}')
+        for name, (stock, trimmed) in time_middleware(api_request).items():
+            print(f'{name:>10} {stock:>10.2f} {trimmed:>11.2f} '
+                  f'{stock - trimmed:>9.2f}')
+
+        stock_by_trimmed = {TRIMMED[name]: STOCK[name] for name in STOCK}
+        stock_stack = [stock_by_trimmed.get(path, path)
+                       for path in settings.MIDDLEWARE]
+        print(f'\n{"stack":>10} {"queries":>8} {"us/request":>11}')
+        for name, stack in (('stock', stock_stack),
+                            ('trimmed', settings.MIDDLEWARE)):
+            with override_settings(MIDDLEWARE=stack):
+                # A new client loads the middleware chain under test.
+                stack_client = Client(HTTP_ACCEPT='application/json')
+                stack_client.cookies = client.cookies
+                # request_started resets the query log, so start from empty.
+                reset_queries()
+                with CaptureQueriesContext(connection) as queries:
+                    stack_client.get(API_PATH)
+                seconds = measure(lambda: stack_client.get(API_PATH))
+            print(f'{name:>10} {len(queries):>8} {seconds * 1e6:>11.1f}')
+
+
+if __name__ == '__main__':
+    main()
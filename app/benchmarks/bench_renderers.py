@@ -0,0 +1,39 @@
+"""
+Benchmark the project JSON renderer and parser against DRF defaults
+on recipe list payloads.
+"""
+import io
+
+from benchmarks import measure, recipe_payload, setup_django
+
+SIZES = (1, 10, 100, 1000, 5000)
+
+
+def main():
+    setup_django()
+
+    from rest_framework import parsers, renderers
+    from rest_framework.utils.serializer_helpers import ReturnList
+
+    from core.parsers import JSONParser
+    from core.renderers import JSONRenderer
+
+    pairs = (
+        ('drf', renderers.JSONRenderer(), parsers.JSONParser()),
+        ('core', JSONRenderer(), JSONParser()),
+    )
+
+    print(f'{"recipes":>8} {"impl":>6} {"bytes":>10} '
+          f'{"render us":>11} {"parse us":>11}')
+    for size in SIZES:
+        data = ReturnList(recipe_payload(size), serializer=None)
+        for name, renderer, parser in pairs:
+            body = renderer.render(data)
+            render_time = measure(lambda: renderer.render(data))
+            parse_time = measure(lambda: parser.parse(io.BytesIO(body)))
+            print(f'{size:>8} {name:>6} {len(body):>10} '
+                  f'{render_time * 1e6:>11.1f} {parse_time * 1e6:>11.1f}')
+
+
+if __name__ == '__main__':
+    main()
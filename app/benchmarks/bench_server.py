@@ -0,0 +1,123 @@
+"""
+Benchmark the production server against the development server.
+
+Starts ``manage.py runserver`` and gunicorn (configured by
+gunicorn.conf.py) in turn and reports cold-start time, per-process
+memory and request throughput against a view that needs no database.
+Memory is read from /proc, so this only runs on Linux.
+"""
+import argparse
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+PATH = '/api/recipe/'
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_serving(url, timeout=60):
+    """Return seconds until url answers, polling every few milliseconds."""
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        try:
+            urllib.request.urlopen(url, timeout=1).read()
+            return time.perf_counter() - start
+        except OSError:
+            time.sleep(0.005)
+    raise RuntimeError(f'{url} did not come up within {timeout}s')
+
+
+def process_tree(pid):
+    """Return pid and the pids of all its descendants."""
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as stat:
+                ppid = int(stat.read().rsplit(')', 1)[1].split()[1])
+        except OSError:
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    tree, stack = [], [pid]
+    while stack:
+        current = stack.pop()
+        tree.append(current)
+        stack.extend(children.get(current, ()))
+    return tree
+
+
+def memory_kb(pid):
+    """Return (rss, pss, private) memory of a process in kB."""
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup') as smaps:
+        for line in smaps:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1])
+    private = fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0)
+    return fields.get('Rss', 0), fields.get('Pss', 0), private
+
+
+def throughput(url, requests, concurrency):
+    """Return requests per second for GETs of url."""
+    def fetch(_):
+        urllib.request.urlopen(url, timeout=10).read()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(fetch, range(requests)))
+    return requests / (time.perf_counter() - start)
+
+
+def run(name, command, port, env, args):
+    url = f'http://127.0.0.1:{port}{PATH}'
+    proc = subprocess.Popen(
+        command, env=env, stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL, start_new_session=True,
+    )
+    try:
+        cold_start = wait_until_serving(url)
+        rate = throughput(url, args.requests, args.concurrency)
+        print(f'\n{name}: cold start {cold_start * 1000:.0f} ms, '
+              f'{rate:.0f} req/s')
+        print(f'{"pid":>8} {"rss kB":>10} {"pss kB":>10} {"private kB":>11}')
+        for pid in process_tree(proc.pid):
+            rss, pss, private = memory_kb(pid)
+            print(f'{pid:>8} {rss:>10} {pss:>10} {private:>11}')
+    finally:
+        os.killpg(proc.pid, signal.SIGTERM)
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    args = parser.parse_args()
+
+    env = dict(os.environ, SERVER_ACCESS_LOG='', SERVER_WORKERS=str(
+        args.workers))
+
+    port = free_port()
+    run('runserver', [sys.executable, 'manage.py', 'runserver',
+                      '--noreload', f'127.0.0.1:{port}'], port, env, args)
+
+    port = free_port()
+    env['SERVER_BIND'] = f'127.0.0.1:{port}'
+    run('gunicorn', [sys.executable, '-m', 'gunicorn'], port, env, args)
+
+
+if __name__ == '__main__':
+    main()
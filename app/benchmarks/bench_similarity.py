@@ -0,0 +1,102 @@
+"""
+Benchmark similar recipe lookups for one user with a large library.
+
+Seeds one user with random recipes, builds the similarity index, then
+times similar_recipes against comparing the recipe with every other
+one, and reports how many of the exact top ten the index finds. The
+seeded rows live in a throwaway test database.
+"""
+import random
+import sys
+import time
+
+from benchmarks import measure, setup_django, test_database
+
+RECIPES = 50000
+TAGS = 200
+INGRIDIENTS = 1000
+LOOKUPS = 20
+
+
+def main(recipes=RECIPES):
+    setup_django()
+
+    from django.contrib.auth import get_user_model
+
+    from core.models import Ingridient, Recipe, Tag
+    from core.similarity import (
+        index_recipes,
+        jaccard,
+        recipe_features,
+        similar_recipes,
+    )
+
+    rng = random.Random(0)
+    with test_database():
+        user = get_user_model().objects.create_user(
+            'bench@example.com', 'benchpass123')
+        using = user.shard or 'default'
+        Tag.objects.bulk_create([
+            Tag(user=user, name=f'tag {i}') for i in range(TAGS)])
+        Ingridient.objects.bulk_create([
+            Ingridient(user=user, name=f'ingridient {i}')
+            for i in range(INGRIDIENTS)])
+        tags = list(Tag.objects.values_list('pk', flat=True))
+        ingridients = list(Ingridient.objects.values_list('pk', flat=True))
+        Recipe.objects.bulk_create([
+            Recipe(user=user, title=f'Recipe {i}', time_minutes=5, price=1)
+            for i in range(recipes)
+        ], batch_size=5000)
+        ids = list(Recipe.objects.filter(user=user).values_list(
+            'pk', flat=True))
+        # Group recipes into families sharing most of their ingridients.
+        families = [
+            rng.sample(ingridients, 10) for _ in range(recipes // 20)]
+        tag_links, ingridient_links = [], []
+        for recipe_id in ids:
+            family = rng.choice(families)
+            for tag_id in rng.sample(tags, 3):
+                tag_links.append(Recipe.tags.through(
+                    recipe_id=recipe_id, tag_id=tag_id))
+            for ingridient_id in set(rng.sample(family, 7)
+                                     + rng.sample(ingridients, 2)):
+                ingridient_links.append(Recipe.ingredients.through(
+                    recipe_id=recipe_id, ingridient_id=ingridient_id))
+        Recipe.tags.through.objects.bulk_create(tag_links, batch_size=5000)
+        Recipe.ingredients.through.objects.bulk_create(
+            ingridient_links, batch_size=5000)
+
+        start = time.perf_counter()
+        for offset in range(0, len(ids), 1000):
+            index_recipes(ids[offset:offset + 1000], using)
+        print(f'indexed {len(ids)} recipes in '
+              f'{time.perf_counter() - start:.1f}s')
+
+        def brute_force(recipe):
+            features = recipe_features(ids, using)
+            target = features[recipe.pk]
+            scores = [
+                (recipe_id, jaccard(target, other))
+                for recipe_id, other in features.items()
+                if recipe_id != recipe.pk
+            ]
+            scores.sort(key=lambda score: (-score[1], -score[0]))
+            return scores[:10]
+
+        samples = list(Recipe.objects.filter(
+            pk__in=rng.sample(ids, LOOKUPS)))
+        found = expected = 0
+        for recipe in samples:
+            exact = {pk for pk, _ in brute_force(recipe)}
+            found += len(exact & {pk for pk, _ in similar_recipes(recipe)})
+            expected += len(exact)
+
+        indexed = measure(lambda: [similar_recipes(r) for r in samples])
+        naive = measure(lambda: brute_force(samples[0]), number=1, repeat=3)
+        print(f'{"indexed":>10} {indexed / LOOKUPS * 1e3:>8.2f} ms/lookup')
+        print(f'{"naive":>10} {naive * 1e3:>8.2f} ms/lookup')
+        print(f'{"recall@10":>10} {found / expected:>8.2%}')
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
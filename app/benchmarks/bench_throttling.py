@@ -0,0 +1,113 @@
+"""
+Benchmark the cost of one throttle check against the default cache,
+compared with DRF's history list throttle.
+
+Each cache call is counted, and --latency adds that many milliseconds
+to every call to stand in for a networked cache. To measure a real one,
+point CACHE_BACKEND and CACHE_LOCATION at it, e.g. memcached with
+django.core.cache.backends.memcached.PyMemcacheCache.
+"""
+import argparse
+import time
+from types import SimpleNamespace
+
+from benchmarks import measure, setup_django
+
+
+class CountingCache:
+    """Cache proxy counting calls and adding a fixed latency to each."""
+
+    def __init__(self, cache, latency):
+        self.cache = cache
+        self.latency = latency
+        self.calls = 0
+
+    def __getattr__(self, name):
+        method = getattr(self.cache, name)
+        if not callable(method):
+            return method
+
+        def call(*args, **kwargs):
+            self.calls += 1
+            if self.latency:
+                time.sleep(self.latency)
+            return method(*args, **kwargs)
+        return call
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--latency', type=float, default=0,
+        help='Milliseconds added to every cache call.',
+    )
+    args = parser.parse_args()
+    setup_django()
+
+    from django.core.cache import cache
+    from rest_framework.throttling import UserRateThrottle
+
+    from core.throttling import (
+        ExpensiveThrottle,
+        SlidingWindowThrottle,
+        TokenThrottle,
+        UserThrottle,
+    )
+    from core.models import AuthToken
+
+    user = SimpleNamespace(pk=1, is_authenticated=True)
+    token = AuthToken(key='0' * 40)
+
+    def new_request():
+        # Throttles note their counts on the request, so use a new one
+        # per check as the server would.
+        return SimpleNamespace(user=user, auth=token, META={})
+
+    view = SimpleNamespace(action='list', expensive_actions=('list',))
+    counting = CountingCache(cache, args.latency / 1000)
+
+    class Unlimited:
+        rate = '1000000/min'
+        cache = counting
+
+    class DRFUserThrottle(Unlimited, UserRateThrottle):
+        pass
+
+    user_throttle = type('User', (Unlimited, UserThrottle), {})
+    token_throttle = type('Token', (Unlimited, TokenThrottle), {})
+    expensive_throttle = type('Expensive', (Unlimited, ExpensiveThrottle), {})
+
+    def stacked():
+        # The three throttles every expensive request goes through.
+        request = new_request()
+        for throttle_class in (
+                user_throttle, token_throttle, expensive_throttle):
+            throttle_class().allow_request(request, view)
+
+    checks = (
+        ('drf user',
+         lambda: DRFUserThrottle().allow_request(new_request(), view)),
+        ('user', lambda: user_throttle().allow_request(new_request(), view)),
+        ('token',
+         lambda: token_throttle().allow_request(new_request(), view)),
+        ('expensive',
+         lambda: expensive_throttle().allow_request(new_request(), view)),
+        ('stacked', stacked),
+    )
+
+    number = 200 if args.latency else 2000
+    print(f'cache: {cache.__class__.__name__}, '
+          f'added latency: {args.latency} ms')
+    print(f'{"throttle":>10} {"us/check":>9} {"calls/check":>12}')
+    for name, check in checks:
+        cache.clear()
+        SlidingWindowThrottle.finished_counts.clear()
+        check()
+        counting.calls = 0
+        seconds = measure(check, number=number)
+        calls = counting.calls / (number * 5)
+        print(f'{name:>10} {seconds * 1e6:>9.1f} {calls:>12.1f}')
+
+
+if __name__ == '__main__':
+    main()
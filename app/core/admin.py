@@ -2,11 +2,140 @@
 Django admin configuration for core app
 """
 
+from django import forms
 from django.contrib import admin
+from django.contrib.admin.widgets import AutocompleteSelect
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
 from django.utils.translation import gettext as _
 
 from core import models
+from core.deletion import schedule_deletion
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that uses the planner's row estimate for unfiltered lists.
+
+    An exact COUNT(*) scans the whole table on PostgreSQL. For tables
+    with more than ESTIMATE_THRESHOLD rows the estimate from
+    pg_class.reltuples is used instead; filtered lists stay exact.
+    """
+
+    ESTIMATE_THRESHOLD = 100000
+
+    @cached_property
+    def count(self):
+        """Return the estimated or exact number of objects."""
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = self.estimated_count(queryset)
+            if estimate is not None and estimate > self.ESTIMATE_THRESHOLD:
+                return estimate
+        return super().count
+
+    @staticmethod
+    def estimated_count(queryset):
+        """Return the planner's row estimate for the queryset's table."""
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class '
+                'WHERE oid = %s::regclass',
+                [connection.ops.quote_name(queryset.model._meta.db_table)],
+            )
+            row = cursor.fetchone()
+        return row[0] if row else None
+
+
+class AutocompleteFilter(admin.ListFilter):
+    """
+    List filter that picks a related object with an autocomplete widget
+    instead of listing every choice on the page.
+    """
+
+    template = 'admin/core/autocomplete_filter.html'
+    field_name = None
+
+    def __init__(self, request, params, model, model_admin):
+        self.field = model._meta.get_field(self.field_name)
+        self.title = self.field.verbose_name
+        super().__init__(request, params, model, model_admin)
+        self.parameter_name = '%s__%s__exact' % (
+            self.field_name, self.field.target_field.name)
+        self.value = params.pop(self.parameter_name, None)
+        self.form_field = forms.ModelChoiceField(
+            queryset=self.field.remote_field.model._default_manager.all(),
+            widget=AutocompleteSelect(self.field, model_admin.admin_site),
+            required=False,
+        )
+
+    @classmethod
+    def widget_media(cls, model, admin_site):
+        """Return the media the autocomplete widget needs."""
+        field = model._meta.get_field(cls.field_name)
+        return AutocompleteSelect(field, admin_site).media
+
+    def has_output(self):
+        return True
+
+    def expected_parameters(self):
+        return [self.parameter_name]
+
+    def queryset(self, request, queryset):
+        if self.value:
+            return queryset.filter(**{self.field.attname: self.value})
+        return queryset
+
+    def choices(self, changelist):
+        base_url = changelist.get_query_string(remove=[self.parameter_name])
+        self.widget_html = self.form_field.widget.render(
+            self.parameter_name,
+            self.value,
+            attrs={
+                'id': 'filter_%s' % self.parameter_name,
+                'class': 'autocomplete-filter',
+                'data-filter-url': base_url,
+                'data-filter-param': self.parameter_name,
+            },
+        )
+        yield {
+            'selected': self.value is None,
+            'query_string': base_url,
+            'display': _('All'),
+        }
+
+
+class UserAutocompleteFilter(AutocompleteFilter):
+    """Filter by owner using an autocomplete widget."""
+
+    field_name = 'user'
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Base admin for per-user tables that grow large: joins the owner in
+    the changelist query, picks users by autocomplete and estimates
+    unfiltered counts.
+    """
+
+    list_select_related = ['user']
+    autocomplete_fields = ['user']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    @property
+    def media(self):
+        media = super().media
+        for list_filter in self.list_filter:
+            if (isinstance(list_filter, type) and
+                    issubclass(list_filter, AutocompleteFilter)):
+                media += list_filter.widget_media(self.model, self.admin_site)
+        return media
 
 
 class UserAdmin(BaseUserAdmin):
@@ -15,6 +144,7 @@ class UserAdmin(BaseUserAdmin):
     """
     ordering = ['id']
     list_display = ['email', 'name']
+    search_fields = ['email', 'name']
     fieldsets = (
         (None, {'fields': ('email', 'password')}),
         (
@@ -25,9 +155,13 @@ class UserAdmin(BaseUserAdmin):
                 'is_superuser'
             )}
         ),
-        (_('Important dates'), {'fields': ('last_login',)}),
+        (_('Important dates'), {'fields': (
+            'date_joined',
+            'last_login',
+            'recipes_archived_at',
+        )}),
     )
-    readonly_fields = ('last_login',)
+    readonly_fields = ('date_joined', 'last_login', 'recipes_archived_at')
     add_fieldsets = (
         (None, {
             'classes': ('wide',),
@@ -44,18 +178,39 @@ class UserAdmin(BaseUserAdmin):
         ),
     )
 
+    def get_deleted_objects(self, objs, request):
+        """
+        List only the users: collecting their data on the default
+        database would miss the rows on other shards.
+        """
+        perms_needed = set()
+        if not self.has_delete_permission(request):
+            perms_needed.add(self.opts.verbose_name)
+        users = [str(obj) for obj in objs]
+        return users, {self.opts.verbose_name_plural: len(users)}, \
+            perms_needed, []
+
+    def delete_model(self, request, obj):
+        """Delete the user and their data on every shard in batches."""
+        schedule_deletion(obj)
+
+    def delete_queryset(self, request, queryset):
+        """Delete each selected user like delete_model."""
+        for user in queryset:
+            schedule_deletion(user)
+
 
-class RecipeAdmin(admin.ModelAdmin):
+class RecipeAdmin(LargeTableAdmin):
     """
     Defines the admin pages for recipes
     """
     ordering = ['id']
     list_display = ['title', 'user', 'time_minutes', 'price']
-    list_filter = ['user', 'time_minutes', 'price']
+    list_filter = [UserAutocompleteFilter, 'time_minutes', 'price']
     search_fields = ['title', 'description']
 
 
-class TagAdmin(admin.ModelAdmin):
+class TagAdmin(LargeTableAdmin):
     """
     Defines the admin pages for tags
     """
@@ -64,7 +219,7 @@ class TagAdmin(admin.ModelAdmin):
     search_fields = ['name']
 
 
-class IngridientAdmin(admin.ModelAdmin):
+class IngridientAdmin(LargeTableAdmin):
     """
     Defines the admin pages for ingredients
     """
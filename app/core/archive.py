@@ -0,0 +1,200 @@
+"""
+Cold archive for the recipes of inactive users
+
+Every recipe query is scoped to one user, but the recipe table and its
+through tables grow with everyone's data. Recipes of users who haven't
+been seen for RECIPE_ARCHIVE_AFTER are moved, chunk by chunk, into
+ArchivedRecipe rows that hold the recipe columns and its tag and
+ingridient ids. The user's recipes_archived_at is set while they are
+archived, and authentication restores them on the next request, so
+clients never see the difference.
+"""
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from core.models import (
+    ArchivedRecipe,
+    Ingridient,
+    Recipe,
+    RecipeBand,
+    Tag,
+    User,
+)
+from core.rollup import rebuild_totals
+from core.sharding import db_for_user, shard_map
+from core.similarity import index_recipes
+
+
+def recipe_columns():
+    """Return the attnames of Recipe's own columns, without id."""
+    return [
+        field.attname for field in Recipe._meta.concrete_fields
+        if not field.primary_key
+    ]
+
+
+def inactive_users(now=None):
+    """
+    Return users who joined more than RECIPE_ARCHIVE_AFTER ago, haven't
+    logged in or used a token since and aren't archived yet.
+    """
+    now = now or timezone.now()
+    cutoff = now - settings.RECIPE_ARCHIVE_AFTER
+    # Users without a join date yet are treated as new, never as old.
+    return User.objects.filter(
+        recipes_archived_at__isnull=True,
+        date_joined__lt=cutoff,
+    ).exclude(
+        last_login__gte=cutoff,
+    ).exclude(
+        auth_tokens__last_used__gte=cutoff,
+    )
+
+
+def _lock_archived(user_id):
+    """Lock the user row and return recipes_archived_at."""
+    return User.objects.select_for_update().filter(pk=user_id).values_list(
+        'recipes_archived_at', flat=True).first()
+
+
+def _linked_ids(through, db, column, recipe_ids):
+    linked = defaultdict(list)
+    for recipe_id, linked_id in through.objects.using(db).filter(
+        recipe_id__in=recipe_ids,
+    ).order_by('pk').values_list('recipe_id', column):
+        linked[recipe_id].append(linked_id)
+    return linked
+
+
+def archive_user(user_id, batch_size=None, pause=0):
+    """
+    Move a user's recipes into the archive batch_size at a time.
+
+    The user is marked archived first, so a request arriving halfway
+    restores what has been moved so far; the next chunk then sees the
+    mark renewed or cleared by restore_user and stops. Yields the
+    number of recipes moved per chunk.
+    """
+    batch_size = batch_size or settings.RECIPE_ARCHIVE_BATCH_SIZE
+    db = shard_map.shard_for_id(user_id)
+    recipes = Recipe.objects.using(db)
+    if not recipes.filter(user_id=user_id).exists():
+        return
+    User.objects.filter(pk=user_id, recipes_archived_at__isnull=True).update(
+        recipes_archived_at=timezone.now())
+    marked = User.objects.filter(pk=user_id).values_list(
+        'recipes_archived_at', flat=True).first()
+    columns = recipe_columns()
+    tag_through = Recipe.tags.through
+    ingridient_through = Recipe.ingredients.through
+    while True:
+        with transaction.atomic(using=settings.GLOBAL_DATABASE), \
+                transaction.atomic(using=db):
+            if marked is None or _lock_archived(user_id) != marked:
+                return
+            rows = list(recipes.filter(user_id=user_id).order_by(
+                'pk').values('pk', *columns)[:batch_size])
+            if not rows:
+                return
+            ids = [row.pop('pk') for row in rows]
+            tags = _linked_ids(tag_through, db, 'tag_id', ids)
+            ingridients = _linked_ids(
+                ingridient_through, db, 'ingridient_id', ids)
+            ArchivedRecipe.objects.using(db).bulk_create([
+                ArchivedRecipe(
+                    user_id=user_id,
+                    recipe_id=recipe_id,
+                    data=row,
+                    tag_ids=tags[recipe_id],
+                    ingridient_ids=ingridients[recipe_id],
+                )
+                for recipe_id, row in zip(ids, rows)
+            ])
+            # Raw deletes skip the tombstone signals: the recipes
+            # aren't gone for sync clients, they are only moved.
+            for model in (tag_through, ingridient_through, RecipeBand):
+                model.objects.using(db).filter(
+                    recipe_id__in=ids)._raw_delete(db)
+            recipes.filter(pk__in=ids)._raw_delete(db)
+        yield len(ids)
+        if pause:
+            time.sleep(pause)
+
+
+def _restore_links(archived, db, model, through, column, attr):
+    linked = {
+        linked_id for row in archived for linked_id in getattr(row, attr)}
+    existing = set(model.objects.using(db).filter(
+        pk__in=linked).values_list('pk', flat=True))
+    through.objects.using(db).bulk_create([
+        through(recipe_id=row.recipe_id, **{column: linked_id})
+        for row in archived
+        for linked_id in getattr(row, attr)
+        if linked_id in existing
+    ], batch_size=settings.RECIPE_ARCHIVE_BATCH_SIZE)
+
+
+def restore_batches(user, batch_size=None):
+    """
+    Move a user's archived recipes back batch_size at a time.
+
+    Each batch is its own transaction under the lock of the user row,
+    so no transaction spans a large archive and concurrent requests of
+    the user share the work. Every batch renews recipes_archived_at,
+    which stops an archive_user running at the same time; the last one
+    clears it. Yields the number of recipes restored per batch.
+    """
+    batch_size = batch_size or settings.RECIPE_ARCHIVE_BATCH_SIZE
+    db = db_for_user(user)
+    columns = set(recipe_columns())
+    users = User.objects.filter(pk=user.pk)
+    while True:
+        with transaction.atomic(using=settings.GLOBAL_DATABASE), \
+                transaction.atomic(using=db):
+            if _lock_archived(user.pk) is None:
+                return
+            archived = list(ArchivedRecipe.objects.using(db).filter(
+                user_id=user.pk).order_by('recipe_id')[:batch_size])
+            Recipe.objects.using(db).bulk_create([
+                Recipe(pk=row.recipe_id, **{
+                    column: value for column, value in row.data.items()
+                    if column in columns
+                })
+                for row in archived
+            ])
+            _restore_links(
+                archived, db, Tag, Recipe.tags.through, 'tag_id',
+                'tag_ids')
+            _restore_links(
+                archived, db, Ingridient, Recipe.ingredients.through,
+                'ingridient_id', 'ingridient_ids')
+            # Ingridients may have changed or gone while archived.
+            rebuild_totals(Recipe.objects.using(db).filter(
+                pk__in=[row.recipe_id for row in archived]))
+            index_recipes([row.recipe_id for row in archived], db)
+            ArchivedRecipe.objects.using(db).filter(
+                pk__in=[row.pk for row in archived])._raw_delete(db)
+            done = len(archived) < batch_size
+            users.update(recipes_archived_at=None if done else timezone.now())
+        if archived:
+            yield len(archived)
+        if done:
+            return
+
+
+def restore_user(user, batch_size=None):
+    """
+    Move all of a user's archived recipes back, in batches.
+
+    Recipes keep their ids. Links to tags or ingridients deleted in the
+    meantime are dropped and totals are recomputed from the ingridients
+    as they are now. Restored recipes count as updated for delta
+    sync. Returns the number of recipes restored.
+    """
+    restored = sum(restore_batches(user, batch_size))
+    user.recipes_archived_at = None
+    return restored
@@ -0,0 +1,37 @@
+"""
+Authentication backends for the API
+"""
+
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+from core.archive import restore_user
+from core.models import AuthToken
+
+
+class ExpiringTokenAuthentication(TokenAuthentication):
+    """Token authentication that rejects expired tokens."""
+
+    model = AuthToken
+
+    def authenticate_credentials(self, key):
+        """Return user and token for a valid, unexpired key."""
+        try:
+            token = self.model.objects.select_related('user').get(key=key)
+        except self.model.DoesNotExist:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.'))
+
+        now = timezone.now()
+        if token.is_expired(now):
+            raise exceptions.AuthenticationFailed(_('Token has expired.'))
+        token.touch(now)
+        if token.user.recipes_archived_at is not None:
+            restore_user(token.user)
+
+        return (token.user, token)
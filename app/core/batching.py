@@ -0,0 +1,29 @@
+"""
+Helpers for processing large tables in bounded chunks
+"""
+import time
+
+
+def delete_in_batches(queryset, batch_size=1000, pause=0, raw=False):
+    """
+    Delete rows matched by queryset in primary key chunks.
+
+    Each chunk is a separate short statement, so locks are held only
+    for one chunk at a time. Yields the number of rows deleted per chunk.
+    With raw, chunks are deleted with a plain DELETE that skips signals
+    and cascades; callers must have removed referencing rows already.
+    """
+    model = queryset.model
+    pks_queryset = queryset.order_by().values_list('pk', flat=True)
+    while True:
+        pks = list(pks_queryset[:batch_size])
+        if not pks:
+            return
+        chunk = model._base_manager.using(queryset.db).filter(pk__in=pks)
+        if raw:
+            deleted = chunk._raw_delete(queryset.db)
+        else:
+            deleted, _ = chunk.delete()
+        yield deleted
+        if pause:
+            time.sleep(pause)
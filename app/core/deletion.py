@@ -0,0 +1,171 @@
+"""
+Account deletion in bounded chunks
+"""
+import logging
+import threading
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+from core.batching import delete_in_batches
+from core.models import (
+    ArchivedRecipe,
+    AuthToken,
+    DeletionJob,
+    IdempotencyKey,
+    Ingridient,
+    Recipe,
+    RecipeBand,
+    Tag,
+    Tombstone,
+    User,
+)
+from core.sharding import shard_map
+
+logger = logging.getLogger(__name__)
+
+
+def deletion_steps(user_id):
+    """
+    Return (label, queryset) pairs in the order they must be deleted.
+
+    Rows are removed before anything that references them, so every
+    chunk can be deleted with a raw DELETE without cascading. Recipe
+    data is deleted on the user's shard.
+    """
+    db = shard_map.shard_for_id(user_id)
+    recipe_tags = Recipe.tags.through.objects.using(db)
+    recipe_ingredients = Recipe.ingredients.through.objects.using(db)
+    return [
+        ('recipe tags', recipe_tags.filter(recipe__user_id=user_id)),
+        ('recipe tags', recipe_tags.filter(tag__user_id=user_id)),
+        ('recipe ingredients',
+         recipe_ingredients.filter(recipe__user_id=user_id)),
+        ('recipe ingredients',
+         recipe_ingredients.filter(ingridient__user_id=user_id)),
+        ('recipe bands',
+         RecipeBand.objects.using(db).filter(user_id=user_id)),
+        ('recipes', Recipe.objects.using(db).filter(user_id=user_id)),
+        ('archived recipes',
+         ArchivedRecipe.objects.using(db).filter(user_id=user_id)),
+        ('tags', Tag.objects.using(db).filter(user_id=user_id)),
+        ('ingredients', Ingridient.objects.using(db).filter(user_id=user_id)),
+        ('tokens', AuthToken.objects.filter(user_id=user_id)),
+        ('idempotency keys',
+         IdempotencyKey.objects.filter(user_id=user_id)),
+        ('tombstones',
+         Tombstone.objects.using(db).filter(user_id=user_id)),
+    ]
+
+
+def get_job(user_id):
+    """Return the deletion job of a user, if any."""
+    return DeletionJob.objects.filter(user_id=user_id).first()
+
+
+def set_progress(user_id, status, deleted):
+    DeletionJob.objects.update_or_create(user_id=user_id, defaults={
+        'status': status,
+        'deleted': dict(deleted),
+        'updated_at': timezone.now(),
+    })
+
+
+def claim(job):
+    """Mark job running, False if another worker claimed it first."""
+    return DeletionJob.objects.filter(
+        pk=job.pk, status=job.status, updated_at=job.updated_at,
+    ).update(status=DeletionJob.RUNNING, updated_at=timezone.now()) == 1
+
+
+def stale_jobs(failed=False):
+    """
+    Return the jobs no worker has reported on for
+    ACCOUNT_DELETION_STALE_AFTER, e.g. because it was restarted.
+    """
+    statuses = [DeletionJob.PENDING, DeletionJob.RUNNING]
+    if failed:
+        statuses.append(DeletionJob.FAILED)
+    cutoff = timezone.now() - settings.ACCOUNT_DELETION_STALE_AFTER
+    return DeletionJob.objects.filter(
+        status__in=statuses, updated_at__lt=cutoff,
+    ).order_by('updated_at')
+
+
+def deactivate_user(user):
+    """Lock the account out right away and revoke its tokens."""
+    user.is_active = False
+    user.save(update_fields=['is_active'])
+    AuthToken.objects.filter(user=user).delete()
+
+
+def delete_user(user_id, batch_size=None, pause=0):
+    """
+    Delete a user and everything they own in chunks of batch_size rows.
+
+    Yields the progress dict after every chunk. The user row itself is
+    deleted last through the ORM, once only small relations remain.
+    """
+    batch_size = batch_size or settings.ACCOUNT_DELETION_BATCH_SIZE
+    deleted = {}
+    set_progress(user_id, DeletionJob.RUNNING, deleted)
+    try:
+        for label, queryset in deletion_steps(user_id):
+            deleted.setdefault(label, 0)
+            for count in delete_in_batches(
+                queryset, batch_size=batch_size, pause=pause, raw=True,
+            ):
+                deleted[label] += count
+                set_progress(user_id, DeletionJob.RUNNING, deleted)
+                yield deleted
+
+        with transaction.atomic():
+            deleted['users'], _ = User.objects.filter(pk=user_id).delete()
+    except Exception:
+        set_progress(user_id, DeletionJob.FAILED, deleted)
+        raise
+    set_progress(user_id, DeletionJob.DONE, deleted)
+    yield deleted
+
+
+def run_deletion(job):
+    """Run a deletion to completion, logging rather than raising."""
+    try:
+        if not claim(job):
+            return
+        for deleted in delete_user(job.user_id):
+            pass
+        logger.info('Deleted user %s: %s', job.user_id, deleted)
+    except Exception:
+        logger.exception('Deleting user %s failed', job.user_id)
+    finally:
+        connections.close_all()
+
+
+def schedule_deletion(user):
+    """
+    Deactivate user and return the job deleting their data once the
+    transaction commits.
+
+    With ACCOUNT_DELETION_ASYNC the deletion runs in a background
+    thread, otherwise it runs before returning. The job is saved first,
+    so resume_deletions finishes it if the thread dies with its worker.
+    """
+    deactivate_user(user)
+    job, _ = DeletionJob.objects.update_or_create(user_id=user.pk, defaults={
+        'status': DeletionJob.PENDING,
+        'deleted': {},
+        'updated_at': timezone.now(),
+    })
+    if not settings.ACCOUNT_DELETION_ASYNC:
+        for _ in delete_user(user.pk):
+            pass
+        job.refresh_from_db()
+        return job
+    thread = threading.Thread(
+        target=run_deletion, args=(job,),
+        name=f'delete-user-{user.pk}',
+    )
+    transaction.on_commit(thread.start)
+    return job
@@ -0,0 +1,175 @@
+"""
+Live change events for recipes, tags and ingridients
+
+Writes publish a small event once their transaction commits, with
+NOTIFY on CHANGE_EVENTS_CHANNEL of the global database. Each server
+process holds one LISTEN connection, opened while it has subscribers,
+and fans events out to the streams of their user (see core.streams).
+
+Subscribers get a bounded queue. One that falls behind loses its
+backlog for a single resync event, telling the client to catch up
+through delta sync, so a stalled connection never holds more than
+CHANGE_EVENTS_QUEUE_SIZE events. Backends without NOTIFY deliver
+events to the subscribers of the publishing process only.
+"""
+import asyncio
+import json
+import logging
+from collections import defaultdict
+from functools import partial
+
+from django.conf import settings
+from django.db import connections, transaction
+
+logger = logging.getLogger(__name__)
+
+RESYNC = {'kind': 'resync'}
+# Seconds between attempts to reopen a lost listener connection.
+RECONNECT_DELAY = 5
+
+
+def publish(user_id, kind, action, object_id, using=None):
+    """Send a change event to the user's streams once using commits."""
+    payload = json.dumps({
+        'user': user_id,
+        'kind': kind,
+        'action': action,
+        'id': object_id,
+    }, separators=(',', ':'))
+    transaction.on_commit(partial(notify, payload), using=using)
+
+
+def notify(payload):
+    connection = connections[settings.GLOBAL_DATABASE]
+    if connection.vendor != 'postgresql':
+        broker.deliver(payload)
+        return
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)',
+                           [settings.CHANGE_EVENTS_CHANNEL, payload])
+    except Exception:
+        # The write is committed already; a lost event only delays
+        # clients until their next sync.
+        logger.exception('Could not publish change event %s', payload)
+
+
+class Subscription:
+    """Events waiting to be streamed to one client."""
+
+    def __init__(self, user_id, size):
+        self.user_id = user_id
+        self.queue = asyncio.Queue(maxsize=size)
+
+    def put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class ChangeBroker:
+    """Fan change events out to the subscriptions of this process."""
+
+    def __init__(self):
+        self.subscriptions = defaultdict(set)
+        self.loop = None
+        self.listener = None
+
+    def subscribe(self, user_id):
+        """Return a new subscription to user_id's events."""
+        self.loop = asyncio.get_running_loop()
+        subscription = Subscription(
+            user_id, settings.CHANGE_EVENTS_QUEUE_SIZE)
+        self.subscriptions[user_id].add(subscription)
+        if self.listener is None and connections[
+                settings.GLOBAL_DATABASE].vendor == 'postgresql':
+            self.listener = self.loop.create_task(self.listen())
+        return subscription
+
+    def unsubscribe(self, subscription):
+        subscriptions = self.subscriptions.get(subscription.user_id, set())
+        subscriptions.discard(subscription)
+        if not subscriptions:
+            self.subscriptions.pop(subscription.user_id, None)
+        if not self.subscriptions and self.listener is not None:
+            self.listener.cancel()
+            self.listener = None
+
+    def dispatch(self, payload):
+        """Queue an event payload for its user's subscriptions."""
+        try:
+            event = json.loads(payload)
+            user_id = event.pop('user')
+        except (ValueError, TypeError, KeyError):
+            logger.warning('Ignoring malformed change event %r', payload)
+            return
+        for subscription in list(self.subscriptions.get(user_id, ())):
+            subscription.put(event)
+
+    def broadcast(self, event):
+        for subscriptions in list(self.subscriptions.values()):
+            for subscription in list(subscriptions):
+                subscription.put(event)
+
+    def deliver(self, payload):
+        """Call dispatch from any thread, if anything is subscribed."""
+        loop = self.loop
+        if loop is None or loop.is_closed() or not self.subscriptions:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self.dispatch(payload)
+        else:
+            loop.call_soon_threadsafe(self.dispatch, payload)
+
+    def connect(self):
+        """Open a connection listening on CHANGE_EVENTS_CHANNEL."""
+        wrapper = connections[settings.GLOBAL_DATABASE]
+        connection = wrapper.get_new_connection(
+            wrapper.get_connection_params())
+        connection.autocommit = True
+        channel = wrapper.ops.quote_name(settings.CHANGE_EVENTS_CHANNEL)
+        with connection.cursor() as cursor:
+            cursor.execute(f'LISTEN {channel}')
+        return connection
+
+    async def listen(self):
+        """Dispatch notifications until cancelled, reconnecting on errors."""
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                connection = await loop.run_in_executor(None, self.connect)
+            except Exception:
+                logger.exception('Could not listen for change events')
+                await asyncio.sleep(RECONNECT_DELAY)
+                continue
+            readable = asyncio.Event()
+            fileno = connection.fileno()
+            loop.add_reader(fileno, readable.set)
+            try:
+                while True:
+                    await readable.wait()
+                    readable.clear()
+                    connection.poll()
+                    while connection.notifies:
+                        self.dispatch(connection.notifies.pop(0).payload)
+            except Exception:
+                logger.exception('Lost the change event listener')
+            finally:
+                loop.remove_reader(fileno)
+                connection.close()
+            # Events sent while reconnecting are lost.
+            self.broadcast(RESYNC)
+            await asyncio.sleep(RECONNECT_DELAY)
+
+
+broker = ChangeBroker()
@@ -0,0 +1,83 @@
+"""
+Health checks for load balancer probes
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+CACHE_KEY = 'health:readiness'
+
+
+def check_database(alias=DEFAULT_DB_ALIAS):
+    """Run a trivial query on the (persistent) database connection."""
+    with connections[alias].cursor() as cursor:
+        cursor.execute('SELECT 1')
+        cursor.fetchone()
+
+
+def check_cache():
+    """Round-trip a value through the default cache."""
+    value = str(time.monotonic())
+    cache.set(CACHE_KEY, value, timeout=10)
+    if cache.get(CACHE_KEY) != value:
+        raise RuntimeError('cache did not return the stored value')
+
+
+CHECKS = {
+    'database': check_database,
+    'cache': check_cache,
+}
+
+
+class Readiness:
+    """
+    Run readiness checks at most once per HEALTH_CHECK_CACHE_SECONDS.
+
+    Concurrent probes arriving while a check runs get the previous
+    result instead of piling more load onto the database.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._result = None
+        self._expires = 0.0
+
+    def get(self):
+        """Return (ready, {check name: status})."""
+        now = time.monotonic()
+        if self._result is not None and now < self._expires:
+            return self._result
+        if not self._lock.acquire(blocking=self._result is None):
+            return self._result
+        try:
+            if self._result is None or time.monotonic() >= self._expires:
+                self._result = self.run_checks()
+                self._expires = (time.monotonic() +
+                                 settings.HEALTH_CHECK_CACHE_SECONDS)
+            return self._result
+        finally:
+            self._lock.release()
+
+    def reset(self):
+        """Forget the cached result."""
+        self._result = None
+        self._expires = 0.0
+
+    @staticmethod
+    def run_checks():
+        statuses = {}
+        for name, check in CHECKS.items():
+            try:
+                check()
+            except Exception as exc:
+                statuses[name] = f'error: {exc.__class__.__name__}'
+            else:
+                statuses[name] = 'ok'
+        ready = all(status == 'ok' for status in statuses.values())
+        return ready, statuses
+
+
+readiness = Readiness()
@@ -0,0 +1,123 @@
+"""
+Idempotency-Key support for API write endpoints
+"""
+import functools
+import hashlib
+
+from django.db import IntegrityError, transaction
+from django.http.request import RawPostDataException
+from rest_framework import status
+from rest_framework.response import Response
+
+from core.models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = IdempotencyKey._meta.get_field('key').max_length
+
+
+def request_fingerprint(request):
+    """Return a digest identifying the method, path and body of request."""
+    digest = hashlib.sha256()
+    digest.update(request.method.encode())
+    digest.update(request.get_full_path().encode())
+    try:
+        digest.update(request.body)
+    except RawPostDataException:
+        digest.update(repr(sorted(request.data.items())).encode())
+    return digest.hexdigest()
+
+
+def claim_key(user, key, fingerprint):
+    """
+    Return the record stored for key, inserting one if there is none.
+
+    Returns (record, created). Lookups come first so replays cost one
+    query. The insert commits straight away and the unique constraint
+    decides between concurrent duplicates, so the loser sees the
+    winner's record while the first request runs. record is None if
+    the key kept changing hands under us.
+    """
+    keys = IdempotencyKey.objects.filter(user=user, key=key)
+    for _ in range(2):
+        record = keys.first()
+        if record is not None:
+            if not record.is_expired():
+                return record, False
+            # Delete only the stale record we read, not a newer claim.
+            keys.filter(pk=record.pk, created=record.created).delete()
+        try:
+            with transaction.atomic():
+                return IdempotencyKey.objects.create(
+                    user=user, key=key, fingerprint=fingerprint), True
+        except IntegrityError:
+            continue
+    return None, False
+
+
+def error(detail, status_code):
+    return Response({'detail': detail}, status=status_code)
+
+
+def idempotent(view_method):
+    """
+    Make a view method replay its response for a repeated Idempotency-Key.
+
+    The first request with a key runs normally and its response is
+    stored for the user, headers included. Retries get the stored
+    response back without running the view. Error responses are not
+    stored, so the key can be used again after one. A retry while the
+    first request is still running gets 409, and reusing a key for a
+    different request gets 422. Requests without the header are not
+    affected.
+    """
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return view_method(self, request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return error(
+                f'{HEADER} must be at most {MAX_KEY_LENGTH} characters.',
+                status.HTTP_400_BAD_REQUEST,
+            )
+
+        fingerprint = request_fingerprint(request)
+        record, created = claim_key(request.user, key, fingerprint)
+        if not created:
+            if record is None or record.in_progress:
+                return error(
+                    f'A request with this {HEADER} is in progress.',
+                    status.HTTP_409_CONFLICT,
+                )
+            if record.fingerprint != fingerprint:
+                return error(
+                    f'{HEADER} was already used for a different request.',
+                    status.HTTP_422_UNPROCESSABLE_ENTITY,
+                )
+            return Response(record.response, status=record.status_code,
+                            headers={**(record.headers or {}),
+                                     REPLAYED_HEADER: 'true'})
+
+        try:
+            response = view_method(self, request, *args, **kwargs)
+        except Exception:
+            record.delete()
+            raise
+        if response.status_code >= 400:
+            # Rejected and failed requests changed nothing, so the client
+            # may fix or retry them with the same key, whether the view
+            # returned the error or raised it.
+            record.delete()
+            return response
+        record.status_code = response.status_code
+        record.response = response.data
+        # Content-Type is set again when the replay is rendered.
+        record.headers = {
+            name: value for name, value in response.items()
+            if name.lower() != 'content-type'
+        }
+        record.save(update_fields=['status_code', 'response', 'headers'])
+        return response
+
+    return wrapper
@@ -0,0 +1,64 @@
+"""
+Django command to move inactive users' recipes into the archive
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from core.archive import archive_user, inactive_users
+from core.models import User
+
+
+class Command(BaseCommand):
+    """Django command to move inactive users' recipes into the archive"""
+
+    help = (
+        'Move the recipes of users inactive for RECIPE_ARCHIVE_AFTER into '
+        'the archive table in small batches. They are restored on the '
+        "user's next request."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            help='Archive only this user (email address or id), active '
+                 'or not.',
+        )
+        parser.add_argument(
+            '--limit', type=int, default=None,
+            help='Archive at most this many users.',
+        )
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument(
+            '--sleep', type=float, default=0,
+            help='Seconds to pause between batches.',
+        )
+
+    def handle(self, *args, **options):
+        """Entry point for command"""
+        lookup = options['user']
+        if lookup:
+            field = 'pk' if lookup.isdigit() else 'email__iexact'
+            user_ids = list(User.objects.filter(
+                **{field: lookup}).values_list('pk', flat=True))
+            if not user_ids:
+                raise CommandError(f'User {lookup!r} does not exist.')
+        else:
+            user_ids = inactive_users().order_by('pk').values_list(
+                'pk', flat=True)
+            if options['limit'] is not None:
+                user_ids = user_ids[:options['limit']]
+            user_ids = list(user_ids)
+
+        total = 0
+        for user_id in user_ids:
+            moved = 0
+            for count in archive_user(
+                user_id,
+                batch_size=options['batch_size'],
+                pause=options['sleep'],
+            ):
+                moved += count
+            total += moved
+            self.stdout.write(f'Archived {moved} recipes of user {user_id}.')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {total} recipes of {len(user_ids)} users.'))
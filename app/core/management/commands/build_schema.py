@@ -0,0 +1,31 @@
+"""
+Django command to write the OpenAPI schema artifacts for this code version
+"""
+from django.core.management.base import BaseCommand
+
+from core import schema
+
+
+class Command(BaseCommand):
+    """Django command to write the OpenAPI schema artifacts"""
+
+    help = 'Generate the OpenAPI schema files served by /api/schema/.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--prune', action='store_true',
+            help='Delete schema files of other code versions.',
+        )
+
+    def handle(self, *args, **options):
+        """Entry point for command"""
+        for fmt in schema.RENDERERS:
+            path = schema.write_schema(fmt)
+            self.stdout.write(f'Wrote {path}')
+
+        if options['prune']:
+            for path in schema.prune_schemas():
+                self.stdout.write(f'Removed {path}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Schema built for version {schema.code_version()}.'))
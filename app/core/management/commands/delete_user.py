@@ -0,0 +1,45 @@
+"""
+Django command to delete a user and their data in batches
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from core.deletion import deactivate_user, delete_user
+from core.models import User
+
+
+class Command(BaseCommand):
+    """Django command to delete a user and their data in batches"""
+
+    help = (
+        'Delete a user and all of their recipes, tags and ingredients '
+        'in small batches.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('user', help='Email address or id of the user.')
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument(
+            '--sleep', type=float, default=0,
+            help='Seconds to pause between batches.',
+        )
+
+    def handle(self, *args, **options):
+        """Entry point for command"""
+        lookup = options['user']
+        field = 'pk' if lookup.isdigit() else 'email__iexact'
+        try:
+            user = User.objects.get(**{field: lookup})
+        except User.DoesNotExist:
+            raise CommandError(f'User {lookup!r} does not exist.')
+
+        deactivate_user(user)
+        for deleted in delete_user(
+            user.pk,
+            batch_size=options['batch_size'],
+            pause=options['sleep'],
+        ):
+            summary = ', '.join(
+                f'{count} {label}' for label, count in deleted.items())
+            self.stdout.write(f'Deleted {summary}...')
+
+        self.stdout.write(self.style.SUCCESS(f'Deleted user {lookup}.'))
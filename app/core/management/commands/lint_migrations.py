@@ -0,0 +1,140 @@
+"""
+Django command to flag migration operations that block writes
+"""
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, migrations
+from django.db.migrations.loader import MigrationLoader
+
+from core import migration_operations
+
+ERROR = 'error'
+WARNING = 'warning'
+
+
+def created_models(migration):
+    """Return lowercased names of models created by migration."""
+    return {
+        operation.name_lower for operation in migration.operations
+        if isinstance(operation, migrations.CreateModel)
+    }
+
+
+def check_operation(operation, migration, new_models):
+    """
+    Yield (level, message) for one operation.
+
+    Operations on models created in the same migration are fine: the
+    table is empty and nobody else can be writing to it yet.
+    """
+    name = operation.__class__.__name__
+    model_name = getattr(operation, 'model_name_lower', None)
+    if model_name in new_models:
+        return
+
+    if isinstance(operation, (migration_operations.AddIndexConcurrently,
+                              migration_operations.RemoveIndexConcurrently,
+                              migration_operations.AddNullableField,
+                              migration_operations.BatchedBackfill)):
+        if migration.atomic:
+            yield ERROR, f'{name} needs atomic = False on the migration.'
+        return
+
+    if isinstance(operation, (migrations.AddIndex, migrations.RemoveIndex)):
+        yield ERROR, (f'{name} locks writes while the index is built; use '
+                      f'core.migration_operations.{name}Concurrently.')
+    elif isinstance(operation, migrations.AddField):
+        field = operation.field
+        if field.many_to_many:
+            return
+        if not field.null:
+            yield ERROR, (f'AddField {operation.name} is NOT NULL; add it '
+                          f'with AddNullableField and BatchedBackfill.')
+        elif field.has_default():
+            yield WARNING, (f'AddField {operation.name} writes its default '
+                            f'into every row; use AddNullableField.')
+        if field.unique or field.db_index:
+            yield ERROR, (f'AddField {operation.name} builds an index while '
+                          f'holding a lock; add the index concurrently.')
+    elif isinstance(operation, migrations.AlterField):
+        yield WARNING, (f'AlterField {operation.name} may rewrite or scan '
+                        f'the table under an exclusive lock.')
+    elif isinstance(operation, (migrations.AddConstraint,
+                                migrations.AlterUniqueTogether,
+                                migrations.AlterIndexTogether)):
+        yield ERROR, (f'{name} scans the table while blocking writes; create '
+                      f'a unique index concurrently first.')
+    elif isinstance(operation, (migrations.RenameField,
+                                migrations.RenameModel,
+                                migrations.RemoveField,
+                                migrations.DeleteModel)):
+        yield WARNING, (f'{name} breaks code still running the previous '
+                        f'release; stop using it in a release first.')
+    elif isinstance(operation, (migrations.RunPython, migrations.RunSQL)):
+        if migration.atomic:
+            yield WARNING, (f'{name} runs in the migration transaction; '
+                            f'check it is quick on large tables.')
+
+
+def check_migration(migration):
+    """Return [(level, operation description, message)]."""
+    new_models = created_models(migration)
+    findings = []
+    for operation in migration.operations:
+        for level, message in check_operation(
+            operation, migration, new_models,
+        ):
+            findings.append((level, operation.describe(), message))
+    return findings
+
+
+class Command(BaseCommand):
+    """Django command to flag migration operations that block writes"""
+
+    help = (
+        'Check migrations for operations that lock large tables. By '
+        'default only migrations not yet applied to the database are '
+        'checked. Exits with an error if any blocking operation is found. '
+        'Set lint_exempt = True on a migration that is known to be safe.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'app_label', nargs='*',
+            help='Apps to check; defaults to the project apps.',
+        )
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Check applied migrations too.',
+        )
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        """Entry point for command"""
+        app_labels = options['app_label'] or [
+            config.label for config in apps.get_app_configs()
+            if config.path.startswith(str(settings.BASE_DIR))
+        ]
+        loader = MigrationLoader(connections[options['database']])
+        errors = 0
+        for key in sorted(loader.disk_migrations):
+            app_label, name = key
+            if app_label not in app_labels:
+                continue
+            if key in loader.applied_migrations and not options['all']:
+                continue
+            migration = loader.disk_migrations[key]
+            if getattr(migration, 'lint_exempt', False):
+                continue
+            for level, description, message in check_migration(migration):
+                style = self.style.ERROR if level == ERROR \
+                    else self.style.WARNING
+                self.stdout.write(style(
+                    f'{app_label}.{name}: {description}: {message}'))
+                errors += level == ERROR
+
+        if errors:
+            raise CommandError(
+                f'{errors} blocking migration operation(s) found.')
+        self.stdout.write(self.style.SUCCESS('No blocking operations.'))
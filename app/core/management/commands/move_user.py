@@ -0,0 +1,55 @@
+"""
+Django command to move a user's recipe data to another shard
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import User
+from core.rebalance import RebalanceError, move_user
+
+
+class Command(BaseCommand):
+    """Django command to move a user's recipe data to another shard"""
+
+    help = (
+        "Move a user's recipes, tags and ingridients to another database "
+        'shard in small batches.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('user', help='Email address or id of the user.')
+        parser.add_argument('shard', help='Database alias to move to.')
+        parser.add_argument(
+            '--source',
+            help="Shard to move from when resuming an interrupted move; "
+                 "defaults to the user's current shard.",
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--sleep', type=float, default=0,
+            help='Seconds to pause between batches.',
+        )
+
+    def handle(self, *args, **options):
+        """Entry point for command"""
+        lookup = options['user']
+        field = 'pk' if lookup.isdigit() else 'email__iexact'
+        try:
+            user = User.objects.get(**{field: lookup})
+        except User.DoesNotExist:
+            raise CommandError(f'User {lookup!r} does not exist.')
+
+        totals = {}
+        try:
+            for label, count in move_user(
+                user, options['shard'],
+                source=options['source'],
+                batch_size=options['batch_size'],
+                pause=options['sleep'],
+            ):
+                totals[label] = totals.get(label, 0) + count
+                self.stdout.write(f'{totals[label]} {label}...')
+        except RebalanceError as exc:
+            raise CommandError(str(exc))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Moved user {lookup} to {options["shard"]}.'))
@@ -0,0 +1,35 @@
+"""
+Django command to delete expired idempotency keys in batches
+"""
+from django.core.management.base import BaseCommand
+
+from core.batching import delete_in_batches
+from core.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    """Django command to delete expired idempotency keys in batches"""
+
+    help = 'Delete expired idempotency keys in small batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--sleep', type=float, default=0,
+            help='Seconds to pause between batches.',
+        )
+
+    def handle(self, *args, **options):
+        """Entry point for command"""
+        total = 0
+        for deleted in delete_in_batches(
+            IdempotencyKey.objects.expired(),
+            batch_size=options['batch_size'],
+            pause=options['sleep'],
+            raw=True,
+        ):
+            total += deleted
+            self.stdout.write(f'Deleted {total} expired idempotency keys...')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Purged {total} expired idempotency keys.'))
@@ -0,0 +1,79 @@
+"""
+Django command to recompute recipe totals from their ingridients
+"""
+from concurrent.futures import ThreadPoolExecutor
+from itertools import starmap
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Max, Min
+
+from core.models import Recipe
+from core.rollup import rebuild_totals
+
+
+def rebuild_range(using, start, stop):
+    """Rebuild totals of recipes with start <= id < stop."""
+    return rebuild_totals(Recipe.objects.using(using).filter(
+        pk__gte=start, pk__lt=stop))
+
+
+def rebuild_range_in_thread(args):
+    try:
+        return rebuild_range(*args)
+    finally:
+        # Each worker thread opened its own connection.
+        connections[args[0]].close()
+
+
+class Command(BaseCommand):
+    """Django command to recompute recipe totals from their ingridients"""
+
+    help = (
+        'Recompute the cost and calorie totals of every recipe from its '
+        'ingridients, in id range batches run by parallel workers.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--workers', type=int, default=4,
+            help='Batches updated at the same time.',
+        )
+        parser.add_argument(
+            '--database', action='append', dest='databases',
+            help='Shard to rebuild; defaults to every shard.',
+        )
+
+    def handle(self, *args, **options):
+        """Entry point for command"""
+        batch_size = options['batch_size']
+        workers = options['workers']
+        if batch_size < 1 or workers < 1:
+            raise CommandError('--batch-size and --workers must be positive.')
+
+        total = 0
+        for using in options['databases'] or settings.DATABASE_SHARDS:
+            bounds = Recipe.objects.using(using).aggregate(
+                first=Min('pk'), last=Max('pk'))
+            if bounds['first'] is None:
+                continue
+            ranges = [
+                (using, start, start + batch_size)
+                for start in range(
+                    bounds['first'], bounds['last'] + 1, batch_size)
+            ]
+            if workers == 1:
+                updated = list(starmap(rebuild_range, ranges))
+            else:
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    updated = list(executor.map(
+                        rebuild_range_in_thread, ranges))
+            total += sum(updated)
+            self.stdout.write(
+                f'{using}: rebuilt {sum(updated)} recipes in '
+                f'{len(ranges)} batches.')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt totals of {total} recipes.'))
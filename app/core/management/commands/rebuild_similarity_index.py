@@ -0,0 +1,52 @@
+"""
+Django command to recompute the similar recipe index
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core.models import Recipe
+from core.similarity import index_recipes
+
+
+class Command(BaseCommand):
+    """Django command to recompute the similar recipe index"""
+
+    help = (
+        'Recompute the similarity bands of every recipe from its tags and '
+        'ingridients, batch by batch. Needed after loading recipes with '
+        'raw SQL or changing the band settings.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--database', action='append', dest='databases',
+            help='Shard to rebuild; defaults to every shard.',
+        )
+
+    def handle(self, *args, **options):
+        """Entry point for command"""
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be positive.')
+
+        total = 0
+        for using in options['databases'] or settings.DATABASE_SHARDS:
+            recipes = Recipe.objects.using(using).order_by('pk')
+            indexed = 0
+            last_pk = 0
+            while True:
+                ids = list(recipes.filter(pk__gt=last_pk).values_list(
+                    'pk', flat=True)[:batch_size])
+                if not ids:
+                    break
+                with transaction.atomic(using=using):
+                    index_recipes(ids, using)
+                last_pk = ids[-1]
+                indexed += len(ids)
+            total += indexed
+            self.stdout.write(f'{using}: indexed {indexed} recipes.')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {total} recipes.'))
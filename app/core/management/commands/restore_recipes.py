@@ -0,0 +1,32 @@
+"""
+Django command to move a user's recipes back out of the archive
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from core.archive import restore_user
+from core.models import User
+
+
+class Command(BaseCommand):
+    """Django command to move a user's recipes back out of the archive"""
+
+    help = (
+        "Restore a user's archived recipes without waiting for their "
+        'next request.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('user', help='Email address or id of the user.')
+
+    def handle(self, *args, **options):
+        """Entry point for command"""
+        lookup = options['user']
+        field = 'pk' if lookup.isdigit() else 'email__iexact'
+        try:
+            user = User.objects.get(**{field: lookup})
+        except User.DoesNotExist:
+            raise CommandError(f'User {lookup!r} does not exist.')
+
+        restored = restore_user(user)
+        self.stdout.write(self.style.SUCCESS(
+            f'Restored {restored} recipes of user {lookup}.'))
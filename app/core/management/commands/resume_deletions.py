@@ -0,0 +1,40 @@
+"""
+Django command to finish account deletions left behind by a worker
+"""
+from django.core.management.base import BaseCommand
+
+from core.deletion import claim, delete_user, stale_jobs
+
+
+class Command(BaseCommand):
+    """Django command to finish account deletions left behind by a worker"""
+
+    help = (
+        'Resume account deletions that stopped reporting progress, e.g. '
+        'because their worker was restarted. Meant to run from cron.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--failed', action='store_true',
+            help='Also retry deletions that failed.',
+        )
+
+    def handle(self, *args, **options):
+        """Entry point for command"""
+        resumed = 0
+        for job in stale_jobs(failed=options['failed']):
+            if not claim(job):
+                continue
+            self.stdout.write(f'Resuming deletion of user {job.user_id}...')
+            try:
+                for _ in delete_user(job.user_id):
+                    pass
+            except Exception as exc:
+                self.stderr.write(
+                    f'Deleting user {job.user_id} failed: {exc}')
+                continue
+            resumed += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Resumed {resumed} deletions.'))
@@ -0,0 +1,71 @@
+"""
+Django command to report the slowest captured queries
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, Max, Sum
+from django.utils import timezone
+
+from core.models import QueryPlan
+from core.query_plans import sequential_scans
+
+
+class Command(BaseCommand):
+    """Django command to report the slowest captured queries"""
+
+    help = (
+        'Summarize the query plans captured with QUERY_PLAN_CAPTURE by SQL '
+        'fingerprint, worst total time first, and flag sequential scans '
+        'of the recipe, tag and ingridient tables.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours', type=float, default=24,
+            help='Only report plans captured this many hours back.',
+        )
+        parser.add_argument('--limit', type=int, default=10)
+        parser.add_argument(
+            '--clear', action='store_true',
+            help='Delete every captured plan after reporting.',
+        )
+
+    def handle(self, *args, **options):
+        """Entry point for command"""
+        if options['hours'] <= 0 or options['limit'] < 1:
+            raise CommandError('--hours and --limit must be positive.')
+        since = timezone.now() - timedelta(hours=options['hours'])
+        plans = QueryPlan.objects.filter(captured_at__gte=since)
+        worst = plans.values('fingerprint').annotate(
+            captures=Count('id'),
+            total=Sum('duration'),
+            slowest=Max('duration'),
+        ).order_by('-total')[:options['limit']]
+
+        flagged = 0
+        for rank, row in enumerate(worst, 1):
+            fingerprint = plans.filter(fingerprint=row['fingerprint'])
+            latest = fingerprint.latest('captured_at')
+            routes = sorted(set(
+                fingerprint.values_list('route', flat=True)))
+            self.stdout.write(
+                f'{rank}. {row["total"]:.1f} ms over {row["captures"]} '
+                f'captures, slowest {row["slowest"]:.1f} ms '
+                f'({", ".join(routes)})')
+            self.stdout.write(f'   {latest.sql}')
+            scans = sequential_scans(latest.plan)
+            if scans:
+                flagged += 1
+                self.stdout.write(self.style.WARNING(
+                    f'   Sequential scan on {", ".join(scans)}'))
+
+        if not worst:
+            self.stdout.write('No slow queries captured.')
+        elif flagged:
+            self.stdout.write(self.style.WARNING(
+                f'{flagged} of these queries scan a large table.'))
+
+        if options['clear']:
+            deleted, _ = QueryPlan.objects.all().delete()
+            self.stdout.write(f'Deleted {deleted} captured plans.')
@@ -1,27 +1,139 @@
 """
 Django command to pause execution until database is available
 """
+import random
+import socket
 import time
 
-from psycopg2 import OperationalError as Psycopg2OperationalError
-
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.migrations.executor import MigrationExecutor
 from django.db.utils import OperationalError
-from django.core.management.base import BaseCommand
+
+DEFAULT_PORTS = {
+    'postgresql': 5432,
+    'mysql': 3306,
+}
+
+EXIT_DATABASE_UNAVAILABLE = 3
+EXIT_MIGRATIONS_PENDING = 4
+
+
+def backoff_delays(min_delay, max_delay):
+    """Yield exponentially growing delays with jitter, capped at max."""
+    attempt = 0
+    while True:
+        cap = min(max_delay, min_delay * 2 ** attempt)
+        yield random.uniform(cap / 2, cap)
+        attempt += 1
 
 
 class Command(BaseCommand):
     """Django command to pause execution until database is available"""
 
+    help = (
+        'Wait until the database accepts connections, and optionally '
+        'until all migrations are applied. Exits with '
+        f'{EXIT_DATABASE_UNAVAILABLE} if the database is unavailable and '
+        f'{EXIT_MIGRATIONS_PENDING} if migrations are still pending '
+        'when the timeout expires.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+        parser.add_argument(
+            '--timeout', type=float, default=60,
+            help='Seconds to wait before giving up.',
+        )
+        parser.add_argument(
+            '--min-delay', type=float, default=0.01,
+            help='Initial delay between attempts in seconds.',
+        )
+        parser.add_argument(
+            '--max-delay', type=float, default=1,
+            help='Maximum delay between attempts in seconds.',
+        )
+        parser.add_argument(
+            '--wait-for-migrations', action='store_true',
+            help='Also wait until there are no unapplied migrations.',
+        )
+
     def handle(self, *args, **options):
         """Entry point for command"""
+        connection = connections[options['database']]
+        start = time.monotonic()
+        deadline = start + options['timeout']
+        delays = backoff_delays(options['min_delay'], options['max_delay'])
+
         self.stdout.write('Waiting for database...')
-        db_up = False
-        while db_up is False:
-            try:
-                self.check(databases=['default'])
-                db_up = True
-            except (Psycopg2OperationalError, OperationalError):
-                self.stdout.write('Database unavailable, waiting 1 second...')
-                time.sleep(1)
-
-        self.stdout.write(self.style.SUCCESS('Database available!'))
+        self.wait_until(
+            lambda: self.database_available(connection),
+            deadline, delays, 'Database unavailable',
+            EXIT_DATABASE_UNAVAILABLE,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            'Database available after %.0f ms!'
+            % ((time.monotonic() - start) * 1000)))
+
+        if options['wait_for_migrations']:
+            self.wait_until(
+                lambda: not self.pending_migrations(connection),
+                deadline, delays, 'Migrations pending',
+                EXIT_MIGRATIONS_PENDING,
+            )
+            self.stdout.write(self.style.SUCCESS('Migrations applied!'))
+
+        connection.close()
+
+    def wait_until(self, check, deadline, delays, message, returncode):
+        """Retry check with backoff until it passes or time runs out."""
+        for delay in delays:
+            if check():
+                return
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise CommandError(f'{message}, giving up.',
+                                   returncode=returncode)
+            delay = min(delay, remaining)
+            self.stdout.write(
+                f'{message}, waiting {delay * 1000:.0f} ms...')
+            time.sleep(delay)
+
+    def database_available(self, connection):
+        """Probe the TCP port, then open a real database connection."""
+        address = self.tcp_address(connection)
+        if address and not self.port_open(address):
+            return False
+        try:
+            connection.ensure_connection()
+        except OperationalError:
+            return False
+        return True
+
+    def pending_migrations(self, connection):
+        """Check whether any migrations are unapplied."""
+        try:
+            executor = MigrationExecutor(connection)
+            return bool(executor.migration_plan(
+                executor.loader.graph.leaf_nodes()))
+        except OperationalError:
+            return True
+
+    @staticmethod
+    def tcp_address(connection):
+        """Return (host, port) for TCP databases, None otherwise."""
+        host = connection.settings_dict.get('HOST')
+        port = (connection.settings_dict.get('PORT') or
+                DEFAULT_PORTS.get(connection.vendor))
+        if not host or host.startswith('/') or not port:
+            return None
+        return host, int(port)
+
+    @staticmethod
+    def port_open(address, timeout=1):
+        """Check whether something accepts TCP connections on address."""
+        try:
+            with socket.create_connection(address, timeout=timeout):
+                return True
+        except OSError:
+            return False
@@ -0,0 +1,250 @@
+"""
+Middleware for the API
+"""
+import json
+import zlib
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.contrib.auth import middleware as auth_middleware
+from django.contrib.messages import middleware as messages_middleware
+from django.contrib.sessions import middleware as sessions_middleware
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import HttpResponse
+from django.middleware import csrf
+from django.utils.cache import patch_vary_headers
+
+from core import health
+from core.query_plans import PlanCapture
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+
+class GzipEncoder:
+    """Incremental gzip encoder."""
+
+    name = 'gzip'
+
+    def __init__(self):
+        self._compressor = zlib.compressobj(
+            settings.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED,
+            16 + zlib.MAX_WBITS,
+        )
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+
+class BrotliEncoder:
+    """Incremental brotli encoder."""
+
+    name = 'br'
+
+    def __init__(self):
+        self._compressor = brotli.Compressor(
+            quality=settings.COMPRESSION_BROTLI_QUALITY)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.finish()
+
+
+def accepted_encodings(header):
+    """Return the content codings accepted by an Accept-Encoding header."""
+    accepted = set()
+    for item in header.split(','):
+        coding, _, params = item.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            key, _, value = param.partition('=')
+            if key.strip() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if q > 0:
+            accepted.add(coding)
+    return accepted
+
+
+def get_encoder(header):
+    """Pick the preferred encoder for an Accept-Encoding header."""
+    accepted = accepted_encodings(header)
+    if brotli is not None and 'br' in accepted:
+        return BrotliEncoder()
+    if 'gzip' in accepted:
+        return GzipEncoder()
+    return None
+
+
+class CompressionMiddleware:
+    """
+    Compress API responses with brotli or gzip.
+
+    Only content types listed in COMPRESSION_CONTENT_TYPES are compressed.
+    Non-streaming responses smaller than COMPRESSION_MIN_SIZE are sent
+    as is, since framing overhead outweighs the savings there.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        return self.compress_response(request, response)
+
+    def compress_response(self, request, response):
+        """Return response compressed for the client if worthwhile."""
+        if response.has_header('Content-Encoding'):
+            return response
+        content_type = response.get('Content-Type', '').split(';')[0]
+        if content_type not in settings.COMPRESSION_CONTENT_TYPES:
+            return response
+        if (not response.streaming and
+                len(response.content) < settings.COMPRESSION_MIN_SIZE):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        encoder = get_encoder(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoder is None:
+            return response
+
+        if response.streaming:
+            response.streaming_content = self._compress_stream(
+                response.streaming_content, encoder)
+            del response['Content-Length']
+        else:
+            content = encoder.compress(response.content) + encoder.flush()
+            if len(content) >= len(response.content):
+                return response
+            response.content = content
+            response['Content-Length'] = str(len(content))
+
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoder.name
+        return response
+
+    @staticmethod
+    def _compress_stream(chunks, encoder):
+        for chunk in chunks:
+            data = encoder.compress(chunk)
+            if data:
+                yield data
+        yield encoder.flush()
+
+
+class HealthCheckMiddleware:
+    """
+    Answer liveness and readiness probes before any other middleware.
+
+    Keep this first in MIDDLEWARE so probes skip host validation,
+    sessions and authentication.
+    """
+
+    LIVENESS_BODY = b'{"status":"ok"}'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.liveness_path = settings.HEALTH_CHECK_LIVENESS_PATH
+        self.readiness_path = settings.HEALTH_CHECK_READINESS_PATH
+
+    def __call__(self, request):
+        path = request.path_info
+        if path == self.liveness_path:
+            return self.probe_response(self.LIVENESS_BODY, 200)
+        if path == self.readiness_path:
+            ready, checks = health.readiness.get()
+            body = json.dumps({
+                'status': 'ok' if ready else 'unavailable',
+                'checks': checks,
+            }).encode()
+            return self.probe_response(body, 200 if ready else 503)
+        return self.get_response(request)
+
+    @staticmethod
+    def probe_response(body, status):
+        response = HttpResponse(
+            body, status=status, content_type='application/json')
+        response['Cache-Control'] = 'no-store'
+        return response
+
+
+class SessionlessPathsMixin:
+    """
+    Skip the wrapped middleware for paths in SESSIONLESS_PATH_PREFIXES.
+
+    The token authenticated API has no use for sessions, CSRF cookies,
+    request.user or messages, which only the admin needs.
+    """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.sessionless_prefixes = tuple(settings.SESSIONLESS_PATH_PREFIXES)
+
+    def is_sessionless(self, request):
+        return request.path_info.startswith(self.sessionless_prefixes)
+
+    def __call__(self, request):
+        if self.is_sessionless(request):
+            return self.get_response(request)
+        return super().__call__(request)
+
+
+class SessionMiddleware(SessionlessPathsMixin,
+                        sessions_middleware.SessionMiddleware):
+    """SessionMiddleware that skips sessionless paths."""
+
+
+class CsrfViewMiddleware(SessionlessPathsMixin, csrf.CsrfViewMiddleware):
+    """CsrfViewMiddleware that skips sessionless paths."""
+
+    def process_view(self, request, callback, callback_args, callback_kwargs):
+        if self.is_sessionless(request):
+            return None
+        return super().process_view(
+            request, callback, callback_args, callback_kwargs)
+
+
+class AuthenticationMiddleware(SessionlessPathsMixin,
+                               auth_middleware.AuthenticationMiddleware):
+    """AuthenticationMiddleware that skips sessionless paths."""
+
+
+class MessageMiddleware(SessionlessPathsMixin,
+                        messages_middleware.MessageMiddleware):
+    """MessageMiddleware that skips sessionless paths."""
+
+
+class QueryPlanMiddleware:
+    """
+    Capture the plans of slow queries run by API views.
+
+    Only installed when QUERY_PLAN_CAPTURE is on; see core.query_plans.
+    """
+
+    def __init__(self, get_response):
+        if not settings.QUERY_PLAN_CAPTURE:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        capture = PlanCapture(request)
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(capture))
+            return self.get_response(request)
@@ -0,0 +1,193 @@
+"""
+Migration operations that don't block writes on large tables
+
+Use them in migrations with ``atomic = False``, so each step commits on
+its own instead of holding locks for the whole migration.
+"""
+import time
+
+from django.conf import settings
+from django.contrib.postgres import operations as postgres_operations
+from django.db import migrations
+from django.db.models import NOT_PROVIDED, Q
+
+
+def is_postgresql(schema_editor):
+    return schema_editor.connection.vendor == 'postgresql'
+
+
+class AddIndexConcurrently(postgres_operations.AddIndexConcurrently):
+    """
+    Build an index with CREATE INDEX CONCURRENTLY on PostgreSQL.
+
+    An invalid index left behind by an interrupted build is dropped
+    first, so the migration can simply be run again. Other databases
+    get a plain CREATE INDEX.
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state,
+                          to_state):
+        if not is_postgresql(schema_editor):
+            return migrations.AddIndex.database_forwards(
+                self, app_label, schema_editor, from_state, to_state)
+        self.drop_invalid_index(schema_editor)
+        super().database_forwards(
+            app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state,
+                           to_state):
+        if not is_postgresql(schema_editor):
+            return migrations.AddIndex.database_backwards(
+                self, app_label, schema_editor, from_state, to_state)
+        super().database_backwards(
+            app_label, schema_editor, from_state, to_state)
+
+    def drop_invalid_index(self, schema_editor):
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT 1 FROM pg_index i '
+                'JOIN pg_class c ON c.oid = i.indexrelid '
+                'WHERE c.relname = %s AND NOT i.indisvalid',
+                [self.index.name],
+            )
+            invalid = cursor.fetchone() is not None
+        if invalid:
+            schema_editor.execute(
+                'DROP INDEX CONCURRENTLY IF EXISTS %s'
+                % schema_editor.quote_name(self.index.name))
+
+
+class RemoveIndexConcurrently(postgres_operations.RemoveIndexConcurrently):
+    """
+    Drop an index with DROP INDEX CONCURRENTLY on PostgreSQL, and with
+    a plain DROP INDEX elsewhere.
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state,
+                          to_state):
+        if not is_postgresql(schema_editor):
+            return migrations.RemoveIndex.database_forwards(
+                self, app_label, schema_editor, from_state, to_state)
+        super().database_forwards(
+            app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state,
+                           to_state):
+        if not is_postgresql(schema_editor):
+            return migrations.RemoveIndex.database_backwards(
+                self, app_label, schema_editor, from_state, to_state)
+        super().database_backwards(
+            app_label, schema_editor, from_state, to_state)
+
+
+class AddNullableField(migrations.AddField):
+    """
+    Add a nullable column without a database default.
+
+    Django's AddField writes the field's default into every existing
+    row, which rewrites the table on older PostgreSQL versions. Here
+    the column is only added; the default still applies to new rows
+    through the model, and existing rows stay NULL until a
+    BatchedBackfill fills them in.
+    """
+
+    def __init__(self, model_name, name, field, preserve_default=True):
+        if not field.null:
+            raise ValueError(
+                f'{self.__class__.__name__} needs a nullable field; make '
+                f'{name} NOT NULL in a later migration after backfilling.')
+        super().__init__(model_name, name, field, preserve_default)
+
+    def database_forwards(self, app_label, schema_editor, from_state,
+                          to_state):
+        to_model = to_state.apps.get_model(app_label, self.model_name)
+        if not self.allow_migrate_model(schema_editor.connection.alias,
+                                        to_model):
+            return
+        field = to_model._meta.get_field(self.name).clone()
+        field.default = NOT_PROVIDED
+        if hasattr(field, 'auto_now'):
+            field.auto_now = field.auto_now_add = False
+        field.set_attributes_from_name(self.name)
+        field.model = to_model
+        schema_editor.add_field(to_model, field)
+
+    def describe(self):
+        return f'Add nullable field {self.name} to {self.model_name}'
+
+
+class BatchedBackfill(migrations.operations.base.Operation):
+    """
+    Fill a column in primary key batches, committing after each one.
+
+    Only rows matching pending (by default, where the field is NULL)
+    are updated, so a backfill that was interrupted picks up where it
+    left off. value can be a constant or an expression such as
+    F('other_field'). pause seconds are slept between batches to leave
+    room for regular traffic; it defaults to MIGRATION_BACKFILL_PAUSE.
+    """
+
+    reversible = True
+    reduces_to_sql = False
+    atomic = False
+
+    def __init__(self, model_name, name, value, pending=None,
+                 batch_size=None, pause=None):
+        self.model_name = model_name
+        self.name = name
+        self.value = value
+        self.pending = pending
+        self.batch_size = batch_size
+        self.pause = pause
+
+    def deconstruct(self):
+        kwargs = {
+            'model_name': self.model_name,
+            'name': self.name,
+            'value': self.value,
+        }
+        for key in ('pending', 'batch_size', 'pause'):
+            if getattr(self, key) is not None:
+                kwargs[key] = getattr(self, key)
+        return self.__class__.__qualname__, [], kwargs
+
+    def state_forwards(self, app_label, state):
+        pass
+
+    def database_forwards(self, app_label, schema_editor, from_state,
+                          to_state):
+        model = to_state.apps.get_model(app_label, self.model_name)
+        alias = schema_editor.connection.alias
+        if not self.allow_migrate_model(alias, model):
+            return
+        for _ in self.run(model, alias):
+            pass
+
+    def run(self, model, alias):
+        """Update one batch at a time, yielding the rows updated."""
+        batch_size = self.batch_size or settings.MIGRATION_BACKFILL_BATCH_SIZE
+        pause = self.pause
+        if pause is None:
+            pause = settings.MIGRATION_BACKFILL_PAUSE
+        pending = self.pending or Q(**{f'{self.name}__isnull': True})
+        manager = model._base_manager.using(alias)
+        pks = manager.filter(pending).order_by('pk').values_list(
+            'pk', flat=True)
+        last_pk = None
+        while True:
+            batch = pks if last_pk is None else pks.filter(pk__gt=last_pk)
+            batch = list(batch[:batch_size])
+            if not batch:
+                return
+            last_pk = batch[-1]
+            yield manager.filter(pk__in=batch).update(
+                **{self.name: self.value})
+            if pause:
+                time.sleep(pause)
+
+    def database_backwards(self, app_label, schema_editor, from_state,
+                           to_state):
+        pass
+
+    def describe(self):
+        return f'Backfill {self.model_name}.{self.name} in batches'
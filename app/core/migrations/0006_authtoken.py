@@ -0,0 +1,51 @@
+# Generated by Django 3.2.25 on 2026-10-19 18:59
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def copy_legacy_tokens(apps, schema_editor):
+    """
+    Carry over existing rest_framework.authtoken tokens. They count as
+    issued now, so ones older than AUTH_TOKEN_TTL don't all expire on
+    deploy and log every client out at once.
+    """
+    Token = apps.get_model('authtoken', 'Token')
+    AuthToken = apps.get_model('core', 'AuthToken')
+    now = django.utils.timezone.now()
+    AuthToken.objects.bulk_create(
+        AuthToken(key=token.key, user_id=token.user_id,
+                  created=now, last_used=now)
+        for token in Token.objects.iterator()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_recipe_ingredients'),
+        ('authtoken', '0003_tokenproxy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthToken',
+            fields=[
+                ('key', models.CharField(max_length=40, primary_key=True, serialize=False)),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_used', models.DateTimeField(default=django.utils.timezone.now)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='auth_tokens', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='authtoken',
+            index=models.Index(fields=['created'], name='core_authtoken_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='authtoken',
+            index=models.Index(fields=['last_used'], name='core_authtoken_last_used_idx'),
+        ),
+        migrations.RunPython(copy_legacy_tokens, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+from django.db import migrations
+
+TABLES = ['core_tag', 'core_ingridient']
+
+
+def create_indexes(apps, schema_editor):
+    """
+    Add trigram indexes serving the admin's name__icontains searches,
+    which PostgreSQL runs as UPPER(name::text) LIKE UPPER('%term%').
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table in TABLES:
+        schema_editor.execute(
+            f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {table}_name_trgm '
+            f'ON {table} USING gin (UPPER(name::text) gin_trgm_ops)'
+        )
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table in TABLES:
+        schema_editor.execute(
+            f'DROP INDEX CONCURRENTLY IF EXISTS {table}_name_trgm')
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction.
+    atomic = False
+
+    dependencies = [
+        ('core', '0006_authtoken'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -0,0 +1,92 @@
+# Generated by Django 3.2.25 on 2026-10-19 19:22
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Now
+import django.db.models.deletion
+import django.utils.timezone
+
+from core.migration_operations import (
+    AddIndexConcurrently,
+    AddNullableField,
+    BatchedBackfill,
+)
+
+
+class Migration(migrations.Migration):
+
+    # Indexes are built concurrently and updated_at backfilled in batches.
+    atomic = False
+
+    dependencies = [
+        ('core', '0008_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('recipe', 'Recipe'), ('tag', 'Tag'), ('ingridient', 'Ingridient')], max_length=16)),
+                ('object_id', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='tombstone',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tombstones', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['user', 'deleted_at', 'id'], name='core_tombstone_user_del_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['deleted_at'], name='core_tombstone_deleted_idx'),
+        ),
+        AddNullableField(
+            model_name='ingridient',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, null=True),
+        ),
+        AddNullableField(
+            model_name='recipe',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, null=True),
+        ),
+        AddNullableField(
+            model_name='tag',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, null=True),
+        ),
+        # Existing rows count as changed now, so the first delta sync
+        # after the deploy sends everything once.
+        BatchedBackfill(
+            model_name='ingridient',
+            name='updated_at',
+            value=Now(),
+        ),
+        BatchedBackfill(
+            model_name='recipe',
+            name='updated_at',
+            value=Now(),
+        ),
+        BatchedBackfill(
+            model_name='tag',
+            name='updated_at',
+            value=Now(),
+        ),
+        AddIndexConcurrently(
+            model_name='ingridient',
+            index=models.Index(fields=['user', 'updated_at', 'id'], name='core_ingr_user_updated_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='recipe',
+            index=models.Index(fields=['user', 'updated_at', 'id'], name='core_recipe_user_updated_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='tag',
+            index=models.Index(fields=['user', 'updated_at', 'id'], name='core_tag_user_updated_idx'),
+        ),
+    ]
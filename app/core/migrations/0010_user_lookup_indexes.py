@@ -0,0 +1,31 @@
+from django.db import migrations, models
+
+from core.migration_operations import AddIndexConcurrently
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction.
+    atomic = False
+
+    dependencies = [
+        ('core', '0009_delta_sync'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='recipe',
+            index=models.Index(fields=['user', '-id'],
+                               name='core_recipe_user_id_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='tag',
+            index=models.Index(fields=['user', 'name'],
+                               name='core_tag_user_name_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='ingridient',
+            index=models.Index(fields=['user', 'name'],
+                               name='core_ingr_user_name_idx'),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 3.2.25 on 2026-10-19 21:05
+
+from django.db import migrations, models
+
+from core.migration_operations import (
+    AddIndexConcurrently,
+    AddNullableField,
+    BatchedBackfill,
+)
+
+
+class Migration(migrations.Migration):
+
+    # Indexes are built concurrently and totals backfilled in batches.
+    atomic = False
+
+    dependencies = [
+        ('core', '0012_user_shard'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingridient',
+            name='calories',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='ingridient',
+            name='cost',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        AddNullableField(
+            model_name='recipe',
+            name='total_calories',
+            field=models.IntegerField(default=0, editable=False, null=True),
+        ),
+        AddNullableField(
+            model_name='recipe',
+            name='total_cost',
+            field=models.IntegerField(default=0, editable=False, null=True),
+        ),
+        # No ingridient has a cost or calories yet, so every total is 0.
+        BatchedBackfill(
+            model_name='recipe',
+            name='total_calories',
+            value=0,
+        ),
+        BatchedBackfill(
+            model_name='recipe',
+            name='total_cost',
+            value=0,
+        ),
+        AddIndexConcurrently(
+            model_name='recipe',
+            index=models.Index(fields=['user', 'total_cost', 'id'],
+                               name='core_recipe_user_cost_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='recipe',
+            index=models.Index(fields=['user', 'total_calories', 'id'],
+                               name='core_recipe_user_cal_idx'),
+        ),
+    ]
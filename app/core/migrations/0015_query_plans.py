@@ -0,0 +1,31 @@
+# Generated by Django 3.2.25 on 2026-10-19 19:59
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_recipe_bands'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueryPlan',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('route', models.CharField(max_length=255)),
+                ('fingerprint', models.CharField(max_length=40)),
+                ('sql', models.TextField()),
+                ('database', models.CharField(max_length=100)),
+                ('duration', models.FloatField(help_text='Milliseconds')),
+                ('plan', models.JSONField()),
+                ('captured_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='queryplan',
+            index=models.Index(fields=['captured_at'], name='core_queryplan_captured_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.2.25 on 2026-10-19 20:21
+
+from django.db import migrations, models
+from django.db.models.functions import Now
+import django.utils.timezone
+
+from core.migration_operations import AddNullableField, BatchedBackfill
+
+
+class Migration(migrations.Migration):
+
+    # date_joined is backfilled in batches.
+    atomic = False
+
+    dependencies = [
+        ('core', '0017_idempotency_headers'),
+    ]
+
+    operations = [
+        AddNullableField(
+            model_name='user',
+            name='date_joined',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False, null=True),
+        ),
+        # Join dates of existing users are unknown. Counting them as
+        # joined now keeps the archive away from users who never logged
+        # in for RECIPE_ARCHIVE_AFTER after the deploy.
+        BatchedBackfill(
+            model_name='user',
+            name='date_joined',
+            value=Now(),
+        ),
+    ]
@@ -1,12 +1,19 @@
 """Models for core app."""
+import binascii
+import os
+import uuid
 
-from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
 from django.contrib.auth.models import (
     AbstractBaseUser,
     BaseUserManager,
     PermissionsMixin,
 )
 from django.conf import settings
+from django.utils import timezone
+
+from core.sharding import shard_map
 
 
 class UserManager(BaseUserManager):
@@ -16,6 +23,7 @@ class UserManager(BaseUserManager):
         """Create, save and return a new user."""
         if not email:
             raise ValueError('User must have an email address.')
+        extra_fields.setdefault('shard', shard_map.assign(email))
         user = self.model(email=self.normalize_email(email), **extra_fields)
         user.set_password(password)
         user.save(using=self._db)
@@ -38,6 +46,12 @@ class User(AbstractBaseUser, PermissionsMixin):
     name = models.CharField(max_length=255)
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
+    # Null only for users from before the column was backfilled.
+    date_joined = models.DateTimeField(default=timezone.now, null=True,
+                                       editable=False)
+    recipes_archived_at = models.DateTimeField(null=True, blank=True)
+    # Database alias holding the user's recipes; see core.sharding.
+    shard = models.CharField(max_length=64, null=True, blank=True)
 
     objects = UserManager()
 
@@ -47,7 +61,8 @@ class User(AbstractBaseUser, PermissionsMixin):
 class Recipe(models.Model):
     """Recipe object."""
     user = models.ForeignKey(settings.AUTH_USER_MODEL,
-                             on_delete=models.CASCADE)
+                             on_delete=models.CASCADE,
+                             db_constraint=False)
     title = models.CharField(max_length=255)
     description = models.TextField(blank=True)
     time_minutes = models.IntegerField()
@@ -56,6 +71,23 @@ class Recipe(models.Model):
 
     tags = models.ManyToManyField('Tag')
     ingredients = models.ManyToManyField('Ingridient')
+    updated_at = models.DateTimeField(auto_now=True, null=True)
+    # Sums over ingredients, kept up to date by core.rollup.
+    total_cost = models.IntegerField(default=0, null=True, editable=False)
+    total_calories = models.IntegerField(
+        default=0, null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'updated_at', 'id'],
+                         name='core_recipe_user_updated_idx'),
+            models.Index(fields=['user', '-id'],
+                         name='core_recipe_user_id_idx'),
+            models.Index(fields=['user', 'total_cost', 'id'],
+                         name='core_recipe_user_cost_idx'),
+            models.Index(fields=['user', 'total_calories', 'id'],
+                         name='core_recipe_user_cal_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -64,8 +96,18 @@ class Recipe(models.Model):
 class Tag(models.Model):
     """Tag object."""
     user = models.ForeignKey(settings.AUTH_USER_MODEL,
-                             on_delete=models.CASCADE)
+                             on_delete=models.CASCADE,
+                             db_constraint=False)
     name = models.CharField(max_length=255)
+    updated_at = models.DateTimeField(auto_now=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'updated_at', 'id'],
+                         name='core_tag_user_updated_idx'),
+            models.Index(fields=['user', 'name'],
+                         name='core_tag_user_name_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -74,8 +116,310 @@ class Tag(models.Model):
 class Ingridient(models.Model):
     """Ingridient object."""
     user = models.ForeignKey(settings.AUTH_USER_MODEL,
-                             on_delete=models.CASCADE)
+                             on_delete=models.CASCADE,
+                             db_constraint=False)
     name = models.CharField(max_length=255)
+    updated_at = models.DateTimeField(auto_now=True, null=True)
+    cost = models.IntegerField(null=True, blank=True)
+    calories = models.IntegerField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'updated_at', 'id'],
+                         name='core_ingr_user_updated_idx'),
+            models.Index(fields=['user', 'name'],
+                         name='core_ingr_user_name_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Compared on save to roll cost changes up into recipe totals.
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
 
     def __str__(self):
         return self.name
+
+
+class AuthTokenQuerySet(models.QuerySet):
+    """QuerySet for auth tokens."""
+
+    def expired(self, now=None):
+        """Return tokens past their lifetime or idle timeout."""
+        now = now or timezone.now()
+        return self.filter(
+            models.Q(created__lt=now - settings.AUTH_TOKEN_TTL) |
+            models.Q(last_used__lt=now - settings.AUTH_TOKEN_IDLE_TTL)
+        )
+
+    def issue(self, user):
+        """
+        Create a token for user, revoking their expired tokens and the
+        least recently used beyond AUTH_TOKEN_MAX_PER_USER.
+
+        The user row is locked, so concurrent logins of the same user
+        take turns and can't leave more tokens than the cap.
+        """
+        limit = max(1, settings.AUTH_TOKEN_MAX_PER_USER)
+        with transaction.atomic(using=self.db):
+            User.objects.using(self.db).select_for_update().filter(
+                pk=user.pk).exists()
+            token = self.create(user=user)
+            tokens = self.filter(user=user)
+            tokens.expired().delete()
+            surplus = tokens.exclude(pk=token.pk).order_by(
+                '-last_used', '-created',
+            ).values_list('pk', flat=True)[limit - 1:]
+            self.filter(pk__in=list(surplus)).delete()
+        return token
+
+    def rotate(self, token):
+        """Replace token with a fresh one for the same user."""
+        with transaction.atomic(using=self.db):
+            new_token = self.create(user=token.user)
+            self.filter(pk=token.pk).delete()
+        return new_token
+
+
+class AuthToken(models.Model):
+    """Expiring, rotatable API token."""
+    key = models.CharField(max_length=40, primary_key=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL,
+                             related_name='auth_tokens',
+                             on_delete=models.CASCADE)
+    created = models.DateTimeField(default=timezone.now)
+    last_used = models.DateTimeField(default=timezone.now)
+
+    objects = AuthTokenQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created'],
+                         name='core_authtoken_created_idx'),
+            models.Index(fields=['last_used'],
+                         name='core_authtoken_last_used_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self.key:
+            self.key = self.generate_key()
+        return super().save(*args, **kwargs)
+
+    @staticmethod
+    def generate_key():
+        """Return a new random token key."""
+        return binascii.hexlify(os.urandom(20)).decode()
+
+    def is_expired(self, now=None):
+        """Check whether the token is past its lifetime or idle timeout."""
+        now = now or timezone.now()
+        return (self.created < now - settings.AUTH_TOKEN_TTL or
+                self.last_used < now - settings.AUTH_TOKEN_IDLE_TTL)
+
+    def touch(self, now=None):
+        """
+        Record token usage, writing at most once per
+        AUTH_TOKEN_LAST_USED_INTERVAL.
+        """
+        now = now or timezone.now()
+        threshold = now - settings.AUTH_TOKEN_LAST_USED_INTERVAL
+        if self.last_used >= threshold:
+            return
+        AuthToken.objects.filter(
+            pk=self.pk,
+            last_used__lt=threshold,
+        ).update(last_used=now)
+        self.last_used = now
+
+    def __str__(self):
+        return self.key
+
+
+class IdempotencyKeyQuerySet(models.QuerySet):
+    """QuerySet for idempotency keys."""
+
+    def expired(self, now=None):
+        """Return keys older than IDEMPOTENCY_KEY_TTL."""
+        now = now or timezone.now()
+        return self.filter(created__lt=now - settings.IDEMPOTENCY_KEY_TTL)
+
+
+class IdempotencyKey(models.Model):
+    """Stored response for a client supplied Idempotency-Key."""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL,
+                             related_name='idempotency_keys',
+                             on_delete=models.CASCADE)
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True)
+    response = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+    headers = models.JSONField(null=True)
+    created = models.DateTimeField(default=timezone.now)
+
+    objects = IdempotencyKeyQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'],
+                                    name='core_idempotencykey_user_key'),
+        ]
+        indexes = [
+            models.Index(fields=['created'],
+                         name='core_idemkey_created_idx'),
+        ]
+
+    @property
+    def in_progress(self):
+        """Whether the original request is still running."""
+        return self.status_code is None
+
+    def is_expired(self, now=None):
+        """Check whether the key is older than IDEMPOTENCY_KEY_TTL."""
+        now = now or timezone.now()
+        return self.created < now - settings.IDEMPOTENCY_KEY_TTL
+
+    def __str__(self):
+        return self.key
+
+
+class TombstoneQuerySet(models.QuerySet):
+    """QuerySet for tombstones."""
+
+    def expired(self, now=None):
+        """Return tombstones older than SYNC_TOMBSTONE_TTL."""
+        now = now or timezone.now()
+        return self.filter(deleted_at__lt=now - settings.SYNC_TOMBSTONE_TTL)
+
+
+class Tombstone(models.Model):
+    """Record of a deleted recipe, tag or ingridient for delta sync."""
+    RECIPE = 'recipe'
+    TAG = 'tag'
+    INGRIDIENT = 'ingridient'
+    KIND_CHOICES = [
+        (RECIPE, 'Recipe'),
+        (TAG, 'Tag'),
+        (INGRIDIENT, 'Ingridient'),
+    ]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL,
+                             related_name='tombstones',
+                             on_delete=models.CASCADE,
+                             db_constraint=False)
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    objects = TombstoneQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'deleted_at', 'id'],
+                         name='core_tombstone_user_del_idx'),
+            models.Index(fields=['deleted_at'],
+                         name='core_tombstone_deleted_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} {self.object_id}'
+
+
+class ArchivedRecipe(models.Model):
+    """Recipe of an inactive user, moved out of the recipe tables."""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL,
+                             related_name='archived_recipes',
+                             on_delete=models.CASCADE,
+                             db_constraint=False)
+    recipe_id = models.BigIntegerField()
+    data = models.JSONField(encoder=DjangoJSONEncoder)
+    tag_ids = models.JSONField(default=list)
+    ingridient_ids = models.JSONField(default=list)
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'recipe_id'],
+                                    name='core_archived_user_recipe'),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe_id}'
+
+
+class RecipeBand(models.Model):
+    """
+    One MinHash band of a recipe's tags and ingridients, used to find
+    similar recipes; see core.similarity.
+    """
+    recipe = models.ForeignKey(Recipe, related_name='bands',
+                               on_delete=models.CASCADE)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL,
+                             related_name='+',
+                             on_delete=models.CASCADE,
+                             db_constraint=False)
+    bucket = models.BigIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'bucket'],
+                         name='core_recipeband_user_bkt_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe_id}: {self.bucket}'
+
+
+class QueryPlan(models.Model):
+    """EXPLAIN ANALYZE output of a slow query; see core.query_plans."""
+    route = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=40)
+    sql = models.TextField()
+    database = models.CharField(max_length=100)
+    duration = models.FloatField(help_text='Milliseconds')
+    plan = models.JSONField()
+    captured_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['captured_at'],
+                         name='core_queryplan_captured_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.route}: {self.fingerprint}'
+
+
+class DeletionJob(models.Model):
+    """
+    Progress of deleting an account; see core.deletion. Kept after the
+    user is gone so the client can poll it by id.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4,
+                          editable=False)
+    user_id = models.BigIntegerField(unique=True)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES,
+                              default=PENDING)
+    deleted = models.JSONField(default=dict)
+    created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'updated_at'],
+                         name='core_deletionjob_status_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id}: {self.status}'
@@ -0,0 +1,162 @@
+"""
+Capture of PostgreSQL plans for slow API queries
+
+With QUERY_PLAN_CAPTURE on, QueryPlanMiddleware wraps the database
+connections while views of QUERY_PLAN_NAMESPACES run. SELECTs slower
+than QUERY_PLAN_THRESHOLD milliseconds, other than those that lock rows
+or call functions with side effects, are run a second time under
+EXPLAIN (ANALYZE, BUFFERS) and stored as QueryPlan rows with the route
+and a fingerprint of their SQL, for the slow_queries report. Each
+fingerprint is captured at most once per QUERY_PLAN_INTERVAL seconds
+per process, so a slow endpoint doesn't double its own load.
+"""
+import hashlib
+import json
+import logging
+import re
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+
+from core.models import Ingridient, QueryPlan, Recipe, Tag
+
+logger = logging.getLogger(__name__)
+
+# Tables too large to read in full for a single user's request.
+WATCHED_TABLES = (
+    Recipe._meta.db_table,
+    Tag._meta.db_table,
+    Ingridient._meta.db_table,
+)
+
+_NORMALIZERS = (
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'%s|\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)'), '(...)'),
+    (re.compile(r'\s+'), ' '),
+)
+
+# A SELECT calling one of these, or locking rows, changes state, so it
+# must not be run again for its plan.
+SIDE_EFFECTS = re.compile(
+    r'\b(?:pg_notify|nextval|setval|set_config|pg_advisory_\w+|'
+    r'pg_try_advisory_\w+|pg_cancel_backend|pg_terminate_backend|'
+    r'lo_\w+|dblink\w*)\s*\(|'
+    r'\bFOR\s+(?:NO\s+KEY\s+|KEY\s+)?(?:UPDATE|SHARE)\b|\bINTO\b',
+    re.IGNORECASE,
+)
+
+_last_captured = {}
+
+
+def fingerprint(sql):
+    """
+    Return (normalized sql, fingerprint) with literals, placeholders and
+    IN lists replaced, so every run of one query shape matches.
+    """
+    for pattern, replacement in _NORMALIZERS:
+        sql = pattern.sub(replacement, sql)
+    sql = sql.strip()
+    return sql, hashlib.sha1(sql.encode()).hexdigest()
+
+
+def is_read_only(sql):
+    """Whether sql is a SELECT that can be run again without effects."""
+    return (sql.lstrip()[:6].upper() == 'SELECT' and
+            SIDE_EFFECTS.search(sql) is None)
+
+
+def explain(connection, sql, params):
+    """
+    Return the EXPLAIN ANALYZE plan of a query, None if unsupported.
+    Whatever the query did is rolled back.
+    """
+    if connection.vendor != 'postgresql':
+        return None
+    with transaction.atomic(using=connection.alias):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        transaction.set_rollback(True, using=connection.alias)
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan
+
+
+def plan_nodes(plan):
+    """Yield every node of an EXPLAIN (FORMAT JSON) plan."""
+    if isinstance(plan, list):
+        for item in plan:
+            yield from plan_nodes(item)
+    elif isinstance(plan, dict):
+        if 'Node Type' in plan:
+            yield plan
+        for key in ('Plan', 'Plans'):
+            if key in plan:
+                yield from plan_nodes(plan[key])
+
+
+def sequential_scans(plan, tables=WATCHED_TABLES):
+    """Return the tables of tables read with a sequential scan."""
+    return sorted({
+        node['Relation Name'] for node in plan_nodes(plan)
+        if node['Node Type'] == 'Seq Scan'
+        and node.get('Relation Name') in tables
+    })
+
+
+class PlanCapture:
+    """
+    Execute wrapper storing the plans of slow SELECTs run for request.
+    """
+
+    def __init__(self, request):
+        self.request = request
+        self.capturing = False
+
+    def route(self):
+        match = getattr(self.request, 'resolver_match', None)
+        if match is None or match.namespace not in \
+                settings.QUERY_PLAN_NAMESPACES:
+            return None
+        return match.view_name
+
+    def __call__(self, execute, sql, params, many, context):
+        if self.capturing:
+            return execute(sql, params, many, context)
+        start = time.perf_counter()
+        result = execute(sql, params, many, context)
+        duration = (time.perf_counter() - start) * 1000
+        if duration >= settings.QUERY_PLAN_THRESHOLD and not many and \
+                is_read_only(sql):
+            route = self.route()
+            if route is not None:
+                self.capture(context['connection'], route, sql, params,
+                             duration)
+        return result
+
+    def capture(self, connection, route, sql, params, duration):
+        normalized, key = fingerprint(sql)
+        now = time.monotonic()
+        last = _last_captured.get(key)
+        if last is not None and now - last < settings.QUERY_PLAN_INTERVAL:
+            return
+        _last_captured[key] = now
+        self.capturing = True
+        try:
+            plan = explain(connection, sql, params)
+            if plan is not None:
+                QueryPlan.objects.create(
+                    route=route,
+                    fingerprint=key,
+                    sql=normalized,
+                    database=connection.alias,
+                    duration=duration,
+                    plan=plan,
+                )
+        except DatabaseError:
+            logger.exception('Could not capture the plan of %s', normalized)
+        finally:
+            self.capturing = False
@@ -0,0 +1,178 @@
+"""
+Moving a user's recipe data between shards
+"""
+import time
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from core.batching import delete_in_batches
+from core.models import (
+    ArchivedRecipe,
+    Ingridient,
+    Recipe,
+    RecipeBand,
+    Tag,
+    Tombstone,
+    User,
+)
+from core.sharding import db_for_user
+
+# Copied in this order, so rows exist before anything referencing them,
+# and deleted from the source in reverse.
+MOVE_ORDER = (
+    ('tags', Tag),
+    ('ingridients', Ingridient),
+    ('recipes', Recipe),
+    ('recipe tags', Recipe.tags.through),
+    ('recipe ingridients', Recipe.ingredients.through),
+    ('recipe bands', RecipeBand),
+    ('archived recipes', ArchivedRecipe),
+    ('tombstones', Tombstone),
+)
+
+# Rows deleted on the target during a move must not come back, and rows
+# referencing them can't be copied: (column, tombstone kind) a row is
+# dropped for, (column, model) rows it needs on the target, and (column,
+# model) rows that replace it there, like a recipe restored from the
+# archive.
+TOMBSTONED_BY = {
+    Tag: ('id', Tombstone.TAG),
+    Ingridient: ('id', Tombstone.INGRIDIENT),
+    Recipe: ('id', Tombstone.RECIPE),
+    ArchivedRecipe: ('recipe_id', Tombstone.RECIPE),
+}
+REFERENCES = {
+    Recipe.tags.through: (('recipe_id', Recipe), ('tag_id', Tag)),
+    Recipe.ingredients.through: (
+        ('recipe_id', Recipe), ('ingridient_id', Ingridient)),
+    RecipeBand: (('recipe_id', Recipe),),
+}
+REPLACED_BY = {
+    ArchivedRecipe: ('recipe_id', Recipe),
+}
+# Attempts at a batch whose rows keep changing on the target.
+COPY_ATTEMPTS = 3
+
+
+class RebalanceError(Exception):
+    """A user's rows could not all be copied to the target shard."""
+
+
+def user_rows(model, db, user_id):
+    """Return the user's rows of model on shard db."""
+    queryset = model.objects.using(db)
+    if model._meta.auto_created:
+        return queryset.filter(recipe__user_id=user_id)
+    return queryset.filter(user_id=user_id)
+
+
+def copyable(model, rows, target):
+    """
+    Return the rows of model, as dicts, that still belong on target:
+    not there yet, not deleted there, and with the rows they reference.
+
+    Raises RebalanceError for ids held by someone else's rows there.
+    """
+    pks = [row['id'] for row in rows]
+    owner = 'user_id' if 'user_id' in rows[0] else 'recipe_id'
+    existing = dict(model.objects.using(target).filter(
+        pk__in=pks).values_list('pk', owner))
+    taken = [row['id'] for row in rows
+             if row['id'] in existing and existing[row['id']] != row[owner]]
+    if taken:
+        raise RebalanceError(
+            f'{model._meta.label} ids {taken} are taken on {target}.')
+    rows = [row for row in rows if row['id'] not in existing]
+
+    def present(column, related, exclude=False):
+        ids = {row[column] for row in rows}
+        found = set(related.objects.using(target).filter(
+            pk__in=ids).values_list('pk', flat=True))
+        return {value for value in ids if (value in found) != exclude}
+
+    if model in TOMBSTONED_BY and rows:
+        column, kind = TOMBSTONED_BY[model]
+        deleted = set(Tombstone.objects.using(target).filter(
+            kind=kind, object_id__in={row[column] for row in rows},
+        ).values_list('object_id', flat=True))
+        rows = [row for row in rows if row[column] not in deleted]
+    for column, related in REFERENCES.get(model, ()):
+        if rows:
+            kept = present(column, related)
+            rows = [row for row in rows if row[column] in kept]
+    if model in REPLACED_BY and rows:
+        column, related = REPLACED_BY[model]
+        kept = present(column, related, exclude=True)
+        rows = [row for row in rows if row[column] in kept]
+    return rows
+
+
+def copy_rows(queryset, target, batch_size, pause=0):
+    """
+    Copy the rows of queryset to target with their ids, batch_size at a
+    time, leaving out rows copyable() drops. Yields the rows per batch.
+
+    A batch is checked again and retried when the target changes under
+    it, such as a recipe deleted before its links are inserted.
+    """
+    model = queryset.model
+    fields = [field.attname for field in model._meta.concrete_fields]
+    rows = queryset.order_by('pk').values(*fields)
+    last_pk = None
+    while True:
+        batch = rows if last_pk is None else rows.filter(pk__gt=last_pk)
+        batch = list(batch[:batch_size])
+        if not batch:
+            return
+        last_pk = batch[-1]['id']
+        for attempt in range(1, COPY_ATTEMPTS + 1):
+            try:
+                with transaction.atomic(using=target):
+                    model.objects.using(target).bulk_create([
+                        model(**row)
+                        for row in copyable(model, batch, target)])
+                break
+            except IntegrityError:
+                if attempt == COPY_ATTEMPTS:
+                    raise RebalanceError(
+                        f'Could not copy {model._meta.label} rows up to '
+                        f'id {last_pk} to {target}.')
+        yield len(batch)
+        if pause:
+            time.sleep(pause)
+
+
+def move_user(user, target, source=None, batch_size=1000, pause=0):
+    """
+    Move user's recipes, tags, ingridients and their history to shard
+    target, yielding (label, rows) after every batch.
+
+    The user is pointed at target before copying, so nothing written
+    while the copy runs is lost; rows not copied yet are briefly
+    missing from the API instead. Rows deleted on target meanwhile are
+    not copied back. Copied recipes count as updated for delta sync.
+    Rows are deleted from source once every batch reached target. An
+    interrupted move is resumed by calling it again with the same
+    source.
+    """
+    if target not in settings.DATABASE_SHARDS:
+        raise RebalanceError(f'{target!r} is not in DATABASE_SHARDS.')
+    source = source or db_for_user(user)
+    if source == target:
+        return
+    User.objects.filter(pk=user.pk).update(shard=target)
+    user.shard = target
+
+    for label, model in MOVE_ORDER:
+        for count in copy_rows(
+            user_rows(model, source, user.pk), target, batch_size, pause,
+        ):
+            yield label, count
+
+    for label, model in reversed(MOVE_ORDER):
+        for count in delete_in_batches(
+            user_rows(model, source, user.pk),
+            batch_size=batch_size, pause=pause, raw=True,
+        ):
+            yield f'deleted {label}', count
@@ -0,0 +1,53 @@
+"""
+Renderers for the API
+"""
+from rest_framework import renderers
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME if orjson is not None else 0
+
+
+class JSONRenderer(renderers.JSONRenderer):
+    """
+    JSON renderer that encodes straight to bytes with orjson.
+
+    Falls back to the stdlib based renderer when orjson is not installed
+    or when the output needs formatting orjson does not support
+    (indentation, ASCII-only or non-compact output).
+    """
+
+    def __init__(self):
+        self._encoder = self.encoder_class()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        """Render data into JSON bytes."""
+        if data is None:
+            return b''
+
+        renderer_context = renderer_context or {}
+        if (orjson is None or self.ensure_ascii or not self.compact or
+                self.get_indent(accepted_media_type, renderer_context)):
+            return super().render(
+                data, accepted_media_type, renderer_context)
+
+        # Datetimes are passed through to the DRF encoder so their
+        # format matches the stdlib renderer.
+        try:
+            ret = orjson.dumps(
+                data, default=self._encoder.default, option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            # e.g. non-string dict keys, which the stdlib coerces
+            return super().render(
+                data, accepted_media_type, renderer_context)
+
+        # Keep parity with the stdlib renderer, which escapes U+2028 and
+        # U+2029 so the output is also valid JavaScript. Checking for
+        # their lead byte first keeps the common case a single memchr.
+        if b'\xe2' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(
+                b'\xe2\x80\xa9', b'\\u2029')
+        return ret
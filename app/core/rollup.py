@@ -0,0 +1,90 @@
+"""
+Recipe cost and calorie totals rolled up from their ingridients
+
+Totals are adjusted by the difference whenever ingridients are linked,
+unlinked or change, instead of being summed again from every linked
+row. rebuild_totals recomputes them from scratch as a repair tool.
+"""
+from django.db.models import Case, F, IntegerField, OuterRef, Subquery, Sum
+from django.db.models import Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from core.models import Recipe
+
+# Recipe total -> Ingridient attribute
+ROLLUPS = {
+    'total_cost': 'cost',
+    'total_calories': 'calories',
+}
+
+
+def ingridient_sums(queryset, subtract=()):
+    """
+    Return {total: sum} over an Ingridient queryset, in one query.
+
+    Ingridients whose pk is in subtract count negatively, so the change
+    from swapping one set of ingridients for another can be summed at
+    once.
+    """
+    sign = Case(When(pk__in=list(subtract), then=Value(-1)),
+                default=Value(1), output_field=IntegerField())
+    if not subtract:
+        sign = Value(1)
+    return queryset.aggregate(**{
+        total: Coalesce(Sum(F(attr) * sign), 0)
+        for total, attr in ROLLUPS.items()
+    })
+
+
+def ingridient_values(ingridient):
+    """Return {total: value} contributed by one ingridient."""
+    return {
+        total: getattr(ingridient, attr) or 0
+        for total, attr in ROLLUPS.items()
+    }
+
+
+def total_changes(sums, sign=1):
+    """
+    Return update() kwargs adding sums to recipe totals, or nothing if
+    the totals don't change.
+    """
+    changes = {
+        total: F(total) + sign * value
+        for total, value in sums.items() if value
+    }
+    if changes:
+        changes['updated_at'] = timezone.now()
+    return changes
+
+
+def adjust_totals(recipes, sums, sign=1):
+    """Add sums to the totals of the recipes queryset."""
+    changes = total_changes(sums, sign)
+    if changes:
+        recipes.update(**changes)
+
+
+def computed_totals():
+    """Return expressions summing each recipe's ingridients afresh."""
+    through = Recipe.ingredients.through
+    return {
+        total: Coalesce(Subquery(
+            through.objects.filter(recipe=OuterRef('pk')).order_by().values(
+                'recipe').annotate(
+                    value=Sum(f'ingridient__{attr}')).values('value'),
+            output_field=IntegerField(),
+        ), 0)
+        for total, attr in ROLLUPS.items()
+    }
+
+
+def rebuild_totals(recipes):
+    """
+    Recompute the totals of the recipes queryset in one UPDATE.
+
+    updated_at is left alone, so a rebuild doesn't make delta sync
+    clients download every recipe again.
+    """
+    return recipes.update(**computed_totals())
@@ -0,0 +1,81 @@
+"""
+Precomputed OpenAPI schema artifacts.
+
+The schema is generated once per code version and written to
+SCHEMA_ROOT, so serving it doesn't introspect every serializer.
+"""
+import hashlib
+import os
+import tempfile
+from functools import lru_cache
+from pathlib import Path
+
+from django.conf import settings
+from drf_spectacular.renderers import OpenApiJsonRenderer, OpenApiYamlRenderer
+from drf_spectacular.settings import spectacular_settings
+
+RENDERERS = {
+    'yaml': OpenApiYamlRenderer,
+    'json': OpenApiJsonRenderer,
+}
+
+
+@lru_cache(maxsize=None)
+def code_version():
+    """
+    Return the deployed code version.
+
+    Uses APP_VERSION when set (e.g. the git commit deployed), otherwise
+    a digest of the project's Python sources.
+    """
+    if settings.APP_VERSION:
+        return settings.APP_VERSION
+    digest = hashlib.sha256()
+    base_dir = Path(settings.BASE_DIR)
+    for path in sorted(base_dir.rglob('*.py')):
+        digest.update(str(path.relative_to(base_dir)).encode())
+        digest.update(path.read_bytes())
+    return digest.hexdigest()[:12]
+
+
+def schema_path(fmt, version=None):
+    """Return the artifact path for a format and code version."""
+    version = version or code_version()
+    return Path(settings.SCHEMA_ROOT) / f'schema-{version}.{fmt}'
+
+
+def generate_schema(fmt):
+    """Generate and render the schema, returning bytes."""
+    generator = spectacular_settings.DEFAULT_GENERATOR_CLASS()
+    schema = generator.get_schema(
+        request=None, public=spectacular_settings.SERVE_PUBLIC)
+    return RENDERERS[fmt]().render(schema, renderer_context={})
+
+
+def write_schema(fmt, content=None):
+    """Write the schema artifact atomically and return its path."""
+    path = schema_path(fmt)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if content is None:
+        content = generate_schema(fmt)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix='.schema-')
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            tmp.write(content)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return path
+
+
+def prune_schemas():
+    """Delete artifacts left behind by other code versions."""
+    root = Path(settings.SCHEMA_ROOT)
+    current = {schema_path(fmt).name for fmt in RENDERERS}
+    removed = []
+    for path in root.glob('schema-*.*'):
+        if path.name not in current:
+            path.unlink()
+            removed.append(path)
+    return removed
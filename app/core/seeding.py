@@ -0,0 +1,247 @@
+"""
+Deterministic synthetic data at production scale
+"""
+import csv
+import io
+import random
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connections
+from django.db.models import Max
+from django.utils import timezone
+
+from core.models import Ingridient, Recipe, Tag, User
+
+WORDS = (
+    'chicken beef lamb tofu rice noodle bean lentil tomato onion garlic '
+    'pepper potato carrot mushroom spinach cheese butter cream lemon lime '
+    'ginger chili basil mint yogurt egg flour sugar honey apple plov somsa '
+    'lagman manti shurpa naryn samsa chuchvara dimlama kabob'
+).split()
+
+
+def long_tail_counts(total, buckets, skew, rng):
+    """
+    Split total into buckets Zipf-style: bucket i gets a share
+    proportional to 1 / (i + 1) ** skew, shuffled with rng.
+    """
+    weights = [1 / (i + 1) ** skew for i in range(buckets)]
+    scale = total / sum(weights)
+    counts = [int(weight * scale) for weight in weights]
+    for i in range(total - sum(counts)):
+        counts[i % buckets] += 1
+    rng.shuffle(counts)
+    return counts
+
+
+def pick(rng, population, count, bias):
+    """
+    Pick up to count distinct items, favouring the start of population
+    more strongly the larger bias is.
+    """
+    if not population:
+        return []
+    size = len(population)
+    return list({
+        population[int(size * rng.random() ** bias)] for _ in range(count)
+    })
+
+
+class CopyWriter:
+    """Write rows with COPY ... FROM STDIN in CSV format (PostgreSQL)."""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def write(self, model, fields, rows):
+        qn = self.connection.ops.quote_name
+        columns = ', '.join(
+            qn(model._meta.get_field(field).column) for field in fields)
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+        with self.connection.cursor() as cursor:
+            cursor.cursor.copy_expert(
+                f'COPY {qn(model._meta.db_table)} ({columns}) '
+                f'FROM STDIN WITH (FORMAT csv)',
+                buffer,
+            )
+
+
+class BulkCreateWriter:
+    """Write rows with chunked bulk_create on any backend."""
+
+    def __init__(self, connection, batch_size=None):
+        self.connection = connection
+        self.batch_size = batch_size
+
+    def write(self, model, fields, rows):
+        model.objects.using(self.connection.alias).bulk_create(
+            [model(**dict(zip(fields, row))) for row in rows],
+            batch_size=self.batch_size,
+        )
+
+
+class Seeder:
+    """
+    Generate users with a long tail of recipes, tags and ingridients.
+
+    Rows get explicit ids following the current maximum, so recipes and
+    through rows can reference them without reading anything back.
+    Sequences are reset once at the end. The same seed always produces
+    the same data.
+    """
+
+    USER_FIELDS = ('id', 'email', 'name', 'password',
+                   'is_active', 'is_staff', 'is_superuser', 'date_joined')
+    NAMED_FIELDS = ('id', 'user_id', 'name', 'updated_at')
+    RECIPE_FIELDS = ('id', 'user_id', 'title', 'description',
+                     'time_minutes', 'price', 'link', 'updated_at',
+                     'total_cost', 'total_calories')
+
+    def __init__(self, users, recipes, tags, ingridients,
+                 tags_per_recipe=3, ingridients_per_recipe=8, skew=1.1,
+                 seed=0, chunk_size=10000, using='default', method='auto',
+                 log=None):
+        self.users = users
+        self.recipes = recipes
+        self.tags = tags
+        self.ingridients = ingridients
+        self.tags_per_recipe = tags_per_recipe
+        self.ingridients_per_recipe = ingridients_per_recipe
+        self.skew = skew
+        self.rng = random.Random(seed)
+        self.chunk_size = chunk_size
+        self.connection = connections[using]
+        if method == 'auto':
+            method = 'copy' if self.connection.vendor == 'postgresql' \
+                else 'bulk'
+        if method == 'copy':
+            self.writer = CopyWriter(self.connection)
+        else:
+            self.writer = BulkCreateWriter(self.connection)
+        self.method = method
+        self.log = log or (lambda msg: None)
+        self.counts = {}
+        self.now = timezone.now()
+        self.password = make_password(None)
+
+    def next_id(self, model):
+        return (model.objects.using(self.connection.alias).aggregate(
+            max_id=Max('id'))['max_id'] or 0) + 1
+
+    def flush(self, model, fields, rows, label):
+        if rows:
+            self.writer.write(model, fields, rows)
+            self.counts[label] = self.counts.get(label, 0) + len(rows)
+            rows.clear()
+
+    def run(self):
+        """Insert everything and return {table label: rows inserted}."""
+        start = time.perf_counter()
+        user_ids = self.seed_users()
+        tags = self.seed_named(Tag, 'tags', user_ids, self.tags)
+        ingridients = self.seed_named(
+            Ingridient, 'ingridients', user_ids, self.ingridients)
+        self.seed_recipes(user_ids, tags, ingridients)
+        self.reset_sequences()
+        elapsed = time.perf_counter() - start
+        total = sum(self.counts.values())
+        self.log(f'Inserted {total} rows in {elapsed:.1f}s '
+                 f'({total / elapsed * 60:,.0f} rows/min, {self.method}).')
+        return self.counts
+
+    def seed_users(self):
+        first = self.next_id(User)
+        user_ids = range(first, first + self.users)
+        rows = []
+        for user_id in user_ids:
+            rows.append((
+                user_id, f'seed-{user_id}@example.com', f'Seed user {user_id}',
+                self.password, True, False, False, self.now,
+            ))
+            if len(rows) >= self.chunk_size:
+                self.flush(User, self.USER_FIELDS, rows, 'users')
+        self.flush(User, self.USER_FIELDS, rows, 'users')
+        self.log(f'Users: {self.counts.get("users", 0)}')
+        return list(user_ids)
+
+    def seed_named(self, model, label, user_ids, total):
+        """
+        Give each user a long-tailed number of tags or ingridients.
+
+        Names come from a shared vocabulary in popularity order, so the
+        common names appear for most users and rare ones only for users
+        with many. Returns {user id: [ids]}.
+        """
+        next_id = self.next_id(model)
+        counts = long_tail_counts(total, len(user_ids), self.skew, self.rng)
+        owned = {}
+        rows = []
+        for user_id, count in zip(user_ids, counts):
+            ids = list(range(next_id, next_id + count))
+            next_id += count
+            owned[user_id] = ids
+            for rank, pk in enumerate(ids):
+                word = WORDS[rank % len(WORDS)]
+                rows.append((pk, user_id, f'{word} {rank}', self.now))
+            if len(rows) >= self.chunk_size:
+                self.flush(model, self.NAMED_FIELDS, rows, label)
+        self.flush(model, self.NAMED_FIELDS, rows, label)
+        self.log(f'{label.capitalize()}: {self.counts.get(label, 0)}')
+        return owned
+
+    def seed_recipes(self, user_ids, tags, ingridients):
+        """Insert recipes with their through rows, chunk by chunk."""
+        tag_through = Recipe.tags.through
+        ingridient_through = Recipe.ingredients.through
+        next_id = self.next_id(Recipe)
+        counts = long_tail_counts(
+            self.recipes, len(user_ids), self.skew, self.rng)
+        rng = self.rng
+        # Popular tags, ingridients and words are picked more often.
+        bias = 1 + self.skew
+        recipes, recipe_tags, recipe_ingridients = [], [], []
+
+        def flush():
+            self.flush(Recipe, self.RECIPE_FIELDS, recipes, 'recipes')
+            self.flush(tag_through, ('recipe_id', 'tag_id'),
+                       recipe_tags, 'recipe tags')
+            self.flush(ingridient_through, ('recipe_id', 'ingridient_id'),
+                       recipe_ingridients, 'recipe ingridients')
+
+        for user_id, count in zip(user_ids, counts):
+            user_tags = tags[user_id]
+            user_ingridients = ingridients[user_id]
+            for recipe_id in range(next_id, next_id + count):
+                word = WORDS[int(len(WORDS) * rng.random() ** bias)]
+                recipes.append((
+                    recipe_id, user_id, f'{word} recipe {recipe_id}',
+                    f'How to cook {word}.', rng.randint(5, 240),
+                    rng.randint(100, 50000),
+                    f'https://example.com/recipes/{recipe_id}', self.now,
+                    0, 0,
+                ))
+                for tag_id in pick(rng, user_tags, rng.randint(
+                        0, 2 * self.tags_per_recipe), bias):
+                    recipe_tags.append((recipe_id, tag_id))
+                for ingridient_id in pick(rng, user_ingridients, rng.randint(
+                        1, 2 * self.ingridients_per_recipe), bias):
+                    recipe_ingridients.append((recipe_id, ingridient_id))
+            next_id += count
+            if len(recipes) >= self.chunk_size:
+                flush()
+                self.log(f'Recipes: {self.counts["recipes"]}')
+        flush()
+        self.log(f'Recipes: {self.counts.get("recipes", 0)}')
+
+    def reset_sequences(self):
+        """Move id sequences past the explicit ids we inserted."""
+        models = [User, Tag, Ingridient, Recipe]
+        statements = self.connection.ops.sequence_reset_sql(
+            no_style(), models)
+        with self.connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
@@ -0,0 +1,148 @@
+"""
+Routing of per-user data to database shards
+
+Every recipe, tag and ingridient query is scoped to one user, so their
+rows live on a single shard per user. User.shard pins the shard; users
+created before sharding have none and live on the first shard. Users,
+tokens and everything else stay on GLOBAL_DATABASE.
+
+Querysets built without an instance carry no hint about the user, so
+code working on per-user data passes db_for_user(user) to .using().
+"""
+import zlib
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connections
+
+SHARDED_MODELS = {
+    'core.recipe',
+    'core.recipe_tags',
+    'core.recipe_ingredients',
+    'core.tag',
+    'core.ingridient',
+    'core.tombstone',
+    'core.archivedrecipe',
+    'core.recipeband',
+}
+
+
+def is_sharded(model):
+    return model._meta.label_lower in SHARDED_MODELS
+
+
+class ShardMap:
+    """Map users to the database alias holding their data."""
+
+    @property
+    def shards(self):
+        return settings.DATABASE_SHARDS
+
+    def assign(self, email):
+        """Return the shard for a new user, spread by email hash."""
+        checksum = zlib.crc32(email.lower().encode())
+        return self.shards[checksum % len(self.shards)]
+
+    def shard_for(self, user):
+        return user.shard or self.shards[0]
+
+    def shard_for_id(self, user_id):
+        shard = get_user_model().objects.using(
+            settings.GLOBAL_DATABASE,
+        ).filter(pk=user_id).values_list('shard', flat=True).first()
+        return shard or self.shards[0]
+
+
+shard_map = ShardMap()
+
+
+def db_for_user(user):
+    """Return the database alias holding user's recipes."""
+    return shard_map.shard_for(user)
+
+
+class ShardRouter:
+    """
+    Send sharded models to the shard of the user in the instance hint,
+    and everything else to GLOBAL_DATABASE.
+    """
+
+    def db_for_model(self, model, instance=None):
+        if not is_sharded(model):
+            return settings.GLOBAL_DATABASE
+        if instance is None:
+            return None
+        if isinstance(instance, get_user_model()):
+            return shard_map.shard_for(instance)
+        if not is_sharded(type(instance)):
+            return None
+        if instance._state.db:
+            return instance._state.db
+        user = instance._state.fields_cache.get('user')
+        if user is not None:
+            return shard_map.shard_for(user)
+        if getattr(instance, 'user_id', None) is not None:
+            return shard_map.shard_for_id(instance.user_id)
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self.db_for_model(model, hints.get('instance'))
+
+    def db_for_write(self, model, **hints):
+        return self.db_for_model(model, hints.get('instance'))
+
+    def allow_relation(self, obj1, obj2, **hints):
+        """Allow links to global rows; sharded rows stay on one shard."""
+        if not (is_sharded(type(obj1)) and is_sharded(type(obj2))):
+            return True
+        return obj1._state.db == obj2._state.db
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        """
+        Create every table on every database, but run data migrations
+        only on the global one: the router would send their queries
+        there anyway.
+        """
+        if model_name is None and db != settings.GLOBAL_DATABASE:
+            return False
+        return None
+
+
+def reserve_id_block(using):
+    """
+    Start the id sequences of sharded tables on shard using at its
+    block, index * SHARD_ID_BLOCK, unless they are past it already.
+    """
+    if using not in settings.DATABASE_SHARDS:
+        return
+    start = settings.DATABASE_SHARDS.index(using) * settings.SHARD_ID_BLOCK
+    if not start:
+        return
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    tables = [
+        model._meta.db_table for model in apps.get_models(
+            include_auto_created=True) if is_sharded(model)
+    ]
+    with connection.cursor() as cursor:
+        for table in tables:
+            if connection.vendor == 'postgresql':
+                cursor.execute(
+                    f"SELECT setval(pg_get_serial_sequence(%s, 'id'), "
+                    f"GREATEST(MAX(id) + 1, %s), false) FROM {qn(table)}",
+                    [table, start],
+                )
+            elif connection.vendor == 'sqlite':
+                cursor.execute(
+                    'UPDATE sqlite_sequence SET seq = MAX(seq, %s) '
+                    'WHERE name = %s', [start - 1, table])
+                if not cursor.rowcount:
+                    cursor.execute(
+                        'INSERT INTO sqlite_sequence (name, seq) '
+                        'VALUES (%s, %s)', [table, start - 1])
+
+
+def reserve_id_blocks(sender, using, **kwargs):
+    """post_migrate handler reserving the id block of each shard."""
+    reserve_id_block(using)
@@ -0,0 +1,191 @@
+"""
+Signal handlers keeping delta sync data, recipe totals and the
+similarity index up to date, and publishing change events
+"""
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from core.events import publish
+from core.models import Ingridient, Recipe, Tag, Tombstone
+from core.rollup import (
+    ROLLUPS,
+    adjust_totals,
+    ingridient_sums,
+    ingridient_values,
+    total_changes,
+)
+from core.similarity import index_recipes
+
+TOMBSTONE_KINDS = {
+    Recipe: Tombstone.RECIPE,
+    Tag: Tombstone.TAG,
+    Ingridient: Tombstone.INGRIDIENT,
+}
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingridient)
+def record_tombstone(sender, instance, using, **kwargs):
+    """Remember deleted rows so sync clients can drop them."""
+    Tombstone.objects.using(using).create(
+        user_id=instance.user_id,
+        kind=TOMBSTONE_KINDS[sender],
+        object_id=instance.pk,
+    )
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingridient)
+def publish_change(sender, instance, created, raw, using, **kwargs):
+    """Tell the user's live streams about a saved row."""
+    if raw:
+        return
+    publish(instance.user_id, TOMBSTONE_KINDS[sender],
+            'created' if created else 'updated', instance.pk, using)
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingridient)
+def publish_deletion(sender, instance, using, **kwargs):
+    """Tell the user's live streams about a deleted row."""
+    publish(instance.user_id, TOMBSTONE_KINDS[sender], 'deleted',
+            instance.pk, using)
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingridient)
+def touch_linked_recipes(sender, instance, using, **kwargs):
+    """Mark recipes changed when a tag or ingridient they use goes."""
+    field = 'tags' if sender is Tag else 'ingredients'
+    changes = {'updated_at': timezone.now()}
+    if sender is Ingridient:
+        changes.update(total_changes(ingridient_values(instance), -1))
+    Recipe.objects.using(using).filter(**{field: instance}).update(**changes)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def touch_recipes_on_m2m_change(sender, instance, action, reverse, model,
+                                pk_set, using, **kwargs):
+    """Mark recipes changed when their tags or ingridients change."""
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    now = timezone.now()
+    recipes = Recipe.objects.using(using)
+    if not reverse:
+        recipes.filter(pk=instance.pk).update(updated_at=now)
+    elif action == 'pre_clear':
+        field = 'tags' if sender is Recipe.tags.through else 'ingredients'
+        recipes.filter(**{field: instance}).update(updated_at=now)
+    elif pk_set:
+        recipes.filter(pk__in=pk_set).update(updated_at=now)
+
+
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def roll_up_ingridient_links(sender, instance, action, reverse, pk_set,
+                             using, **kwargs):
+    """
+    Adjust recipe totals as ingridients are linked and unlinked.
+
+    Removals are counted before the links go, and only for links that
+    exist, since pk_set holds whatever ids were passed to remove().
+    """
+    if action == 'post_add' and pk_set:
+        sign = 1
+    elif action == 'pre_remove' and pk_set or action == 'pre_clear':
+        sign = -1
+    else:
+        return
+    recipes = Recipe.objects.using(using)
+    if reverse:
+        recipes = recipes.filter(ingredients=instance)
+        if pk_set:
+            recipes = recipes.filter(pk__in=pk_set)
+        adjust_totals(recipes, ingridient_values(instance), sign)
+    else:
+        linked = Ingridient.objects.using(using).filter(recipe=instance)
+        if pk_set:
+            linked = linked.filter(pk__in=pk_set)
+        adjust_totals(
+            recipes.filter(pk=instance.pk), ingridient_sums(linked), sign)
+
+
+@receiver(pre_save, sender=Ingridient)
+def remember_ingridient_values(sender, instance, raw, using, **kwargs):
+    """Keep an ingridient's stored cost and calories to diff on save."""
+    if raw or instance._state.adding:
+        return
+    loaded = getattr(instance, '_loaded_values', {})
+    if not all(attr in loaded for attr in ROLLUPS.values()):
+        loaded = sender.objects.using(using).filter(pk=instance.pk).values(
+            *ROLLUPS.values()).first() or {}
+    instance._rollup_before = {
+        total: loaded.get(attr) or 0 for total, attr in ROLLUPS.items()}
+
+
+@receiver(post_save, sender=Ingridient)
+def roll_up_ingridient_change(sender, instance, created, raw, using,
+                              **kwargs):
+    """Move the totals of recipes using an ingridient whose cost changed."""
+    before = instance.__dict__.pop('_rollup_before', None)
+    if created or raw or before is None:
+        return
+    after = ingridient_values(instance)
+    adjust_totals(
+        Recipe.objects.using(using).filter(ingredients=instance),
+        {total: after[total] - before[total] for total in after},
+    )
+    instance._loaded_values = {
+        attr: getattr(instance, attr) for attr in ROLLUPS.values()}
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def index_recipes_on_m2m_change(sender, instance, action, reverse, model,
+                                pk_set, using, **kwargs):
+    """Recompute the similarity bands of recipes whose links changed."""
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            index_recipes([instance.pk], using)
+    elif action == 'pre_clear':
+        remember_linked_recipes(model, instance, using)
+    elif action == 'post_clear':
+        index_linked_recipes(model, instance, using)
+    elif action in ('post_add', 'post_remove') and pk_set:
+        index_recipes(pk_set, using)
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingridient)
+def remember_linked_recipes(sender, instance, using, **kwargs):
+    """Note the recipes using a tag or ingridient about to be unlinked."""
+    field = 'tags' if isinstance(instance, Tag) else 'ingredients'
+    instance._reindex_recipes = list(Recipe.objects.using(using).filter(
+        **{field: instance}).values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingridient)
+def index_linked_recipes(sender, instance, using, **kwargs):
+    """
+    Recompute the similarity bands of recipes that lost a link once the
+    transaction commits, so the delete doesn't wait for every recipe of
+    a widely used tag to be rehashed.
+    """
+    recipe_ids = instance.__dict__.pop('_reindex_recipes', ())
+    if recipe_ids:
+        transaction.on_commit(
+            partial(index_recipes, recipe_ids, using), using=using)
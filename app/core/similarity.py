@@ -0,0 +1,129 @@
+"""
+Similar recipes by Jaccard similarity of their tags and ingridients
+
+Comparing a recipe against every other recipe of the user doesn't scale
+to large libraries. Instead each recipe gets a MinHash signature of its
+tag and ingridient set, cut into BANDS bands of ROWS values. Recipes
+sharing a band bucket are likely to be similar (two recipes with
+Jaccard similarity s share at least one band with probability
+1 - (1 - s ** ROWS) ** BANDS, about 0.87 at s = 0.25), so a lookup
+reads the buckets of one recipe from an index and ranks only the
+recipes found there by their exact similarity.
+
+The buckets are stored as RecipeBand rows and recomputed by
+index_recipes whenever a recipe's tags or ingridients change. Changes
+reaching many recipes at once, like deleting a tag, are reindexed once
+the transaction commits.
+"""
+import hashlib
+import random
+from collections import defaultdict
+
+from django.db.models import Count
+
+from core.models import Recipe, RecipeBand
+
+BANDS = 32
+ROWS = 2
+# Recipes ranked exactly per lookup, taken by the number of shared bands.
+MAX_CANDIDATES = 500
+# Recipes indexed per query, well within SQLite's variable limit.
+INDEX_BATCH_SIZE = 500
+
+_PRIME = (1 << 61) - 1
+_rng = random.Random(20240114)
+_HASHES = [
+    (_rng.randrange(1, _PRIME), _rng.randrange(_PRIME))
+    for _ in range(BANDS * ROWS)
+]
+
+
+def recipe_features(recipe_ids, using):
+    """
+    Return {recipe id: set of features}, a feature being 2 * tag id for
+    tags and 2 * ingridient id + 1 for ingridients.
+    """
+    features = defaultdict(set)
+    for field, kind in (('tag_id', 0), ('ingridient_id', 1)):
+        through = Recipe.tags.through if kind == 0 \
+            else Recipe.ingredients.through
+        for recipe_id, linked_id in through.objects.using(using).filter(
+            recipe_id__in=recipe_ids,
+        ).values_list('recipe_id', field):
+            features[recipe_id].add(2 * linked_id + kind)
+    return features
+
+
+def signature(features):
+    """Return the MinHash signature of a non-empty feature set."""
+    return [
+        min((a * feature + b) % _PRIME for feature in features)
+        for a, b in _HASHES
+    ]
+
+
+def buckets(features):
+    """Return the band buckets of a feature set, none if it's empty."""
+    if not features:
+        return []
+    values = signature(features)
+    result = []
+    for band in range(BANDS):
+        key = repr((band, values[band * ROWS:(band + 1) * ROWS]))
+        digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+        result.append(int.from_bytes(digest, 'big', signed=True))
+    return result
+
+
+def jaccard(first, second):
+    if not first or not second:
+        return 0.0
+    return len(first & second) / len(first | second)
+
+
+def index_recipes(recipe_ids, using, batch_size=INDEX_BATCH_SIZE):
+    """
+    Recompute the band buckets of recipe_ids from their links,
+    batch_size recipes at a time.
+    """
+    recipe_ids = list(recipe_ids)
+    for start in range(0, len(recipe_ids), batch_size):
+        _index_batch(recipe_ids[start:start + batch_size], using)
+
+
+def _index_batch(recipe_ids, using):
+    features = recipe_features(recipe_ids, using)
+    owners = Recipe.objects.using(using).filter(
+        pk__in=recipe_ids).values_list('pk', 'user_id')
+    bands = RecipeBand.objects.using(using)
+    bands.filter(recipe_id__in=recipe_ids).delete()
+    bands.bulk_create([
+        RecipeBand(recipe_id=recipe_id, user_id=user_id, bucket=bucket)
+        for recipe_id, user_id in owners
+        for bucket in buckets(features.get(recipe_id))
+    ])
+
+
+def similar_recipes(recipe, limit=10):
+    """
+    Return [(recipe id, similarity)] for the recipes of recipe's user
+    most similar to it, best first.
+    """
+    using = recipe._state.db
+    target = recipe_features([recipe.pk], using).get(recipe.pk)
+    if not target:
+        return []
+    candidates = list(RecipeBand.objects.using(using).filter(
+        user_id=recipe.user_id,
+        bucket__in=buckets(target),
+    ).exclude(recipe_id=recipe.pk).values('recipe_id').annotate(
+        shared=Count('id'),
+    ).order_by('-shared', '-recipe_id').values_list(
+        'recipe_id', flat=True)[:MAX_CANDIDATES])
+    features = recipe_features(candidates, using)
+    scores = [
+        (recipe_id, jaccard(target, features.get(recipe_id)))
+        for recipe_id in candidates
+    ]
+    scores.sort(key=lambda score: (-score[1], -score[0]))
+    return [score for score in scores if score[1] > 0][:limit]
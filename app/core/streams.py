@@ -0,0 +1,122 @@
+"""
+Server-sent events stream of the authenticated user's changes
+
+A plain ASGI app, mounted at CHANGE_EVENTS_PATH by app.asgi, so idle
+streams cost a subscription and a coroutine rather than a worker
+thread. Each event names the kind and id of the row and whether it was
+created, updated or deleted; clients fetch the row or run a delta sync.
+The token is checked again every CHANGE_EVENTS_HEARTBEAT seconds.
+"""
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from rest_framework.exceptions import AuthenticationFailed
+
+from core.authentication import ExpiringTokenAuthentication
+from core.events import broker
+
+# Milliseconds clients wait before reconnecting a dropped stream.
+RETRY = 5000
+
+STREAM_HEADERS = [
+    (b'content-type', b'text/event-stream'),
+    (b'cache-control', b'no-cache'),
+    # Stops nginx from buffering the stream.
+    (b'x-accel-buffering', b'no'),
+]
+
+
+@sync_to_async
+def authenticate(authorization):
+    """Return the user of an Authorization token header, if valid."""
+    auth = ExpiringTokenAuthentication()
+    keyword, _, key = authorization.decode('latin-1').partition(' ')
+    if keyword != auth.keyword or not key.strip():
+        return None
+    close_old_connections()
+    try:
+        user, _ = auth.authenticate_credentials(key.strip())
+    except AuthenticationFailed:
+        return None
+    finally:
+        close_old_connections()
+    return user
+
+
+def format_event(event):
+    """Return event encoded as a server-sent event."""
+    data = json.dumps(
+        {key: value for key, value in event.items() if key != 'kind'},
+        separators=(',', ':'))
+    return f'event: {event["kind"]}\ndata: {data}\n\n'.encode()
+
+
+async def send_json(send, status, data):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json')],
+    })
+    await send({'type': 'http.response.body',
+                'body': json.dumps(data).encode()})
+
+
+async def wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def event_stream(scope, receive, send):
+    """Stream change events to the authenticated user until they leave."""
+    if scope['method'] != 'GET':
+        await send_json(send, 405, {
+            'detail': f'Method "{scope["method"]}" not allowed.'})
+        return
+    authorization = dict(scope['headers']).get(b'authorization', b'')
+    user = await authenticate(authorization)
+    if user is None:
+        await send_json(send, 401, {
+            'detail': 'Authentication credentials were not provided '
+                      'or are invalid.'})
+        return
+
+    subscription = broker.subscribe(user.pk)
+    disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+    try:
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': STREAM_HEADERS})
+        await send({'type': 'http.response.body',
+                    'body': f'retry: {RETRY}\n\n'.encode(),
+                    'more_body': True})
+        loop = asyncio.get_running_loop()
+        recheck = loop.time() + settings.CHANGE_EVENTS_HEARTBEAT
+        while True:
+            if loop.time() >= recheck:
+                # Streams outlive their token; end them once it expires
+                # or is rotated, and the reconnect gets a 401.
+                if await authenticate(authorization) is None:
+                    await send({'type': 'http.response.body', 'body': b''})
+                    return
+                recheck = loop.time() + settings.CHANGE_EVENTS_HEARTBEAT
+            event = asyncio.ensure_future(subscription.get())
+            done, _ = await asyncio.wait(
+                {event, disconnected},
+                timeout=settings.CHANGE_EVENTS_HEARTBEAT,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if event in done:
+                body = format_event(event.result())
+            else:
+                event.cancel()
+                if disconnected in done:
+                    return
+                # Comments keep proxies from closing idle streams.
+                body = b': ping\n\n'
+            await send({'type': 'http.response.body', 'body': body,
+                        'more_body': True})
+    finally:
+        disconnected.cancel()
+        broker.unsubscribe(subscription)
@@ -2,10 +2,18 @@
 Tests model for admin modifications
 """
 
-from django.test import TestCase
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
+from django.db import connection
 from django.urls import reverse
 from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from core import models
+from core.admin import EstimatedCountPaginator
+from core.sharding import reserve_id_block
 
 
 class AdminSiteTests(TestCase):
@@ -56,3 +64,167 @@ class AdminSiteTests(TestCase):
         res = self.client.get(url)
 
         self.assertEqual(res.status_code, 200)
+
+
+class LargeTableAdminTests(TestCase):
+    """
+    Tests for the recipe, tag and ingredient admin changelists
+    """
+
+    def setUp(self):
+        """
+        Setup for tests
+        """
+        self.admin_user = get_user_model().objects.create_superuser(
+            email='admin@example.com',
+            password='password123'
+        )
+        self.client.force_login(self.admin_user)
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='password123',
+            name='Test user full name'
+        )
+
+    def create_recipes(self, user, count):
+        for i in range(count):
+            models.Recipe.objects.create(
+                user=user,
+                title=f'Recipe {i}',
+                time_minutes=10,
+                price=500,
+            )
+
+    def test_recipe_changelist_queries_constant(self):
+        """
+        Test that the changelist doesn't query once per row
+        """
+        url = reverse('admin:core_recipe_changelist')
+        self.create_recipes(self.user, 2)
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(url)
+
+        self.create_recipes(self.user, 20)
+        with CaptureQueriesContext(connection) as many:
+            res = self.client.get(url)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(few), len(many))
+
+    def test_recipe_changelist_user_filter(self):
+        """
+        Test filtering recipes by user with the autocomplete filter
+        """
+        self.create_recipes(self.user, 1)
+        self.create_recipes(self.admin_user, 1)
+        url = reverse('admin:core_recipe_changelist')
+
+        res = self.client.get(url, {'user__id__exact': self.user.id})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.context['cl'].result_count, 1)
+        self.assertContains(res, 'autocomplete-filter')
+
+    def test_user_autocomplete(self):
+        """
+        Test that users can be searched by the autocomplete view
+        """
+        res = self.client.get(reverse('admin:autocomplete'), {
+            'term': 'user@',
+            'app_label': 'core',
+            'model_name': 'recipe',
+            'field_name': 'user',
+        })
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(
+            [item['id'] for item in res.json()['results']],
+            [str(self.user.id)],
+        )
+
+    def test_tag_and_ingridient_changelists(self):
+        """
+        Test that the tag and ingredient changelists work
+        """
+        models.Tag.objects.create(user=self.user, name='Vegan')
+        models.Ingridient.objects.create(user=self.user, name='Salt')
+
+        for name in ('tag', 'ingridient'):
+            url = reverse(f'admin:core_{name}_changelist')
+            res = self.client.get(url, {'q': 'a'})
+            self.assertEqual(res.status_code, 200)
+
+    def test_estimated_count_used_for_large_tables(self):
+        """
+        Test that unfiltered lists use the row estimate
+        """
+        queryset = models.Recipe.objects.order_by('-id')
+        with patch.object(EstimatedCountPaginator, 'estimated_count',
+                          return_value=5_000_000):
+            paginator = EstimatedCountPaginator(queryset, 100)
+            self.assertEqual(paginator.count, 5_000_000)
+
+            filtered = EstimatedCountPaginator(
+                queryset.filter(user=self.user), 100)
+            self.assertEqual(filtered.count, 0)
+
+
+@override_settings(DATABASE_SHARDS=['default', 'shard1'],
+                   ACCOUNT_DELETION_ASYNC=False)
+class UserAdminDeletionTests(TestCase):
+    """
+    Tests for deleting users from the admin
+    """
+    databases = {'default', 'shard1'}
+
+    def setUp(self):
+        """
+        Setup for tests
+        """
+        reserve_id_block('shard1')
+        self.admin_user = get_user_model().objects.create_superuser(
+            email='admin@example.com',
+            password='password123'
+        )
+        self.client.force_login(self.admin_user)
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='password123',
+            shard='shard1',
+        )
+        models.Recipe.objects.using('shard1').create(
+            user=self.user, title='Plov', time_minutes=90, price=10)
+
+    def assertDeleted(self, user_id):
+        self.assertFalse(
+            get_user_model().objects.filter(pk=user_id).exists())
+        self.assertFalse(models.Recipe.objects.using('shard1').filter(
+            user_id=user_id).exists())
+
+    def test_delete_view_deletes_shard_data(self):
+        """
+        Test that deleting a user removes their rows on their shard
+        """
+        url = reverse('admin:core_user_delete', args=[self.user.id])
+        res = self.client.get(url)
+        self.assertContains(res, self.user.email)
+
+        res = self.client.post(url, {'post': 'yes'})
+
+        self.assertEqual(res.status_code, 302)
+        self.assertDeleted(self.user.id)
+
+    def test_delete_action_deletes_shard_data(self):
+        """
+        Test that the delete selected action goes through the same path
+        """
+        url = reverse('admin:core_user_changelist')
+        res = self.client.post(url, {
+            'action': 'delete_selected',
+            'post': 'yes',
+            '_selected_action': [self.user.id],
+        })
+
+        self.assertEqual(res.status_code, 302)
+        self.assertDeleted(self.user.id)
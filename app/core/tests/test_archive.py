@@ -0,0 +1,204 @@
+"""
+Tests for the cold recipe archive
+"""
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.archive import (
+    archive_user,
+    inactive_users,
+    restore_batches,
+    restore_user,
+)
+from core.deletion import delete_user
+from core.models import (
+    ArchivedRecipe,
+    AuthToken,
+    Ingridient,
+    Recipe,
+    Tag,
+    Tombstone,
+)
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def create_user(email='user@example.com'):
+    return get_user_model().objects.create_user(email, 'testpass123')
+
+
+def create_recipe(user, **params):
+    defaults = {'title': 'Recipe', 'time_minutes': 5, 'price': 100}
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class ArchiveTests(TestCase):
+    """Test moving recipes in and out of the archive"""
+
+    def setUp(self):
+        self.user = create_user()
+        self.tag = Tag.objects.create(user=self.user, name='Vegan')
+        self.ingridient = Ingridient.objects.create(
+            user=self.user, name='Salt')
+        self.recipes = [
+            create_recipe(self.user, title=f'Recipe {i}', link=f'link {i}')
+            for i in range(3)
+        ]
+        for recipe in self.recipes:
+            recipe.tags.add(self.tag)
+            recipe.ingredients.add(self.ingridient)
+        self.other_recipe = create_recipe(create_user('other@example.com'))
+
+    def archive(self, **kwargs):
+        return list(archive_user(self.user.pk, **kwargs))
+
+    def test_archive_moves_recipes(self):
+        """Test that recipes and their links leave the hot tables"""
+        batches = self.archive(batch_size=2)
+
+        self.assertEqual(batches, [2, 1])
+        self.assertFalse(Recipe.objects.filter(user=self.user).exists())
+        self.assertFalse(Recipe.tags.through.objects.exists())
+        self.assertEqual(ArchivedRecipe.objects.count(), 3)
+        self.assertFalse(Tombstone.objects.exists())
+        self.assertTrue(Recipe.objects.filter(
+            pk=self.other_recipe.pk).exists())
+        self.user.refresh_from_db()
+        self.assertIsNotNone(self.user.recipes_archived_at)
+
+    def test_restore_brings_recipes_back(self):
+        """Test that restored recipes keep their ids, fields and links"""
+        self.archive()
+        self.user.refresh_from_db()
+
+        restored = restore_user(self.user)
+
+        self.assertEqual(restored, 3)
+        self.assertIsNone(self.user.recipes_archived_at)
+        self.assertFalse(ArchivedRecipe.objects.exists())
+        for recipe in self.recipes:
+            restored_recipe = Recipe.objects.get(pk=recipe.pk)
+            self.assertEqual(restored_recipe.title, recipe.title)
+            self.assertEqual(restored_recipe.link, recipe.link)
+            self.assertEqual(list(restored_recipe.tags.all()), [self.tag])
+            self.assertEqual(
+                list(restored_recipe.ingredients.all()), [self.ingridient])
+
+    def test_restore_recomputes_totals(self):
+        """Test that ingridient changes while archived reach the totals"""
+        self.ingridient.cost = 10
+        self.ingridient.save()
+        self.archive()
+        self.ingridient.cost = 50
+        self.ingridient.save()
+        self.user.refresh_from_db()
+
+        restore_user(self.user)
+
+        for recipe in Recipe.objects.filter(user=self.user):
+            self.assertEqual(recipe.total_cost, 50)
+
+    def test_restore_drops_deleted_tags(self):
+        """Test that links to tags deleted meanwhile are skipped"""
+        self.archive()
+        self.tag.delete()
+        self.user.refresh_from_db()
+
+        restore_user(self.user)
+
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 3)
+        self.assertFalse(Recipe.tags.through.objects.exists())
+
+    def test_restore_during_archive_stops_it(self):
+        """Test that archiving stops once the user has come back"""
+        chunks = archive_user(self.user.pk, batch_size=1)
+        next(chunks)
+        self.user.refresh_from_db()
+        restore_user(self.user)
+
+        self.assertEqual(list(chunks), [])
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 3)
+        self.assertFalse(ArchivedRecipe.objects.exists())
+
+    def test_restore_in_batches(self):
+        """Test that each batch is restored and committed on its own"""
+        self.archive()
+        self.user.refresh_from_db()
+        batches = restore_batches(self.user, batch_size=2)
+
+        self.assertEqual(next(batches), 2)
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(ArchivedRecipe.objects.count(), 1)
+        self.user.refresh_from_db()
+        self.assertIsNotNone(self.user.recipes_archived_at)
+
+        self.assertEqual(list(batches), [1])
+        self.assertEqual(
+            set(Recipe.objects.filter(user=self.user)), set(self.recipes))
+        self.user.refresh_from_db()
+        self.assertIsNone(self.user.recipes_archived_at)
+
+    def test_restore_batch_stops_archive(self):
+        """Test that archiving stops once a restore batch has run"""
+        chunks = archive_user(self.user.pk, batch_size=1)
+        next(chunks)
+        next(chunks)
+        self.user.refresh_from_db()
+        next(restore_batches(self.user, batch_size=1))
+
+        self.assertEqual(list(chunks), [])
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(ArchivedRecipe.objects.count(), 1)
+
+    def test_authenticated_request_restores(self):
+        """Test that an archived user sees their recipes on the API"""
+        token = AuthToken.objects.create(user=self.user)
+        self.archive()
+        client = APIClient()
+
+        res = client.get(
+            RECIPES_URL, HTTP_AUTHORIZATION=f'Token {token.key}')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data), 3)
+
+    def test_inactive_users(self):
+        """Test which users are picked for archiving"""
+        now = timezone.now()
+        recent = create_user('recent@example.com')
+        create_recipe(recent)
+        AuthToken.objects.create(user=recent, last_used=now)
+        stale = create_user('stale@example.com')
+        create_recipe(stale)
+        AuthToken.objects.create(
+            user=stale, last_used=now - timedelta(days=365))
+        get_user_model().objects.update(date_joined=now - timedelta(days=365))
+        # Joined recently and never logged in, e.g. created in the admin.
+        create_recipe(create_user('new@example.com'))
+
+        users = set(inactive_users(now).values_list('email', flat=True))
+
+        self.assertEqual(users, {
+            'user@example.com', 'other@example.com', 'stale@example.com'})
+
+    def test_inactive_users_unknown_join_date(self):
+        """Test that users without a join date are not archived"""
+        get_user_model().objects.update(date_joined=None)
+
+        self.assertFalse(inactive_users().exists())
+
+    def test_delete_user_removes_archive(self):
+        """Test that account deletion covers archived recipes"""
+        self.archive()
+
+        for _ in delete_user(self.user.pk):
+            pass
+
+        self.assertFalse(ArchivedRecipe.objects.exists())
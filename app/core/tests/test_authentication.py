@@ -0,0 +1,147 @@
+"""
+Tests for expiring token authentication
+"""
+from datetime import timedelta
+from importlib import import_module
+from unittest.mock import patch
+
+from django.apps import apps
+
+from django.contrib.auth import get_user_model
+from django.db import DatabaseError
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+
+from core.authentication import ExpiringTokenAuthentication
+from core.models import AuthToken
+
+
+@override_settings(
+    AUTH_TOKEN_TTL=timedelta(days=30),
+    AUTH_TOKEN_IDLE_TTL=timedelta(days=7),
+    AUTH_TOKEN_LAST_USED_INTERVAL=timedelta(minutes=5),
+)
+class ExpiringTokenAuthenticationTests(TestCase):
+    """Test expiring token authentication"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@example.com',
+            'testpass123',
+        )
+        self.auth = ExpiringTokenAuthentication()
+
+    def test_valid_token(self):
+        """Test that a fresh token authenticates its user"""
+        token = AuthToken.objects.create(user=self.user)
+
+        user, auth = self.auth.authenticate_credentials(token.key)
+
+        self.assertEqual(user, self.user)
+        self.assertEqual(auth, token)
+
+    def test_token_past_lifetime_rejected(self):
+        """Test that a token older than the TTL is rejected"""
+        now = timezone.now()
+        token = AuthToken.objects.create(
+            user=self.user,
+            created=now - timedelta(days=31),
+            last_used=now,
+        )
+
+        with self.assertRaises(AuthenticationFailed):
+            self.auth.authenticate_credentials(token.key)
+
+    def test_idle_token_rejected(self):
+        """Test that a token unused for longer than idle TTL is rejected"""
+        token = AuthToken.objects.create(
+            user=self.user,
+            last_used=timezone.now() - timedelta(days=8),
+        )
+
+        with self.assertRaises(AuthenticationFailed):
+            self.auth.authenticate_credentials(token.key)
+
+    def test_last_used_written_once_per_interval(self):
+        """Test that last_used is not updated on every request"""
+        token = AuthToken.objects.create(user=self.user)
+
+        with self.assertNumQueries(1):
+            self.auth.authenticate_credentials(token.key)
+
+        stale = timezone.now() - timedelta(minutes=10)
+        AuthToken.objects.filter(pk=token.pk).update(last_used=stale)
+
+        with self.assertNumQueries(2):
+            self.auth.authenticate_credentials(token.key)
+        token.refresh_from_db()
+        self.assertGreater(token.last_used, stale)
+
+    def test_rotate_token(self):
+        """Test that rotating replaces the token"""
+        token = AuthToken.objects.create(user=self.user)
+
+        new_token = AuthToken.objects.rotate(token)
+
+        self.assertNotEqual(new_token.key, token.key)
+        self.assertEqual(new_token.user, self.user)
+        self.assertFalse(AuthToken.objects.filter(pk=token.pk).exists())
+
+    def test_rotate_is_atomic(self):
+        """Test that a failed rotation keeps the old token only"""
+        token = AuthToken.objects.create(user=self.user)
+
+        with patch('core.models.AuthTokenQuerySet.delete',
+                   side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                AuthToken.objects.rotate(token)
+
+        self.assertEqual(list(AuthToken.objects.all()), [token])
+
+    @override_settings(AUTH_TOKEN_MAX_PER_USER=0)
+    def test_issue_keeps_new_token_without_cap(self):
+        """Test that a cap below one still leaves the issued token"""
+        AuthToken.objects.create(user=self.user)
+
+        token = AuthToken.objects.issue(self.user)
+
+        self.assertEqual(list(AuthToken.objects.all()), [token])
+
+    @override_settings(AUTH_TOKEN_MAX_PER_USER=3)
+    def test_issue_caps_tokens_per_user(self):
+        """Test that logging in revokes the least recently used tokens"""
+        now = timezone.now()
+        tokens = [
+            AuthToken.objects.create(
+                user=self.user, last_used=now - timedelta(hours=hours))
+            for hours in (1, 3, 2)
+        ]
+        expired = AuthToken.objects.create(
+            user=self.user, last_used=now - timedelta(days=8))
+        other = get_user_model().objects.create_user(
+            'other@example.com', 'testpass123')
+        other_token = AuthToken.objects.create(user=other)
+
+        token = AuthToken.objects.issue(self.user)
+
+        self.assertEqual(
+            set(AuthToken.objects.filter(user=self.user)),
+            {token, tokens[0], tokens[2]},
+        )
+        self.assertFalse(AuthToken.objects.filter(pk=expired.pk).exists())
+        self.assertTrue(AuthToken.objects.filter(pk=other_token.pk).exists())
+
+    def test_legacy_tokens_survive_migration(self):
+        """Test that carried over tokens older than the TTL stay valid"""
+        migration = import_module('core.migrations.0006_authtoken')
+        legacy = Token.objects.create(user=self.user)
+        Token.objects.filter(pk=legacy.pk).update(
+            created=timezone.now() - timedelta(days=365))
+
+        migration.copy_legacy_tokens(apps, None)
+
+        user, _ = self.auth.authenticate_credentials(legacy.key)
+        self.assertEqual(user, self.user)
@@ -2,30 +2,506 @@
 Test custom Django management commands
 """
 
-from unittest.mock import patch
-
-from psycopg2 import OperationalError as Psycopg2OperationalError
+import socket
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import Mock, patch
 
+from django.contrib.auth import get_user_model
 from django.core.management import call_command
-from django.db.utils import OperationalError
-from django.test import SimpleTestCase
+from django.core.management.base import CommandError
+from django.db.models import Count, F
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from core.management.commands.wait_for_db import (
+    EXIT_DATABASE_UNAVAILABLE,
+    EXIT_MIGRATIONS_PENDING,
+    Command,
+)
+from core.deletion import schedule_deletion
+from core.models import (
+    AuthToken,
+    DeletionJob,
+    IdempotencyKey,
+    Ingridient,
+    QueryPlan,
+    Recipe,
+    RecipeBand,
+    Tag,
+    Tombstone,
+)
+from core.similarity import similar_recipes
+
+
+class FakeClock:
+    """Clock whose sleep advances monotonic time instantly"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
 
 
-@patch('core.management.commands.wait_for_db.Command.check')
+@patch('core.management.commands.wait_for_db.Command.database_available')
 class CommandTests(SimpleTestCase):
     """Test custom Django management commands"""
 
-    def test_wait_for_db_ready(self, patched_check):
+    def setUp(self):
+        self.clock = FakeClock()
+        for name in ('monotonic', 'sleep'):
+            patcher = patch(f'time.{name}', getattr(self.clock, name))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_wait_for_db_ready(self, patched_available):
         """Test waiting for db when db is available"""
-        patched_check.return_value = True
-        call_command('wait_for_db')
-        patched_check.assert_called_once_with(databases=['default'])
+        patched_available.return_value = True
+
+        call_command('wait_for_db', stdout=StringIO())
 
-    @patch('time.sleep')
-    def test_wait_for_db_delay(self, patched_sleep, patched_check):
+        patched_available.assert_called_once()
+        self.assertEqual(self.clock.now, 0)
+
+    def test_wait_for_db_delay(self, patched_available):
         """Test waiting for db"""
-        patched_check.side_effect = [
-            Psycopg2OperationalError] * 2 + [OperationalError]*3 + [True]
-        call_command('wait_for_db')
-        self.assertEqual(patched_check.call_count, 6)
-        patched_check.assert_called_with(databases=['default'])
+        patched_available.side_effect = [False] * 5 + [True]
+
+        call_command('wait_for_db', stdout=StringIO())
+
+        self.assertEqual(patched_available.call_count, 6)
+
+    def test_wait_for_db_startup_time(self, patched_available):
+        """Test that backoff starts in milliseconds, not whole seconds"""
+        patched_available.side_effect = [False] * 5 + [True]
+
+        call_command('wait_for_db', min_delay=0.01, stdout=StringIO())
+
+        # Five failures used to cost five seconds of one-second polls.
+        self.assertLessEqual(self.clock.now, 0.31)
+
+    def test_wait_for_db_backoff_capped(self, patched_available):
+        """Test that delays never exceed max delay"""
+        patched_available.side_effect = [False] * 20 + [True]
+
+        call_command('wait_for_db', max_delay=0.5, stdout=StringIO())
+
+        delays = self.clock.sleeps
+        self.assertEqual(len(delays), 20)
+        self.assertLessEqual(max(delays), 0.5)
+        self.assertGreater(delays[-1], delays[0])
+
+    def test_wait_for_db_timeout(self, patched_available):
+        """Test that the command gives up with an exit code"""
+        patched_available.return_value = False
+
+        with self.assertRaises(CommandError) as context:
+            call_command('wait_for_db', timeout=5, stdout=StringIO())
+
+        self.assertEqual(context.exception.returncode,
+                         EXIT_DATABASE_UNAVAILABLE)
+        self.assertAlmostEqual(self.clock.now, 5)
+
+    @patch('core.management.commands.wait_for_db.Command.pending_migrations')
+    def test_wait_for_migrations(self, patched_pending, patched_available):
+        """Test waiting until migrations are applied"""
+        patched_available.return_value = True
+        patched_pending.side_effect = [True, True, False]
+
+        call_command('wait_for_db', wait_for_migrations=True,
+                     stdout=StringIO())
+
+        self.assertEqual(patched_pending.call_count, 3)
+
+    @patch('core.management.commands.wait_for_db.Command.pending_migrations')
+    def test_wait_for_migrations_timeout(
+            self, patched_pending, patched_available):
+        """Test that pending migrations give their own exit code"""
+        patched_available.return_value = True
+        patched_pending.return_value = True
+
+        with self.assertRaises(CommandError) as context:
+            call_command('wait_for_db', wait_for_migrations=True,
+                         timeout=2, stdout=StringIO())
+
+        self.assertEqual(context.exception.returncode,
+                         EXIT_MIGRATIONS_PENDING)
+
+
+class WaitForDbProbeTests(SimpleTestCase):
+    """Test the database readiness probes"""
+
+    def test_port_open(self):
+        """Test probing a listening and a closed TCP port"""
+        with socket.socket() as server:
+            server.bind(('127.0.0.1', 0))
+            server.listen()
+            address = server.getsockname()
+
+            self.assertTrue(Command.port_open(address))
+
+        self.assertFalse(Command.port_open(address))
+
+    def test_tcp_address(self):
+        """Test that unix sockets and file databases skip the TCP probe"""
+        connection = Mock(vendor='postgresql')
+
+        connection.settings_dict = {'HOST': 'db', 'PORT': ''}
+        self.assertEqual(Command.tcp_address(connection), ('db', 5432))
+        connection.settings_dict = {'HOST': '/var/run/postgresql'}
+        self.assertIsNone(Command.tcp_address(connection))
+        connection.settings_dict = {'HOST': ''}
+        self.assertIsNone(Command.tcp_address(connection))
+
+
+class WaitForDbStartupTests(TestCase):
+    """Measure readiness against the real test database"""
+
+    def test_ready_database_startup_time(self):
+        """Test that an available database is detected immediately"""
+        out = StringIO()
+        start = time.perf_counter()
+
+        call_command('wait_for_db', wait_for_migrations=True, stdout=out)
+
+        elapsed = time.perf_counter() - start
+        self.assertIn('Migrations applied!', out.getvalue())
+        self.assertLess(elapsed, 1)
+
+
+class PurgeExpiredTokensTests(TestCase):
+    """Test the purge_expired_tokens command"""
+
+    def test_purge_expired_tokens(self):
+        """Test that only expired tokens are deleted"""
+        user = get_user_model().objects.create_user(
+            'test@example.com',
+            'testpass123',
+        )
+        long_ago = timezone.now() - timedelta(days=365)
+        fresh = AuthToken.objects.create(user=user)
+        for _ in range(5):
+            AuthToken.objects.create(
+                user=user, created=long_ago, last_used=long_ago)
+
+        call_command('purge_expired_tokens', batch_size=2, stdout=StringIO())
+
+        self.assertEqual(
+            list(AuthToken.objects.values_list('key', flat=True)),
+            [fresh.key],
+        )
+
+
+class PurgeIdempotencyKeysTests(TestCase):
+    """Test the purge_idempotency_keys command"""
+
+    def test_purge_idempotency_keys(self):
+        """Test that only expired keys are deleted"""
+        user = get_user_model().objects.create_user(
+            'test@example.com',
+            'testpass123',
+        )
+        long_ago = timezone.now() - timedelta(days=365)
+        fresh = IdempotencyKey.objects.create(user=user, key='fresh')
+        for i in range(5):
+            IdempotencyKey.objects.create(
+                user=user, key=f'old-{i}', created=long_ago)
+
+        call_command('purge_idempotency_keys', batch_size=2,
+                     stdout=StringIO())
+
+        self.assertEqual(list(IdempotencyKey.objects.all()), [fresh])
+
+
+class PurgeTombstonesTests(TestCase):
+    """Test the purge_tombstones command"""
+
+    def test_purge_tombstones(self):
+        """Test that only expired tombstones are deleted"""
+        user = get_user_model().objects.create_user(
+            'test@example.com',
+            'testpass123',
+        )
+        long_ago = timezone.now() - timedelta(days=365)
+        fresh = Tombstone.objects.create(
+            user=user, kind=Tombstone.RECIPE, object_id=1)
+        for i in range(3):
+            Tombstone.objects.create(
+                user=user, kind=Tombstone.TAG, object_id=i,
+                deleted_at=long_ago)
+
+        call_command('purge_tombstones', batch_size=2, stdout=StringIO())
+
+        self.assertEqual(list(Tombstone.objects.all()), [fresh])
+
+
+class SeedDataTests(TestCase):
+    """Test the seed_data command"""
+
+    def seed(self, **options):
+        call_command(
+            'seed_data', users=20, recipes=200, tags=100, ingridients=150,
+            stdout=StringIO(), **options)
+
+    def test_seed_data(self):
+        """Test that the requested volume is inserted consistently"""
+        self.seed()
+
+        self.assertEqual(get_user_model().objects.count(), 20)
+        self.assertEqual(Recipe.objects.count(), 200)
+        self.assertEqual(Tag.objects.count(), 100)
+        self.assertEqual(Ingridient.objects.count(), 150)
+        self.assertFalse(get_user_model().objects.filter(
+            date_joined__isnull=True).exists())
+        self.assertTrue(Recipe.ingredients.through.objects.exists())
+        self.assertFalse(Recipe.tags.through.objects.exclude(
+            tag__user=F('recipe__user')).exists())
+        self.assertFalse(Recipe.ingredients.through.objects.exclude(
+            ingridient__user=F('recipe__user')).exists())
+
+    def test_seed_data_deterministic(self):
+        """Test that the same seed gives the same data"""
+        def recipes_per_user():
+            return list(get_user_model().objects.order_by('id').annotate(
+                n=Count('recipe')).values_list('n', flat=True))
+
+        self.seed(seed=7)
+        first = recipes_per_user()
+        Recipe.objects.all().delete()
+        get_user_model().objects.all().delete()
+        self.seed(seed=7)
+
+        self.assertEqual(recipes_per_user(), first)
+
+    def test_ids_continue_after_seed(self):
+        """Test that rows created afterwards get fresh ids"""
+        self.seed()
+        seeded = Recipe.objects.order_by('-id').first().id
+
+        user = get_user_model().objects.create_user(
+            'test@example.com', 'testpass123')
+        recipe = Recipe.objects.create(
+            user=user, title='Soup', time_minutes=5, price=100)
+
+        self.assertGreater(recipe.id, seeded)
+
+
+class DeleteUserCommandTests(TestCase):
+    """Test the delete_user command"""
+
+    def test_delete_user(self):
+        """Test that the user and their recipes are deleted"""
+        user = get_user_model().objects.create_user(
+            'test@example.com',
+            'testpass123',
+        )
+        for i in range(3):
+            Recipe.objects.create(
+                user=user, title=f'Recipe {i}', time_minutes=5, price=100)
+        out = StringIO()
+
+        call_command('delete_user', 'TEST@example.com', batch_size=2,
+                     stdout=out)
+
+        self.assertFalse(get_user_model().objects.exists())
+        self.assertFalse(Recipe.objects.exists())
+        self.assertIn('3 recipes', out.getvalue())
+
+    def test_delete_missing_user(self):
+        """Test that an unknown user is an error"""
+        with self.assertRaises(CommandError):
+            call_command('delete_user', 'nobody@example.com',
+                         stdout=StringIO())
+
+
+class ResumeDeletionsTests(TestCase):
+    """Test the resume_deletions command"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@example.com', 'testpass123')
+        Recipe.objects.create(
+            user=self.user, title='Soup', time_minutes=5, price=100)
+        # The worker running the deletion thread is restarted.
+        with self.captureOnCommitCallbacks():
+            self.job = schedule_deletion(self.user)
+
+    def age(self, job, minutes):
+        DeletionJob.objects.filter(pk=job.pk).update(
+            updated_at=timezone.now() - timedelta(minutes=minutes))
+
+    def test_resumes_stale_deletion(self):
+        """Test that deletions without progress are finished"""
+        self.age(self.job, 11)
+        out = StringIO()
+
+        call_command('resume_deletions', stdout=out)
+
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, DeletionJob.DONE)
+        self.assertEqual(self.job.deleted['recipes'], 1)
+        self.assertFalse(get_user_model().objects.exists())
+        self.assertIn('Resumed 1 deletions.', out.getvalue())
+
+    def test_skips_running_deletion(self):
+        """Test that deletions still reporting progress are left alone"""
+        call_command('resume_deletions', stdout=StringIO())
+
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, DeletionJob.PENDING)
+        self.assertTrue(Recipe.objects.exists())
+
+    def test_retries_failed_deletion(self):
+        """Test that failed deletions are only retried with --failed"""
+        DeletionJob.objects.filter(pk=self.job.pk).update(
+            status=DeletionJob.FAILED)
+        self.age(self.job, 11)
+
+        call_command('resume_deletions', stdout=StringIO())
+        self.assertTrue(Recipe.objects.exists())
+
+        call_command('resume_deletions', failed=True, stdout=StringIO())
+        self.assertFalse(Recipe.objects.exists())
+
+
+class ArchiveRecipesCommandTests(TestCase):
+    """Test the archive_recipes and restore_recipes commands"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@example.com',
+            'testpass123',
+        )
+        for i in range(3):
+            Recipe.objects.create(
+                user=self.user, title=f'Recipe {i}', time_minutes=5,
+                price=100)
+        get_user_model().objects.update(
+            date_joined=timezone.now() - timedelta(days=365))
+
+    def test_archive_and_restore(self):
+        """Test archiving inactive users and restoring one"""
+        active = get_user_model().objects.create_user(
+            'active@example.com',
+            'testpass123',
+        )
+        Recipe.objects.create(
+            user=active, title='Recipe', time_minutes=5, price=100)
+        AuthToken.objects.create(user=active)
+        out = StringIO()
+
+        call_command('archive_recipes', batch_size=2, stdout=out)
+
+        self.assertEqual(Recipe.objects.get().user, active)
+        self.assertIn('Archived 3 recipes of 1 users.', out.getvalue())
+
+        call_command('restore_recipes', 'test@example.com', stdout=out)
+
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 3)
+
+    def test_archive_missing_user(self):
+        """Test that an unknown user is an error"""
+        with self.assertRaises(CommandError):
+            call_command('archive_recipes', user='nobody@example.com',
+                         stdout=StringIO())
+
+
+class RebuildRecipeTotalsTests(TestCase):
+    """Test the rebuild_recipe_totals command"""
+
+    def test_rebuild_recipe_totals(self):
+        """Test that stale totals are recomputed from ingridients"""
+        user = get_user_model().objects.create_user(
+            'test@example.com',
+            'testpass123',
+        )
+        salt = Ingridient.objects.create(
+            user=user, name='Salt', cost=10, calories=0)
+        recipes = [
+            Recipe.objects.create(
+                user=user, title=f'Recipe {i}', time_minutes=5, price=100)
+            for i in range(3)
+        ]
+        recipes[0].ingredients.add(salt)
+        Recipe.objects.update(total_cost=999, total_calories=None)
+        out = StringIO()
+
+        call_command('rebuild_recipe_totals', batch_size=2, workers=1,
+                     stdout=out)
+
+        self.assertEqual(
+            list(Recipe.objects.order_by('id').values_list(
+                'total_cost', 'total_calories')),
+            [(10, 0), (0, 0), (0, 0)])
+        self.assertIn('Rebuilt totals of 3 recipes.', out.getvalue())
+
+
+class RebuildSimilarityIndexTests(TestCase):
+    """Test the rebuild_similarity_index command"""
+
+    def test_rebuild_similarity_index(self):
+        """Test that recipes missing from the index are added"""
+        user = get_user_model().objects.create_user(
+            'test@example.com',
+            'testpass123',
+        )
+        salt = Ingridient.objects.create(user=user, name='Salt')
+        recipes = [
+            Recipe.objects.create(
+                user=user, title=f'Recipe {i}', time_minutes=5, price=100)
+            for i in range(3)
+        ]
+        for recipe in recipes[:2]:
+            recipe.ingredients.add(salt)
+        RecipeBand.objects.all().delete()
+        out = StringIO()
+
+        call_command('rebuild_similarity_index', batch_size=2, stdout=out)
+
+        self.assertEqual(
+            similar_recipes(recipes[0]), [(recipes[1].id, 1.0)])
+        self.assertEqual(
+            RecipeBand.objects.filter(recipe=recipes[2]).count(), 0)
+        self.assertIn('Indexed 3 recipes.', out.getvalue())
+
+
+class SlowQueriesTests(TestCase):
+    """Test the slow_queries command"""
+
+    def capture(self, key, duration, plan=None):
+        return QueryPlan.objects.create(
+            route='recipe:recipe-list',
+            fingerprint=key,
+            sql=f'SELECT {key}',
+            database='default',
+            duration=duration,
+            plan=plan or [{'Plan': {'Node Type': 'Result'}}],
+        )
+
+    def test_slow_queries_report(self):
+        """Test fingerprints are ranked by total time with seq scans"""
+        self.capture('often', 120)
+        self.capture('often', 130)
+        self.capture('once', 200, [{'Plan': {
+            'Node Type': 'Seq Scan', 'Relation Name': 'core_recipe'}}])
+        old = self.capture('old', 9000)
+        old.captured_at = timezone.now() - timedelta(days=2)
+        old.save()
+        out = StringIO()
+
+        call_command('slow_queries', clear=True, stdout=out)
+
+        lines = out.getvalue().splitlines()
+        self.assertTrue(lines[0].startswith('1. 250.0 ms over 2 captures'))
+        self.assertEqual(lines[1].strip(), 'SELECT often')
+        self.assertTrue(lines[2].startswith('2. 200.0 ms over 1 captures'))
+        self.assertIn('Sequential scan on core_recipe', lines[4])
+        self.assertNotIn('SELECT old', out.getvalue())
+        self.assertFalse(QueryPlan.objects.exists())
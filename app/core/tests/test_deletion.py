@@ -0,0 +1,104 @@
+"""
+Tests for chunked account deletion
+"""
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from core.deletion import (
+    delete_user,
+    get_job,
+    run_deletion,
+    schedule_deletion,
+)
+from core.models import AuthToken, DeletionJob, Ingridient, Recipe, Tag
+
+
+def create_user(email='user@example.com'):
+    return get_user_model().objects.create_user(email, 'testpass123')
+
+
+def create_recipe(user, **params):
+    defaults = {'title': 'Recipe', 'time_minutes': 5, 'price': 100}
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class DeleteUserTests(TestCase):
+    """Test deleting a user and their data"""
+
+    def setUp(self):
+        self.user = create_user()
+        self.other = create_user('other@example.com')
+
+    def test_deletes_only_users_data(self):
+        """Test that other users' rows are left alone"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        ingridient = Ingridient.objects.create(user=self.user, name='Salt')
+        recipe = create_recipe(self.user)
+        recipe.tags.add(tag)
+        recipe.ingredients.add(ingridient)
+        AuthToken.objects.create(user=self.user)
+        other_tag = Tag.objects.create(user=self.other, name='Quick')
+        other_recipe = create_recipe(self.other)
+        other_recipe.tags.add(other_tag, tag)
+
+        for _ in delete_user(self.user.pk, batch_size=10):
+            pass
+
+        self.assertEqual(list(get_user_model().objects.all()), [self.other])
+        self.assertEqual(list(Recipe.objects.all()), [other_recipe])
+        self.assertEqual(list(Tag.objects.all()), [other_tag])
+        self.assertFalse(Ingridient.objects.exists())
+        self.assertFalse(AuthToken.objects.exists())
+        self.assertEqual(list(other_recipe.tags.all()), [other_tag])
+
+    def test_deletes_in_chunks(self):
+        """Test that rows are deleted batch_size at a time"""
+        for i in range(5):
+            create_recipe(self.user, title=f'Recipe {i}')
+
+        progress = [
+            dict(deleted) for deleted in delete_user(self.user.pk, 2)]
+
+        recipe_counts = [p['recipes'] for p in progress if 'recipes' in p]
+        self.assertEqual(recipe_counts[:3], [2, 4, 5])
+        self.assertEqual(progress[-1]['users'], 1)
+        self.assertEqual(get_job(self.user.pk).status, 'done')
+
+    def test_recipes_not_loaded(self):
+        """Test that recipes are deleted without selecting their rows"""
+        for i in range(5):
+            create_recipe(self.user, title=f'Recipe {i}')
+
+        with CaptureQueriesContext(connection) as queries:
+            for _ in delete_user(self.user.pk, batch_size=100):
+                pass
+
+        sql = [q['sql'] for q in queries]
+        last_delete = max(
+            i for i, statement in enumerate(sql)
+            if statement.startswith('DELETE FROM "core_recipe" ')
+        )
+        recipe_selects = [
+            statement for statement in sql[:last_delete]
+            if statement.startswith('SELECT "core_recipe"."id", ')
+        ]
+        self.assertEqual(recipe_selects, [])
+
+    def test_deletion_claimed_once(self):
+        """Test that a job is only run by the first worker to claim it"""
+        create_recipe(self.user)
+        with self.captureOnCommitCallbacks():
+            job = schedule_deletion(self.user)
+        DeletionJob.objects.filter(pk=job.pk).update(
+            status=DeletionJob.RUNNING)
+
+        with patch('core.deletion.connections'):
+            run_deletion(job)
+
+        self.assertEqual(get_job(self.user.pk).status, DeletionJob.RUNNING)
+        self.assertTrue(Recipe.objects.exists())
@@ -0,0 +1,222 @@
+"""
+Tests for live change events and their stream
+"""
+import asyncio
+import json
+from contextlib import suppress
+from datetime import timedelta
+from unittest import skipUnless
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from core.events import RESYNC, Subscription, broker, publish
+from core.models import AuthToken, Recipe
+from core.streams import event_stream
+
+
+class FakeClient:
+    """ASGI receive and send callables recording the response"""
+
+    def __init__(self):
+        self.messages = []
+        self.sent = asyncio.Event()
+        self.disconnected = asyncio.Event()
+
+    async def receive(self):
+        await self.disconnected.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(self, message):
+        self.messages.append(message)
+        self.sent.set()
+
+    async def wait_for(self, count):
+        while len(self.messages) < count:
+            self.sent.clear()
+            await asyncio.wait_for(self.sent.wait(), timeout=1)
+
+    def body(self):
+        return b''.join(
+            message.get('body', b'') for message in self.messages[1:])
+
+
+def stream_scope(key=None, method='GET'):
+    headers = []
+    if key:
+        headers.append((b'authorization', f'Token {key}'.encode()))
+    return {'type': 'http', 'method': method, 'path': '/api/events/',
+            'headers': headers}
+
+
+class ChangeEventTests(TestCase):
+    """Test publishing change events to subscriptions"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123')
+
+    async def test_writes_publish_events(self):
+        """Test saved and deleted recipes reach the user's subscription"""
+        subscription = broker.subscribe(self.user.pk)
+        other = broker.subscribe(self.user.pk + 1)
+
+        @sync_to_async
+        def write():
+            with self.captureOnCommitCallbacks(execute=True):
+                recipe = Recipe.objects.create(
+                    user=self.user, title='Plov', time_minutes=90, price=10)
+            with self.captureOnCommitCallbacks(execute=True):
+                recipe.title = 'Wedding plov'
+                recipe.save()
+            recipe_id = recipe.id
+            with self.captureOnCommitCallbacks(execute=True):
+                recipe.delete()
+            return recipe_id
+
+        try:
+            recipe_id = await write()
+            events = [
+                await asyncio.wait_for(subscription.get(), timeout=1)
+                for _ in range(3)
+            ]
+        finally:
+            broker.unsubscribe(subscription)
+            broker.unsubscribe(other)
+
+        self.assertEqual(events, [
+            {'kind': 'recipe', 'action': action, 'id': recipe_id}
+            for action in ('created', 'updated', 'deleted')
+        ])
+        self.assertTrue(other.queue.empty())
+
+    def test_events_wait_for_commit(self):
+        """Test events are held back until the transaction commits"""
+        with self.captureOnCommitCallbacks() as callbacks:
+            publish(self.user.pk, 'tag', 'created', 1)
+            self.assertEqual(len(callbacks), 0)
+        self.assertEqual(len(callbacks), 1)
+
+    async def test_slow_subscriber_resyncs(self):
+        """Test a full queue is swapped for a single resync event"""
+        subscription = Subscription(self.user.pk, 2)
+
+        for recipe_id in range(3):
+            subscription.put({'kind': 'recipe', 'id': recipe_id})
+
+        self.assertEqual(subscription.queue.qsize(), 1)
+        self.assertEqual(await subscription.get(), RESYNC)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'NOTIFY needs PostgreSQL')
+class ChangeNotifyTests(TransactionTestCase):
+    """Test events travel through NOTIFY and the broker's listener"""
+
+    async def test_notify_reaches_subscription(self):
+        """Test a published event reaches a subscription through LISTEN"""
+        subscription = broker.subscribe(42)
+        listener = broker.listener
+        self.assertIsNotNone(listener)
+        # Publishing commits right away outside a transaction. Repeat
+        # until the listener, connecting in a thread, has run LISTEN.
+        event = None
+        try:
+            for _ in range(50):
+                await sync_to_async(publish)(42, 'tag', 'created', 7)
+                try:
+                    event = await asyncio.wait_for(
+                        subscription.get(), timeout=0.1)
+                    break
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            broker.unsubscribe(subscription)
+            with suppress(asyncio.CancelledError):
+                await listener
+
+        self.assertEqual(event, {'kind': 'tag', 'action': 'created', 'id': 7})
+        self.assertIsNone(broker.listener)
+
+
+class EventStreamTests(TestCase):
+    """Test the server-sent events stream"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123')
+        self.token = AuthToken.objects.create(user=self.user)
+
+    def rotate(self):
+        self.token = AuthToken.objects.rotate(self.token)
+
+    def expire(self):
+        AuthToken.objects.filter(pk=self.token.pk).update(
+            created=timezone.now() - timedelta(days=365))
+
+    async def test_stream_requires_token(self):
+        """Test requests without a valid token are rejected"""
+        for key in (None, 'invalid'):
+            client = FakeClient()
+            await event_stream(stream_scope(key), client.receive, client.send)
+            self.assertEqual(client.messages[0]['status'], 401)
+
+    async def test_stream_rejects_other_methods(self):
+        """Test only GET opens a stream"""
+        client = FakeClient()
+        await event_stream(stream_scope(self.token.key, 'POST'),
+                           client.receive, client.send)
+        self.assertEqual(client.messages[0]['status'], 405)
+
+    async def test_stream_sends_events(self):
+        """Test events are streamed until the client disconnects"""
+        client = FakeClient()
+        stream = asyncio.ensure_future(event_stream(
+            stream_scope(self.token.key), client.receive, client.send))
+        await client.wait_for(2)
+
+        broker.deliver(json.dumps(
+            {'user': self.user.pk, 'kind': 'tag', 'action': 'created',
+             'id': 7}))
+        await client.wait_for(3)
+        client.disconnected.set()
+        await asyncio.wait_for(stream, timeout=1)
+
+        self.assertEqual(client.messages[0]['status'], 200)
+        self.assertIn((b'content-type', b'text/event-stream'),
+                      client.messages[0]['headers'])
+        self.assertEqual(
+            client.body(),
+            b'retry: 5000\n\n'
+            b'event: tag\ndata: {"action":"created","id":7}\n\n')
+        self.assertFalse(broker.subscriptions)
+
+    @override_settings(CHANGE_EVENTS_HEARTBEAT=0.01)
+    async def test_stream_heartbeat(self):
+        """Test idle streams get comments to keep them open"""
+        client = FakeClient()
+        stream = asyncio.ensure_future(event_stream(
+            stream_scope(self.token.key), client.receive, client.send))
+        await client.wait_for(3)
+        client.disconnected.set()
+        await asyncio.wait_for(stream, timeout=1)
+
+        self.assertIn(b': ping\n\n', client.body())
+
+    @override_settings(CHANGE_EVENTS_HEARTBEAT=0.01)
+    async def test_stream_ends_with_token(self):
+        """Test streams are closed once their token is rotated or expires"""
+        for revoke in (self.rotate, self.expire):
+            client = FakeClient()
+            stream = asyncio.ensure_future(event_stream(
+                stream_scope(self.token.key), client.receive, client.send))
+            await client.wait_for(3)
+
+            await sync_to_async(revoke)()
+            await asyncio.wait_for(stream, timeout=1)
+
+            self.assertEqual(client.messages[-1],
+                             {'type': 'http.response.body', 'body': b''})
+            self.assertFalse(broker.subscriptions)
@@ -0,0 +1,142 @@
+"""
+Tests for Idempotency-Key handling
+"""
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import IdempotencyKey, Recipe
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+PAYLOAD = {
+    'title': 'chocolate cake',
+    'time_minutes': 30,
+    'price': 500,
+}
+
+
+class IdempotencyKeyTests(TestCase):
+    """Test replaying writes sent with an Idempotency-Key"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        self.client.force_authenticate(self.user)
+
+    def post(self, payload=PAYLOAD, key='key-1'):
+        return self.client.post(RECIPES_URL, payload, format='json',
+                                HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_response(self):
+        """Test that a retry returns the first response unchanged"""
+        first = self.post()
+        with self.assertNumQueries(1):
+            retry = self.post()
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Recipe.objects.count(), 1)
+        recipe = Recipe.objects.get()
+        self.assertEqual(
+            retry['Location'],
+            reverse('recipe:recipe-detail', args=[recipe.id]))
+        self.assertEqual(retry['Location'], first['Location'])
+        self.assertEqual(retry['Content-Type'], first['Content-Type'])
+
+    def test_without_key(self):
+        """Test that requests without the header are not deduplicated"""
+        self.client.post(RECIPES_URL, PAYLOAD, format='json')
+        self.client.post(RECIPES_URL, PAYLOAD, format='json')
+
+        self.assertEqual(Recipe.objects.count(), 2)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_keys_are_per_user(self):
+        """Test that the same key from another user is independent"""
+        self.post()
+        other = get_user_model().objects.create_user(
+            'other@example.com',
+            'testpass123',
+        )
+        self.client.force_authenticate(other)
+
+        res = self.post()
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Recipe.objects.count(), 2)
+
+    def test_key_reused_for_different_request(self):
+        """Test that reusing a key with another body is rejected"""
+        self.post()
+
+        res = self.post({**PAYLOAD, 'title': 'other cake'})
+
+        self.assertEqual(res.status_code,
+                         status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(Recipe.objects.count(), 1)
+
+    def test_request_in_progress(self):
+        """Test that a duplicate of a running request gets 409"""
+        first = self.post()
+        IdempotencyKey.objects.update(status_code=None, response=None)
+
+        res = self.post()
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.status_code, status.HTTP_409_CONFLICT)
+
+    def test_failed_validation_not_stored(self):
+        """Test that a rejected request can be retried with the key"""
+        res = self.post({'title': 'no time or price'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertEqual(self.post().status_code, status.HTTP_201_CREATED)
+
+    def test_returned_error_not_stored(self):
+        """Test that an error returned rather than raised frees the key"""
+        url = reverse('recipe:recipe-clone-many')
+
+        res = self.client.post(url, {'ids': [999]}, format='json',
+                               HTTP_IDEMPOTENCY_KEY='clone-1')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_expired_key_runs_again(self):
+        """Test that a key past its TTL is treated as new"""
+        self.post()
+        IdempotencyKey.objects.update(
+            created=timezone.now() - timedelta(days=30))
+
+        res = self.post()
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertNotIn('Idempotent-Replayed', res)
+        self.assertEqual(Recipe.objects.count(), 2)
+
+    def test_update_replayed(self):
+        """Test that update retries are replayed too"""
+        recipe = Recipe.objects.create(user=self.user, **PAYLOAD)
+        url = reverse('recipe:recipe-detail', args=[recipe.id])
+
+        self.client.patch(url, {'price': 600}, format='json',
+                          HTTP_IDEMPOTENCY_KEY='patch-1')
+        Recipe.objects.filter(id=recipe.id).update(price=700)
+        res = self.client.patch(url, {'price': 600}, format='json',
+                                HTTP_IDEMPOTENCY_KEY='patch-1')
+
+        self.assertEqual(res.json()['price'], 600)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.price, 700)
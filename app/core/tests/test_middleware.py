@@ -0,0 +1,167 @@
+"""
+Tests for custom middleware
+"""
+import gzip
+import json
+from unittest import skipIf
+from unittest.mock import Mock, patch
+
+from django.contrib.auth import get_user_model
+from django.db.utils import OperationalError
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import (
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    override_settings,
+)
+
+from core import health, middleware
+
+PAYLOAD = json.dumps([{'title': 'sample recipe'}] * 200).encode()
+
+
+@override_settings(COMPRESSION_MIN_SIZE=1024)
+class CompressionMiddlewareTests(SimpleTestCase):
+    """Test response compression"""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def get_response(self, response, accept_encoding='gzip'):
+        request = self.factory.get(
+            '/api/recipe/recipes/', HTTP_ACCEPT_ENCODING=accept_encoding)
+        return middleware.CompressionMiddleware(lambda r: response)(request)
+
+    def test_large_json_gzipped(self):
+        """Test that large JSON responses are gzip compressed"""
+        res = self.get_response(
+            HttpResponse(PAYLOAD, content_type='application/json'))
+
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+        self.assertEqual(res['Vary'], 'Accept-Encoding')
+        self.assertEqual(int(res['Content-Length']), len(res.content))
+        self.assertEqual(gzip.decompress(res.content), PAYLOAD)
+
+    @skipIf(middleware.brotli is None, 'brotli is not installed')
+    def test_brotli_preferred(self):
+        """Test that brotli is used when the client accepts it"""
+        res = self.get_response(
+            HttpResponse(PAYLOAD, content_type='application/json'),
+            accept_encoding='gzip, deflate, br',
+        )
+
+        self.assertEqual(res['Content-Encoding'], 'br')
+        self.assertEqual(middleware.brotli.decompress(res.content), PAYLOAD)
+
+    def test_small_response_not_compressed(self):
+        """Test that responses below the threshold are left alone"""
+        res = self.get_response(
+            HttpResponse(b'{"id": 1}', content_type='application/json'))
+
+        self.assertFalse(res.has_header('Content-Encoding'))
+        self.assertEqual(res.content, b'{"id": 1}')
+
+    def test_non_json_not_compressed(self):
+        """Test that other content types are left alone"""
+        res = self.get_response(
+            HttpResponse(PAYLOAD, content_type='image/png'))
+
+        self.assertFalse(res.has_header('Content-Encoding'))
+
+    def test_encoding_refused(self):
+        """Test that q=0 disables an encoding"""
+        res = self.get_response(
+            HttpResponse(PAYLOAD, content_type='application/json'),
+            accept_encoding='gzip;q=0, identity',
+        )
+
+        self.assertFalse(res.has_header('Content-Encoding'))
+        self.assertEqual(res.content, PAYLOAD)
+
+    def test_streaming_response_compressed(self):
+        """Test that streaming responses are compressed incrementally"""
+        chunks = [PAYLOAD[i:i + 100] for i in range(0, len(PAYLOAD), 100)]
+        res = self.get_response(
+            StreamingHttpResponse(chunks, content_type='application/json'))
+
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+        self.assertEqual(
+            gzip.decompress(b''.join(res.streaming_content)), PAYLOAD)
+
+
+class HealthCheckMiddlewareTests(TestCase):
+    """Test the liveness and readiness endpoints"""
+
+    def setUp(self):
+        health.readiness.reset()
+        self.addCleanup(health.readiness.reset)
+
+    def test_liveness(self):
+        """Test that liveness answers without the rest of the stack"""
+        res = self.client.get('/healthz', HTTP_HOST='not-allowed.example')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json(), {'status': 'ok'})
+        self.assertFalse(hasattr(res.wsgi_request, 'session'))
+        self.assertFalse(hasattr(res.wsgi_request, 'user'))
+
+    def test_readiness(self):
+        """Test that readiness checks the database and cache"""
+        res = self.client.get('/readyz')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json()['checks'],
+                         {'database': 'ok', 'cache': 'ok'})
+
+    def test_readiness_failure(self):
+        """Test that a failing check makes the service unavailable"""
+        with patch.dict(health.CHECKS, database=Mock(
+                side_effect=OperationalError)):
+            res = self.client.get('/readyz')
+
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(res.json()['checks']['database'],
+                         'error: OperationalError')
+
+    @override_settings(HEALTH_CHECK_CACHE_SECONDS=60)
+    def test_readiness_result_cached(self):
+        """Test that probe storms run the checks only once"""
+        check = Mock()
+        with patch.dict(health.CHECKS, {'database': check}):
+            for _ in range(10):
+                self.client.get('/readyz')
+
+        check.assert_called_once()
+
+
+class SessionlessPathsTests(TestCase):
+    """Test that API routes skip the session middleware"""
+
+    def test_api_skips_sessions(self):
+        """Test that API requests get no session, CSRF or messages"""
+        res = self.client.get('/api/recipe/')
+
+        self.assertEqual(res.status_code, 200)
+        for attr in ('session', '_messages', 'csrf_processing_done'):
+            self.assertFalse(hasattr(res.wsgi_request, attr), attr)
+
+    def test_api_session_not_loaded(self):
+        """Test that a session cookie on API requests is never loaded"""
+        user = get_user_model().objects.create_user(
+            'test@example.com',
+            'testpass123',
+        )
+        self.client.force_login(user)
+
+        with self.assertNumQueries(0):
+            self.client.get('/api/recipe/')
+
+    def test_admin_keeps_sessions(self):
+        """Test that admin requests still get sessions and users"""
+        res = self.client.get('/admin/login/')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(hasattr(res.wsgi_request, 'session'))
+        self.assertTrue(hasattr(res.wsgi_request, 'user'))
+        self.assertIn('csrftoken', res.cookies)
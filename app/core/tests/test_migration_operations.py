@@ -0,0 +1,157 @@
+"""
+Tests for zero-downtime migration operations and the migration lint
+"""
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import migrations, models
+from django.db.models import Q
+from django.test import TestCase
+
+from core.management.commands.lint_migrations import (
+    ERROR,
+    WARNING,
+    check_migration,
+)
+from core.migration_operations import (
+    AddIndexConcurrently,
+    AddNullableField,
+    BatchedBackfill,
+)
+from core.models import Recipe
+
+
+def make_migration(operations, atomic=True):
+    migration = migrations.Migration('0100_test', 'core')
+    migration.operations = operations
+    migration.atomic = atomic
+    return migration
+
+
+class BatchedBackfillTests(TestCase):
+    """Test filling a column in batches"""
+
+    def setUp(self):
+        user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123')
+        Recipe.objects.bulk_create([
+            Recipe(user=user, title=f'Recipe {i}', time_minutes=5, price=1)
+            for i in range(5)
+        ])
+        self.operation = BatchedBackfill(
+            'recipe', 'link', 'https://example.com',
+            pending=Q(link=''), batch_size=2, pause=0,
+        )
+
+    def test_updates_in_batches(self):
+        """Test that pending rows are updated batch_size at a time"""
+        batches = list(self.operation.run(Recipe, 'default'))
+
+        self.assertEqual(batches, [2, 2, 1])
+        self.assertFalse(Recipe.objects.filter(link='').exists())
+
+    def test_resumes_after_interruption(self):
+        """Test that rows already filled in are skipped"""
+        run = self.operation.run(Recipe, 'default')
+        next(run)
+        run.close()
+
+        batches = list(self.operation.run(Recipe, 'default'))
+
+        self.assertEqual(batches, [2, 1])
+
+    def test_deconstruct_omits_defaults(self):
+        """Test that unset options are left out of the migration file"""
+        operation = BatchedBackfill('recipe', 'link', '')
+        self.assertEqual(operation.deconstruct(), (
+            'BatchedBackfill', [],
+            {'model_name': 'recipe', 'name': 'link', 'value': ''},
+        ))
+
+
+class AddNullableFieldTests(TestCase):
+    """Test adding a nullable column"""
+
+    def test_rejects_not_null_field(self):
+        """Test that a NOT NULL field is refused"""
+        with self.assertRaises(ValueError):
+            AddNullableField('recipe', 'rating', models.IntegerField())
+
+
+class LintMigrationTests(TestCase):
+    """Test flagging blocking migration operations"""
+
+    def levels(self, migration):
+        return [level for level, _, _ in check_migration(migration)]
+
+    def test_plain_add_index_is_error(self):
+        """Test that a blocking CREATE INDEX is flagged"""
+        index = models.Index(fields=['title'], name='core_recipe_title_idx')
+        migration = make_migration([migrations.AddIndex('recipe', index)])
+
+        self.assertEqual(self.levels(migration), [ERROR])
+
+    def test_concurrent_index_needs_non_atomic(self):
+        """Test that concurrent operations require atomic = False"""
+        index = models.Index(fields=['title'], name='core_recipe_title_idx')
+        operations = [AddIndexConcurrently('recipe', index)]
+
+        self.assertEqual(self.levels(make_migration(operations)), [ERROR])
+        self.assertEqual(
+            self.levels(make_migration(operations, atomic=False)), [])
+
+    def test_add_field(self):
+        """Test NOT NULL, defaulted and nullable new columns"""
+        not_null = migrations.AddField(
+            'recipe', 'rating', models.IntegerField(default=0))
+        defaulted = migrations.AddField(
+            'recipe', 'rating', models.IntegerField(null=True, default=0))
+        nullable = migrations.AddField(
+            'recipe', 'rating', models.IntegerField(null=True))
+
+        self.assertEqual(self.levels(make_migration([not_null])), [ERROR])
+        self.assertEqual(self.levels(make_migration([defaulted])), [WARNING])
+        self.assertEqual(self.levels(make_migration([nullable])), [])
+
+    def test_new_model_is_not_flagged(self):
+        """Test that operations on a model created alongside are fine"""
+        migration = make_migration([
+            migrations.CreateModel('Rating', [
+                ('id', models.AutoField(primary_key=True)),
+            ]),
+            migrations.AddField(
+                'rating', 'score', models.IntegerField(default=0)),
+            migrations.AddIndex('rating', models.Index(
+                fields=['score'], name='core_rating_score_idx')),
+        ])
+
+        self.assertEqual(self.levels(migration), [])
+
+    def test_command_skips_applied_migrations(self):
+        """Test that only unapplied migrations are checked by default"""
+        out = StringIO()
+        call_command('lint_migrations', 'core', stdout=out)
+
+        self.assertIn('No blocking operations.', out.getvalue())
+
+    def test_history_has_no_blocking_operations(self):
+        """Test that every core migration passes the lint"""
+        out = StringIO()
+        call_command('lint_migrations', 'core', '--all', stdout=out)
+
+        self.assertIn('No blocking operations.', out.getvalue())
+
+    def test_command_fails_on_blocking_operation(self):
+        """Test that an error finding fails the command"""
+        out = StringIO()
+        finding = [(ERROR, 'Create index', 'AddIndex locks writes')]
+        with patch(
+            'core.management.commands.lint_migrations.check_migration',
+            return_value=finding,
+        ), self.assertRaises(CommandError):
+            call_command('lint_migrations', 'core', '--all', stdout=out)
+
+        self.assertIn('core.0001_initial: Create index', out.getvalue())
@@ -0,0 +1,165 @@
+"""
+Tests for capturing the plans of slow queries
+"""
+from types import SimpleNamespace
+from unittest import skipUnless
+from unittest.mock import Mock, patch
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from core.models import QueryPlan, Recipe
+from core.query_plans import (
+    PlanCapture,
+    explain,
+    fingerprint,
+    is_read_only,
+    plan_nodes,
+    sequential_scans,
+)
+
+SEQ_SCAN_PLAN = [{'Plan': {
+    'Node Type': 'Limit',
+    'Plans': [{
+        'Node Type': 'Sort',
+        'Plans': [
+            {'Node Type': 'Seq Scan', 'Relation Name': 'core_recipe'},
+            {'Node Type': 'Seq Scan', 'Relation Name': 'core_user'},
+            {'Node Type': 'Index Scan', 'Relation Name': 'core_tag'},
+        ],
+    }],
+}}]
+
+
+class QueryPlanTests(TestCase):
+    """Test query fingerprints and plan inspection"""
+
+    def test_fingerprint_ignores_values(self):
+        """Test queries differing only in values share a fingerprint"""
+        first = fingerprint(
+            "SELECT * FROM core_recipe WHERE user_id = 1 "
+            "AND title = 'plov' AND id IN (1, 2, 3)")
+        second = fingerprint(
+            'SELECT *\n  FROM core_recipe WHERE user_id = %s '
+            'AND title = %s AND id IN (%s)')
+
+        self.assertEqual(first, second)
+        self.assertEqual(
+            first[0],
+            'SELECT * FROM core_recipe WHERE user_id = ? AND title = ? '
+            'AND id IN (...)')
+
+    def test_sequential_scans(self):
+        """Test seq scans are only flagged on the watched tables"""
+        self.assertEqual(sequential_scans(SEQ_SCAN_PLAN), ['core_recipe'])
+
+    def test_side_effects_not_read_only(self):
+        """Test SELECTs that change state aren't treated as reads"""
+        self.assertTrue(is_read_only(
+            ' SELECT "core_recipe"."id" FROM "core_recipe" '
+            'WHERE "core_recipe"."user_id" = %s'))
+        for sql in (
+            'SELECT pg_notify(%s, %s)',
+            "SELECT setval(pg_get_serial_sequence(%s, 'id'), %s, false)",
+            "SELECT nextval('core_recipe_id_seq')",
+            'SELECT pg_advisory_lock(%s)',
+            'SELECT "core_recipe"."id" FROM "core_recipe" FOR UPDATE',
+            'SELECT * INTO backup FROM "core_recipe"',
+            'UPDATE "core_recipe" SET "price" = %s',
+        ):
+            with self.subTest(sql=sql):
+                self.assertFalse(is_read_only(sql))
+
+    @override_settings(QUERY_PLAN_THRESHOLD=0)
+    @patch('core.query_plans.explain')
+    def test_side_effects_not_explained(self, explain):
+        """Test a notify sent during a request is not run again"""
+        request = SimpleNamespace(resolver_match=SimpleNamespace(
+            namespace='recipe', view_name='recipe:recipe-list'))
+        execute = Mock()
+
+        PlanCapture(request)(execute, 'SELECT pg_notify(%s, %s)',
+                             ['channel', '{}'], False, {})
+
+        execute.assert_called_once()
+        explain.assert_not_called()
+
+
+@skipUnless(connection.vendor == 'postgresql', 'EXPLAIN needs PostgreSQL')
+class ExplainTests(TestCase):
+    """Test plans read from PostgreSQL"""
+
+    def test_explain(self):
+        """Test explain returns the parsed plan of a query"""
+        user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123')
+        Recipe.objects.create(
+            user=user, title='Plov', time_minutes=90, price=10)
+        queryset = Recipe.objects.filter(user=user)
+        sql, params = queryset.query.sql_with_params()
+
+        plan = explain(connection, sql, params)
+
+        self.assertIsInstance(plan, list)
+        self.assertIn('Execution Time', plan[0])
+        self.assertIn('core_recipe', {
+            node.get('Relation Name') for node in plan_nodes(plan)})
+        self.assertEqual(plan[0]['Plan']['Actual Rows'], 1)
+
+    def test_explain_rolled_back(self):
+        """Test whatever the explained query did is undone"""
+        user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123')
+        table = Recipe._meta.db_table
+
+        explain(
+            connection,
+            f'WITH added AS (INSERT INTO {table} '
+            '(user_id, title, time_minutes, price, description, link) '
+            "VALUES (%s, 'Plov', 90, 10, '', '') RETURNING id) "
+            'SELECT id FROM added',
+            [user.pk],
+        )
+
+        self.assertFalse(Recipe.objects.exists())
+
+
+@override_settings(QUERY_PLAN_CAPTURE=True, QUERY_PLAN_THRESHOLD=0,
+                   QUERY_PLAN_INTERVAL=0)
+@patch('core.query_plans.explain', return_value=SEQ_SCAN_PLAN)
+class QueryPlanMiddlewareTests(TestCase):
+    """Test slow queries of API views are captured"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123')
+        self.client.force_authenticate(self.user)
+
+    def test_api_selects_captured(self, explain):
+        """Test SELECTs of recipe views are stored with their route"""
+        self.client.get(reverse('recipe:tag-list'))
+        self.client.get(reverse('recipe:recipe-list'))
+
+        plans = QueryPlan.objects.all()
+        self.assertEqual(
+            set(plans.values_list('route', flat=True)),
+            {'recipe:tag-list', 'recipe:recipe-list'})
+        self.assertTrue(all(
+            sql.startswith('SELECT')
+            for sql in plans.values_list('sql', flat=True)))
+        self.assertEqual(plans.first().plan, SEQ_SCAN_PLAN)
+
+    def test_other_views_ignored(self, explain):
+        """Test views outside QUERY_PLAN_NAMESPACES are left alone"""
+        admin = get_user_model().objects.create_superuser(
+            'admin@example.com', 'testpass123')
+        self.client.force_login(admin)
+
+        self.client.get(reverse('admin:index'))
+
+        explain.assert_not_called()
+        self.assertFalse(QueryPlan.objects.exists())
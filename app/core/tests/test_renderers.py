@@ -0,0 +1,75 @@
+"""
+Tests for the JSON renderer and parser
+"""
+import datetime
+import decimal
+import io
+import json
+import uuid
+
+from django.test import SimpleTestCase
+from rest_framework import renderers
+from rest_framework.exceptions import ParseError
+
+from core.parsers import JSONParser
+from core.renderers import JSONRenderer
+
+
+class JSONRendererTests(SimpleTestCase):
+    """Test the JSON renderer"""
+
+    def test_matches_drf_renderer(self):
+        """Test that output matches the stdlib based renderer"""
+        data = {
+            'id': 1,
+            'title': 'Plov \u2028 é',
+            'price': decimal.Decimal('10.50'),
+            'uuid': uuid.UUID(int=1),
+            'created': datetime.datetime(
+                2024, 1, 1, 12, 0, 0, 123456, tzinfo=datetime.timezone.utc),
+            'tags': [{'id': 2, 'name': 'Main'}],
+        }
+
+        expected = renderers.JSONRenderer().render(data)
+
+        self.assertEqual(JSONRenderer().render(data), expected)
+
+    def test_non_string_keys(self):
+        """Test that non-string keys fall back to the stdlib renderer"""
+        data = {1: 'one'}
+
+        self.assertEqual(JSONRenderer().render(data), b'{"1":"one"}')
+
+    def test_indent_requested(self):
+        """Test that indentation requests are honoured"""
+        data = {'id': 1}
+
+        res = JSONRenderer().render(
+            data, 'application/json; indent=4', {})
+
+        self.assertEqual(res, b'{\n    "id": 1\n}')
+
+    def test_none_renders_empty(self):
+        """Test that None renders an empty body"""
+        self.assertEqual(JSONRenderer().render(None), b'')
+
+
+class JSONParserTests(SimpleTestCase):
+    """Test the JSON parser"""
+
+    def test_parse(self):
+        """Test parsing a JSON body"""
+        data = {'title': 'Plov', 'tags': [{'name': 'Main'}]}
+        stream = io.BytesIO(json.dumps(data).encode())
+
+        self.assertEqual(JSONParser().parse(stream), data)
+
+    def test_parse_invalid(self):
+        """Test that invalid JSON raises a parse error"""
+        with self.assertRaises(ParseError):
+            JSONParser().parse(io.BytesIO(b'{"title": '))
+
+    def test_parse_rejects_nan(self):
+        """Test that non-standard constants are rejected"""
+        with self.assertRaises(ParseError):
+            JSONParser().parse(io.BytesIO(b'{"price": NaN}'))
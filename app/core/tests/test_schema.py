@@ -0,0 +1,79 @@
+"""
+Tests for the precomputed OpenAPI schema
+"""
+import tempfile
+from io import StringIO
+from pathlib import Path
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+
+from core import schema
+from core.views import SchemaView
+
+SCHEMA_URL = reverse('api-schema')
+
+
+class SchemaTests(SimpleTestCase):
+    """Test building and serving the schema artifact"""
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.root = Path(tmp_dir.name)
+
+        settings_override = override_settings(
+            SCHEMA_ROOT=tmp_dir.name, APP_VERSION='test')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        for clear in (schema.code_version.cache_clear,
+                      SchemaView._cache.clear):
+            clear()
+            self.addCleanup(clear)
+
+    def test_build_schema_command(self):
+        """Test that the command writes versioned artifacts"""
+        (self.root / 'schema-old.yaml').write_text('stale')
+
+        call_command('build_schema', prune=True, stdout=StringIO())
+
+        self.assertEqual(
+            sorted(path.name for path in self.root.iterdir()),
+            ['schema-test.json', 'schema-test.yaml'],
+        )
+
+    def test_serves_artifact_from_disk(self):
+        """Test that the view serves the prebuilt file"""
+        (self.root / 'schema-test.yaml').write_bytes(b'openapi: 3.0.3\n')
+
+        with patch('core.schema.generate_schema') as generate:
+            res = self.client.get(SCHEMA_URL)
+
+        generate.assert_not_called()
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.content, b'openapi: 3.0.3\n')
+        self.assertEqual(res['Content-Type'], 'application/vnd.oai.openapi')
+        self.assertIn('max-age', res['Cache-Control'])
+        self.assertEqual(res['Vary'], 'Accept')
+
+    def test_builds_missing_artifact(self):
+        """Test that a missing artifact is generated and written"""
+        res = self.client.get(SCHEMA_URL, {'format': 'json'})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(
+            (self.root / 'schema-test.json').read_bytes(), res.content)
+
+    def test_etag_not_modified(self):
+        """Test that a matching If-None-Match returns 304"""
+        (self.root / 'schema-test.yaml').write_bytes(b'openapi: 3.0.3\n')
+        etag = self.client.get(SCHEMA_URL)['ETag']
+
+        res = self.client.get(SCHEMA_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.content, b'')
+        self.assertEqual(res['Vary'], 'Accept')
@@ -0,0 +1,185 @@
+"""
+Tests for routing per-user data to database shards
+"""
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.deletion import delete_user
+from core.models import Recipe, Tag, Tombstone
+from core.rebalance import move_user
+from core.sharding import ShardRouter, reserve_id_block, shard_map
+
+RECIPES_URL = reverse('recipe:recipe-list')
+SHARDS = ['default', 'shard1']
+
+
+def create_user(email='user@example.com', **params):
+    return get_user_model().objects.create_user(
+        email, 'testpass123', **params)
+
+
+def create_recipe(user, using, **params):
+    defaults = {'title': 'Recipe', 'time_minutes': 5, 'price': 100}
+    defaults.update(params)
+    return Recipe.objects.using(using).create(user=user, **defaults)
+
+
+@override_settings(DATABASE_SHARDS=SHARDS)
+class ShardingTests(TestCase):
+    """Test recipe data living on the user's shard"""
+
+    databases = {'default', 'shard1'}
+
+    def setUp(self):
+        reserve_id_block('shard1')
+        self.user = create_user(shard='shard1')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_assign_spreads_users(self):
+        """Test that new users are pinned to a shard by email"""
+        shards = {shard_map.assign(f'user{i}@example.com') for i in range(20)}
+
+        self.assertEqual(shards, set(SHARDS))
+        self.assertEqual(shard_map.assign('A@example.com'),
+                         shard_map.assign('a@example.com'))
+        user = create_user('new@example.com')
+        self.assertEqual(user.shard, shard_map.assign('new@example.com'))
+
+    def test_api_writes_to_users_shard(self):
+        """Test that recipes and tags created on the API go to the shard"""
+        payload = {
+            'title': 'Plov',
+            'time_minutes': 60,
+            'price': 500,
+            'tags': [{'name': 'Dinner'}],
+        }
+
+        res = self.client.post(RECIPES_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertFalse(Recipe.objects.using('default').exists())
+        recipe = Recipe.objects.using('shard1').get(id=res.data['id'])
+        self.assertEqual(
+            [tag.name for tag in recipe.tags.all()], ['Dinner'])
+        self.assertEqual(recipe.user, self.user)
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual([item['id'] for item in res.data], [recipe.id])
+
+    def test_ids_start_at_shard_block(self):
+        """Test that shard ids don't overlap the first shard's"""
+        recipe = create_recipe(self.user, 'shard1')
+
+        self.assertGreaterEqual(recipe.id, settings.SHARD_ID_BLOCK)
+
+    def test_delete_writes_tombstone_on_shard(self):
+        """Test that signal handlers follow the deleted row's shard"""
+        recipe = create_recipe(self.user, 'shard1')
+        recipe_id = recipe.id
+
+        recipe.delete()
+
+        self.assertTrue(Tombstone.objects.using('shard1').filter(
+            object_id=recipe_id).exists())
+        self.assertFalse(Tombstone.objects.using('default').exists())
+
+    def test_delete_user_on_shard(self):
+        """Test that account deletion removes rows on the shard"""
+        create_recipe(self.user, 'shard1')
+
+        for _ in delete_user(self.user.pk):
+            pass
+
+        self.assertFalse(Recipe.objects.using('shard1').exists())
+        self.assertFalse(get_user_model().objects.exists())
+
+    def test_router(self):
+        """Test where the router sends models and migrations"""
+        router = ShardRouter()
+        recipe = Recipe(user=self.user, title='Recipe')
+
+        self.assertEqual(router.db_for_write(Recipe, instance=recipe),
+                         'shard1')
+        self.assertEqual(router.db_for_read(Tag, instance=self.user),
+                         'shard1')
+        self.assertEqual(
+            router.db_for_read(get_user_model(), instance=recipe),
+            'default')
+        self.assertIsNone(router.db_for_read(Recipe))
+        self.assertIsNone(router.allow_migrate('shard1', 'core', 'recipe'))
+        self.assertFalse(router.allow_migrate('shard1', 'core'))
+
+
+@override_settings(DATABASE_SHARDS=SHARDS)
+class MoveUserTests(TestCase):
+    """Test moving a user's rows between shards"""
+
+    databases = {'default', 'shard1'}
+
+    def test_move_user(self):
+        """Test that rows keep their ids and links on the new shard"""
+        reserve_id_block('shard1')
+        user = create_user(shard='default')
+        tag = Tag.objects.create(user=user, name='Vegan')
+        recipes = [create_recipe(user, 'default') for _ in range(3)]
+        for recipe in recipes:
+            recipe.tags.add(tag)
+        deleted_id = recipes[0].id
+        recipes[0].delete()
+        out = StringIO()
+
+        call_command('move_user', user.email, 'shard1', batch_size=2,
+                     stdout=out)
+
+        user.refresh_from_db()
+        self.assertEqual(user.shard, 'shard1')
+        self.assertFalse(Recipe.objects.using('default').exists())
+        self.assertFalse(Tag.objects.using('default').exists())
+        moved = Recipe.objects.using('shard1').order_by('id')
+        self.assertEqual([recipe.id for recipe in moved],
+                         [recipe.id for recipe in recipes[1:]])
+        for recipe in moved:
+            self.assertEqual(list(recipe.tags.all()), [tag])
+        self.assertTrue(Tombstone.objects.using('shard1').filter(
+            object_id=deleted_id).exists())
+        self.assertIn('Moved user', out.getvalue())
+
+    def test_delete_on_target_mid_move(self):
+        """Test rows deleted on the new shard mid-move stay deleted"""
+        reserve_id_block('shard1')
+        user = create_user(shard='default')
+        tag = Tag.objects.create(user=user, name='Vegan')
+        recipes = [create_recipe(user, 'default') for _ in range(2)]
+        for recipe in recipes:
+            recipe.tags.add(tag)
+        deleted_id = recipes[0].id
+
+        moving = move_user(user, 'shard1', batch_size=10)
+        for label, _ in moving:
+            if label == 'recipes':
+                break
+        # The user deletes a moved recipe before its links are copied.
+        Recipe.objects.using('shard1').get(pk=deleted_id).delete()
+        list(moving)
+
+        on_target = Recipe.objects.using('shard1')
+        self.assertEqual(list(on_target.values_list('id', flat=True)),
+                         [recipes[1].id])
+        self.assertEqual(
+            list(Recipe.tags.through.objects.using('shard1').values_list(
+                'recipe_id', flat=True)),
+            [recipes[1].id])
+
+        # Resuming from a copy of the source brings nothing back.
+        recipe = create_recipe(user, 'default', id=deleted_id)
+        recipe.tags.add(tag.pk)
+        list(move_user(user, 'shard1', source='default', batch_size=10))
+        self.assertFalse(on_target.filter(pk=deleted_id).exists())
+        self.assertFalse(Recipe.objects.using('default').exists())
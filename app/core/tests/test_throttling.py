@@ -0,0 +1,226 @@
+"""
+Tests for cache backed throttling
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from unittest.mock import Mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import AuthToken, Recipe
+from core.throttling import SlidingWindowThrottle, TokenThrottle, UserThrottle
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def rates(**rates):
+    """Override throttle rates, leaving other scopes unlimited."""
+    return override_settings(REST_FRAMEWORK={
+        **settings.REST_FRAMEWORK,
+        'DEFAULT_THROTTLE_RATES': {
+            'user': None, 'token': None, 'expensive': None, **rates,
+        },
+    })
+
+
+class FakeTimer:
+    def __init__(self, now=6000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class SlowCache:
+    """Cache adding latency to every call, like a networked one"""
+
+    def __init__(self, cache, delay=0.002):
+        self.cache = cache
+        self.delay = delay
+
+    def __getattr__(self, name):
+        method = getattr(self.cache, name)
+
+        def call(*args, **kwargs):
+            time.sleep(self.delay)
+            return method(*args, **kwargs)
+        return call
+
+
+def make_request(user_id=1):
+    return SimpleNamespace(
+        user=SimpleNamespace(pk=user_id, is_authenticated=True), auth=None)
+
+
+class BurstThrottle(UserThrottle):
+    scope = 'burst'
+
+
+class SlidingWindowThrottleTests(TestCase):
+    """Test the sliding window counting"""
+
+    def setUp(self):
+        cache.clear()
+        SlidingWindowThrottle.finished_counts.clear()
+        self.timer = FakeTimer()
+
+    def throttle(self):
+        throttle = UserThrottle()
+        throttle.timer = self.timer
+        return throttle
+
+    def allowed(self, count, user_id=1):
+        return [
+            self.throttle().allow_request(make_request(user_id), None)
+            for _ in range(count)
+        ]
+
+    def allowed_stacked(self, throttle_classes, count, user_id=1):
+        """Check requests against several throttles, as a view does."""
+        allowed = []
+        for _ in range(count):
+            request = make_request(user_id)
+            results = []
+            for throttle_class in throttle_classes:
+                throttle = throttle_class()
+                throttle.timer = self.timer
+                results.append(throttle.allow_request(request, None))
+            allowed.append(all(results))
+        return allowed
+
+    @rates(user='3/min')
+    def test_burst_up_to_rate(self):
+        """Test that the full rate is available at once"""
+        self.assertEqual(self.allowed(4), [True, True, True, False])
+
+    @rates(user='3/min')
+    def test_users_counted_separately(self):
+        """Test that each user has their own allowance"""
+        self.allowed(3)
+
+        self.assertEqual(self.allowed(1, user_id=2), [True])
+
+    @rates(user='4/min')
+    def test_capacity_refills_gradually(self):
+        """Test that capacity returns as the previous window decays"""
+        self.allowed(4)
+
+        self.timer.now += 60
+        self.assertEqual(self.allowed(2), [False, False])
+        self.timer.now += 15
+        self.assertEqual(self.allowed(2), [True, False])
+        self.timer.now += 45
+        self.assertEqual(self.allowed(4), [True, True, True, False])
+
+    @rates(user='4/min')
+    def test_wait(self):
+        """Test the retry delay covers the time until a slot frees up"""
+        self.allowed(4)
+        self.timer.now += 60
+        throttle = self.throttle()
+
+        self.assertFalse(throttle.allow_request(make_request(), None))
+        self.assertAlmostEqual(throttle.wait(), 15)
+
+    @rates(user='10/hour', burst='2/min')
+    def test_refused_requests_not_counted(self):
+        """Test that requests refused by one throttle don't use up another"""
+        for user_id, order in enumerate([
+                (UserThrottle, BurstThrottle), (BurstThrottle, UserThrottle)]):
+            self.assertEqual(
+                self.allowed_stacked(order, 5, user_id),
+                [True, True, False, False, False])
+
+            self.assertEqual(
+                self.allowed(9, user_id), [True] * 8 + [False])
+
+    @rates(user='5/min')
+    def test_concurrent_requests_counted_once(self):
+        """Test that simultaneous requests can't all pass the check"""
+        def allow(_):
+            throttle = self.throttle()
+            throttle.cache = SlowCache(cache)
+            return throttle.allow_request(make_request(), None)
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            allowed = list(pool.map(allow, range(40)))
+
+        self.assertEqual(allowed.count(True), 5)
+
+    @rates(user='100/min')
+    def test_one_cache_call_per_check(self):
+        """Test that a check costs a single incr once the key exists"""
+        self.allowed(2)
+        throttled_cache = Mock(wraps=cache)
+
+        for _ in range(3):
+            throttle = self.throttle()
+            throttle.cache = throttled_cache
+            self.assertTrue(throttle.allow_request(make_request(), None))
+
+        self.assertEqual(
+            [call[0] for call in throttled_cache.method_calls],
+            ['incr', 'incr', 'incr'],
+        )
+
+
+@rates(user='1000/min', token='2/min', expensive='2/min')
+class ThrottleApiTests(TestCase):
+    """Test throttling of the recipe API"""
+
+    def setUp(self):
+        cache.clear()
+        SlidingWindowThrottle.finished_counts.clear()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com',
+            'testpass123',
+        )
+        self.client = APIClient()
+
+    def test_expensive_actions_limited(self):
+        """Test that lists hit the tighter limit but details don't"""
+        self.client.force_authenticate(self.user)
+        recipe = Recipe.objects.create(
+            user=self.user, title='Soup', time_minutes=5, price=100)
+        detail_url = reverse('recipe:recipe-detail', args=[recipe.id])
+
+        codes = [self.client.get(RECIPES_URL).status_code for _ in range(3)]
+
+        self.assertEqual(codes, [200, 200, 429])
+        self.assertEqual(self.client.get(detail_url).status_code, 200)
+
+    def test_limit_per_token(self):
+        """Test that each token of a user has its own allowance"""
+        first = AuthToken.objects.create(user=self.user)
+        second = AuthToken.objects.create(user=self.user)
+        url = reverse('user:me')
+
+        def get(token):
+            return self.client.get(
+                url, HTTP_AUTHORIZATION=f'Token {token.key}').status_code
+
+        self.assertEqual([get(first) for _ in range(3)], [200, 200, 429])
+        self.assertEqual(get(second), 200)
+
+    def test_retry_after_header(self):
+        """Test that throttled responses say when to retry"""
+        self.client.force_authenticate(self.user)
+        for _ in range(2):
+            self.client.get(RECIPES_URL)
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertGreater(int(res['Retry-After']), 0)
+
+    def test_token_throttle_ignores_session_auth(self):
+        """Test that requests without a token skip the token limit"""
+        self.assertIsNone(TokenThrottle().get_cache_key(
+            make_request(), None))
@@ -0,0 +1,154 @@
+"""
+Rate limiting backed by the shared Django cache
+"""
+import hashlib
+
+from rest_framework.settings import api_settings
+from rest_framework.throttling import SimpleRateThrottle
+
+from core.models import AuthToken
+
+# Request attribute listing the (cache, key) counts a request has taken.
+COUNTED_ATTR = '_throttle_counts'
+
+
+class SlidingWindowThrottle(SimpleRateThrottle):
+    """
+    Token bucket style throttle counting requests in the shared cache.
+
+    Requests are counted per fixed window with atomic cache increments,
+    and the previous window's count is weighted by how much of it still
+    overlaps the last duration seconds. Clients can burst up to the
+    full rate, after which capacity comes back gradually as the old
+    window decays, instead of all at once at a window boundary.
+
+    The increment comes first and its result decides, so concurrent
+    requests can't all pass a check made before any of them counted.
+    A request refused by any throttle of the view gives back what it
+    counted in all of them, so clients that keep getting refused by a
+    short limit don't use up a longer one meanwhile. A window that has ended no
+    longer changes, so each process reads its count once and keeps it
+    in finished_counts; a check then costs a single incr.
+    """
+
+    finished_counts = {}
+
+    def get_rate(self):
+        """Read the rate at call time so settings overrides apply."""
+        self.THROTTLE_RATES = api_settings.DEFAULT_THROTTLE_RATES
+        return super().get_rate()
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        now = self.timer()
+        window, offset = divmod(now, self.duration)
+        current = f'{self.key}:{int(window)}'
+        count = self._incr(current)
+        self.previous_count = self.finished_count(int(window) - 1)
+        self.elapsed = offset
+        used = self.previous_count * (1 - offset / self.duration) + count
+        # Counts taken by the throttles checked before this one, or None
+        # once one of them refused the request.
+        counted = getattr(request, COUNTED_ATTR, [])
+        if used > self.num_requests:
+            self.used = used - 1
+            for cache, key in [(self.cache, current), *(counted or ())]:
+                self._decr(cache, key)
+            setattr(request, COUNTED_ATTR, None)
+            return self.throttle_failure()
+        if counted is None:
+            self._decr(self.cache, current)
+        else:
+            setattr(request, COUNTED_ATTR, [*counted, (self.cache, current)])
+        return self.throttle_success()
+
+    def _incr(self, key):
+        """Increment key and return its count, creating it if missing."""
+        try:
+            return self.cache.incr(key)
+        except ValueError:
+            pass
+        # Keep each window around until it stops counting as previous.
+        if self.cache.add(key, 1, 2 * self.duration):
+            return 1
+        return self.cache.incr(key)
+
+    @staticmethod
+    def _decr(cache, key):
+        """Give back a count taken with _incr."""
+        try:
+            cache.decr(key)
+        except ValueError:
+            pass
+
+    def finished_count(self, window):
+        """Return the count of an ended window, read once per process."""
+        bucket = (self.duration, window)
+        counts = self.finished_counts.get(bucket)
+        if counts is None:
+            for old in list(self.finished_counts):
+                if old[0] == self.duration and old[1] < window:
+                    self.finished_counts.pop(old, None)
+            counts = self.finished_counts.setdefault(bucket, {})
+        if self.key not in counts:
+            counts[self.key] = self.cache.get(f'{self.key}:{window}', 0)
+        return counts[self.key]
+
+    def throttle_success(self):
+        return True
+
+    def wait(self):
+        """Return seconds until the weighted count drops below the rate."""
+        remaining = self.duration - self.elapsed
+        if not self.previous_count:
+            return remaining
+        excess = self.used - self.num_requests + 1
+        decay_per_second = self.previous_count / self.duration
+        return min(remaining, excess / decay_per_second)
+
+
+class UserThrottle(SlidingWindowThrottle):
+    """Limit requests per user, or per client address when anonymous."""
+
+    scope = 'user'
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            ident = request.user.pk
+        else:
+            ident = self.get_ident(request)
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+
+class TokenThrottle(SlidingWindowThrottle):
+    """Limit requests per API token, so one leaked token can't use up
+    the whole account's allowance."""
+
+    scope = 'token'
+
+    def get_cache_key(self, request, view):
+        if not isinstance(request.auth, AuthToken):
+            return None
+        ident = hashlib.sha256(request.auth.key.encode()).hexdigest()[:32]
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+
+class ExpensiveThrottle(UserThrottle):
+    """
+    Tighter per-user limit for the actions a view lists in
+    expensive_actions, such as unpaginated lists and nested writes.
+    """
+
+    scope = 'expensive'
+
+    def get_cache_key(self, request, view):
+        action = getattr(view, 'action', None)
+        if action not in getattr(view, 'expensive_actions', ()):
+            return None
+        return super().get_cache_key(request, view)
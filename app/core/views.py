@@ -0,0 +1,83 @@
+"""
+Views for core app.
+"""
+import hashlib
+import logging
+import threading
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers,
+)
+from django.views import View
+
+from core import schema
+
+logger = logging.getLogger(__name__)
+
+
+class SchemaView(View):
+    """
+    Serve the OpenAPI schema from its precomputed artifact.
+
+    The artifact is read once per process and per format. It is only
+    generated here when the deploy didn't build it for this code version.
+    """
+
+    _cache = {}
+    _lock = threading.Lock()
+
+    def get(self, request, *args, **kwargs):
+        fmt = self.get_format(request)
+        content, etag = self.load(fmt)
+
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(
+                content, content_type=schema.RENDERERS[fmt].media_type)
+        response['ETag'] = etag
+        patch_cache_control(
+            response, public=True, max_age=settings.SCHEMA_CACHE_MAX_AGE)
+        # The format can follow Accept, so caches must key on it too.
+        patch_vary_headers(response, ['Accept'])
+        return response
+
+    @staticmethod
+    def get_format(request):
+        """Select yaml or json from ?format= or the Accept header."""
+        fmt = request.GET.get('format')
+        if fmt in schema.RENDERERS:
+            return fmt
+        if 'json' in request.META.get('HTTP_ACCEPT', ''):
+            return 'json'
+        return 'yaml'
+
+    @classmethod
+    def load(cls, fmt):
+        """Return schema content and ETag, building the file if missing."""
+        key = (schema.code_version(), fmt)
+        if key not in cls._cache:
+            with cls._lock:
+                if key not in cls._cache:
+                    content = cls._read_or_build(fmt)
+                    etag = '"%s"' % hashlib.sha256(content).hexdigest()[:32]
+                    cls._cache[key] = (content, etag)
+        return cls._cache[key]
+
+    @staticmethod
+    def _read_or_build(fmt):
+        path = schema.schema_path(fmt)
+        try:
+            return path.read_bytes()
+        except FileNotFoundError:
+            pass
+        content = schema.generate_schema(fmt)
+        try:
+            schema.write_schema(fmt, content)
+        except OSError:
+            logger.warning('Could not write schema artifact %s', path,
+                           exc_info=True)
+        return content
@@ -0,0 +1,55 @@
+"""
+Gunicorn configuration for running the API in production.
+
+Django, the URLconf and serializers are loaded in the master process
+and frozen out of the garbage collector before workers are forked.
+Serve the ASGI app instead by setting SERVER_APP=app.asgi and
+SERVER_WORKER_CLASS=uvicorn.workers.UvicornWorker.
+"""
+import gc
+import multiprocessing
+import os
+
+wsgi_app = os.environ.get('SERVER_APP', 'app.wsgi')
+worker_class = os.environ.get('SERVER_WORKER_CLASS', 'sync')
+bind = os.environ.get('SERVER_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get(
+    'SERVER_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+
+# Import the app once in the master so workers share its pages.
+preload_app = True
+
+# Recycle workers after a number of requests to bound memory growth.
+# Jitter keeps workers from restarting all at once.
+max_requests = int(os.environ.get('SERVER_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.environ.get('SERVER_MAX_REQUESTS_JITTER', 100))
+
+# Seconds workers get to finish in-flight requests on shutdown.
+graceful_timeout = int(os.environ.get('SERVER_GRACEFUL_TIMEOUT', 30))
+timeout = int(os.environ.get('SERVER_TIMEOUT', 30))
+
+# An empty SERVER_ACCESS_LOG turns access logging off.
+accesslog = os.environ.get('SERVER_ACCESS_LOG', '-') or None
+
+# Avoid collections touching (and so copying) shared pages in the master.
+gc.disable()
+
+
+def when_ready(server):
+    """Warm up the master once the app is loaded, before forking."""
+    from app import preload
+
+    preload.preload()
+    preload.freeze()
+
+
+def post_fork(server, worker):
+    """Turn the garbage collector back on in each worker."""
+    gc.enable()
+
+
+def worker_exit(server, worker):
+    """Close database connections when a worker shuts down."""
+    from django.db import connections
+
+    connections.close_all()
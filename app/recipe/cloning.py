@@ -0,0 +1,136 @@
+"""
+Copy recipes with set-based SQL
+"""
+from django.db import connections, transaction
+from django.utils import timezone
+
+from core.events import publish
+from core.models import Recipe, Tombstone
+from core.sharding import db_for_user
+from core.similarity import index_recipes
+
+
+def _recipe_columns(connection, user_id):
+    """
+    Return (column names, select expressions, params) copying every
+    concrete recipe column except the primary key onto user_id, with
+    auto_now timestamps set to the current time.
+    """
+    qn = connection.ops.quote_name
+    now = timezone.now()
+    columns, selects, params = [], [], []
+    for field in Recipe._meta.concrete_fields:
+        if field.primary_key:
+            continue
+        columns.append(qn(field.column))
+        if field.column == 'user_id':
+            expression, extra = '%s', [user_id]
+        elif getattr(field, 'auto_now', False):
+            expression, extra = '%s', [field.get_db_prep_value(
+                now, connection)]
+        else:
+            expression, extra = f'r.{qn(field.column)}', []
+        selects.append(expression)
+        params.extend(extra)
+    return columns, selects, params
+
+
+def _through_tables(connection):
+    """Return (table, recipe column, other column) per M2M of Recipe."""
+    qn = connection.ops.quote_name
+    tables = []
+    for field in Recipe._meta.many_to_many:
+        through = field.remote_field.through._meta
+        tables.append((
+            qn(through.db_table),
+            qn(field.m2m_column_name()),
+            qn(field.m2m_reverse_name()),
+        ))
+    return tables
+
+
+def _clone_postgresql(connection, recipe_ids, user_id):
+    """
+    Copy all recipes and their through rows in a single statement.
+
+    New ids are drawn from the recipe sequence up front, so the through
+    rows can be inserted alongside the recipes in the same statement.
+    """
+    qn = connection.ops.quote_name
+    table = qn(Recipe._meta.db_table)
+    columns, selects, params = _recipe_columns(connection, user_id)
+    ctes = [
+        f'src AS (SELECT id AS old_id, '
+        f"nextval(pg_get_serial_sequence('{Recipe._meta.db_table}', 'id')) "
+        f'AS new_id FROM {table} WHERE id = ANY(%s) AND user_id = %s)',
+        f'recipes AS (INSERT INTO {table} (id, {", ".join(columns)}) '
+        f'SELECT src.new_id, {", ".join(selects)} FROM {table} r '
+        f'JOIN src ON r.id = src.old_id)',
+    ]
+    for i, (through, recipe_col, other_col) in enumerate(
+        _through_tables(connection)
+    ):
+        ctes.append(
+            f'links_{i} AS (INSERT INTO {through} ({recipe_col}, {other_col}) '
+            f'SELECT src.new_id, t.{other_col} FROM {through} t '
+            f'JOIN src ON t.{recipe_col} = src.old_id)'
+        )
+    sql = f'WITH {", ".join(ctes)} SELECT old_id, new_id FROM src'
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [list(recipe_ids), user_id] + params)
+        return dict(cursor.fetchall())
+
+
+def _clone_generic(connection, recipe_ids, user_id):
+    """Copy each recipe with a fixed number of INSERT ... SELECTs."""
+    qn = connection.ops.quote_name
+    table = qn(Recipe._meta.db_table)
+    columns, selects, params = _recipe_columns(connection, user_id)
+    mapping = {}
+    with connection.cursor() as cursor:
+        for recipe_id in recipe_ids:
+            cursor.execute(
+                f'INSERT INTO {table} ({", ".join(columns)}) '
+                f'SELECT {", ".join(selects)} FROM {table} r '
+                f'WHERE r.id = %s AND r.user_id = %s',
+                params + [recipe_id, user_id],
+            )
+            if not cursor.rowcount:
+                continue
+            new_id = cursor.lastrowid
+            mapping[recipe_id] = new_id
+            for through, recipe_col, other_col in _through_tables(
+                connection
+            ):
+                cursor.execute(
+                    f'INSERT INTO {through} ({recipe_col}, {other_col}) '
+                    f'SELECT %s, {other_col} FROM {through} '
+                    f'WHERE {recipe_col} = %s',
+                    [new_id, recipe_id],
+                )
+    return mapping
+
+
+def clone_recipes(recipe_ids, user, using=None):
+    """
+    Copy the user's recipes with recipe_ids, including their tags and
+    ingredients, and return {source id: clone id}.
+
+    Ids that don't belong to the user are left out of the result. The
+    clones are added to the similarity index and announced to the
+    user's live streams.
+    """
+    recipe_ids = list(dict.fromkeys(recipe_ids))
+    using = using or db_for_user(user)
+    connection = connections[using]
+    if not recipe_ids:
+        return {}
+    with transaction.atomic(using=using):
+        if connection.vendor == 'postgresql':
+            mapping = _clone_postgresql(connection, recipe_ids, user.pk)
+        else:
+            mapping = _clone_generic(connection, recipe_ids, user.pk)
+        index_recipes(mapping.values(), using)
+        for clone_id in mapping.values():
+            publish(user.pk, Tombstone.RECIPE, 'created', clone_id, using)
+    return mapping
@@ -0,0 +1,88 @@
+"""
+Set based updates of a recipe's tags and ingridients
+"""
+from core.models import Ingridient, Recipe
+from core.rollup import adjust_totals, ingridient_sums
+from core.sharding import db_for_user
+from core.similarity import index_recipes
+
+
+def resolve_names(model, user, names, using=None):
+    """
+    Return {name: id} for the user's objects called names, creating
+    missing ones with a single bulk insert.
+    """
+    names = set(names)
+    if not names:
+        return {}
+    using = using or db_for_user(user)
+    queryset = model.objects.using(using).filter(user=user, name__in=names)
+    ids = dict(queryset.values_list('name', 'id'))
+    missing = names - ids.keys()
+    if missing:
+        created = model.objects.using(using).bulk_create(
+            [model(user=user, name=name) for name in missing])
+        if all(obj.pk for obj in created):
+            ids.update((obj.name, obj.pk) for obj in created)
+        else:
+            # Backends that can't return ids from a bulk insert.
+            ids.update(queryset.filter(
+                name__in=missing).values_list('name', 'id'))
+    return ids
+
+
+def apply_operations(recipe, field_name, user, add=(), remove=(),
+                     replace=None):
+    """
+    Update the recipe's field_name relation by name.
+
+    add and remove are applied as set differences against the names of
+    the existing through rows; replace sets the relation to exactly the
+    given names. Rows that stay are not touched: stale links go in a
+    single DELETE and new ones in a single bulk INSERT. For ingridients
+    the recipe totals move by the difference in one more UPDATE, and
+    the recipe's similarity bands are recomputed when anything changed.
+    """
+    field = Recipe._meta.get_field(field_name)
+    model = field.related_model
+    through = field.remote_field.through
+    source = field.m2m_field_name()
+    target = field.m2m_reverse_field_name()
+
+    db = recipe._state.db
+    links = through.objects.using(db).filter(**{source: recipe})
+    linked = {}
+    for link in links.values_list('id', f'{target}_id', f'{target}__name'):
+        linked.setdefault(link[2], []).append(link)
+
+    if replace is not None:
+        add, remove = set(replace), linked.keys() - set(replace)
+    to_add = set(add) - linked.keys()
+    to_remove = [
+        link
+        for name in set(remove) & linked.keys()
+        for link in linked[name]
+    ]
+
+    removed_ids = [target_id for _, target_id, _ in to_remove]
+    added_ids = []
+    if to_remove:
+        through.objects.using(db).filter(
+            id__in=[link_id for link_id, _, _ in to_remove]).delete()
+    if to_add:
+        added_ids = list(resolve_names(model, user, to_add, using=db).values())
+        through.objects.using(db).bulk_create([
+            through(**{source: recipe, f'{target}_id': pk})
+            for pk in added_ids])
+
+    if model is Ingridient and (added_ids or removed_ids):
+        sums = ingridient_sums(
+            Ingridient.objects.using(db).filter(
+                pk__in=added_ids + removed_ids),
+            subtract=removed_ids,
+        )
+        adjust_totals(Recipe.objects.using(db).filter(pk=recipe.pk), sums)
+        for total, value in sums.items():
+            setattr(recipe, total, (getattr(recipe, total) or 0) + value)
+    if added_ids or removed_ids:
+        index_recipes([recipe.pk], db)
@@ -6,18 +6,30 @@ from core.models import (
     Tag,
     Ingridient,
 )
+from core.sharding import db_for_user
+from recipe.relations import apply_operations
 
 
-class IngridientSerializer(serializers.ModelSerializer):
+class UserOwnedSerializer(serializers.ModelSerializer):
+    """serializer class creating objects on their user's shard"""
+
+    def create(self, validated_data):
+        """create the object in the database of its user"""
+        manager = self.Meta.model.objects.using(
+            db_for_user(validated_data['user']))
+        return manager.create(**validated_data)
+
+
+class IngridientSerializer(UserOwnedSerializer):
     """serializer class for ingridient objects"""
 
     class Meta:
         model = Ingridient
-        fields = ('id', 'name')
+        fields = ('id', 'name', 'cost', 'calories')
         read_only_fields = ('id',)
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(UserOwnedSerializer):
     """serializer class for tag objects"""
 
     class Meta:
@@ -26,59 +38,132 @@ class TagSerializer(serializers.ModelSerializer):
         read_only_fields = ('id',)
 
 
+class RelationOperationsSerializer(serializers.Serializer):
+    """serializer class for add, remove and set operations by name"""
+    item_serializer = None
+
+    def get_fields(self):
+        fields = super().get_fields()
+        for name in ('add', 'remove', 'set'):
+            fields[name] = serializers.ListField(
+                child=self.item_serializer(), required=False)
+        return fields
+
+    def validate(self, attrs):
+        """check that the operations don't contradict each other"""
+        if 'set' in attrs and ('add' in attrs or 'remove' in attrs):
+            raise serializers.ValidationError(
+                'set cannot be combined with add or remove.')
+        add = {item['name'] for item in attrs.get('add', [])}
+        remove = {item['name'] for item in attrs.get('remove', [])}
+        if add & remove:
+            raise serializers.ValidationError(
+                f'Cannot both add and remove {sorted(add & remove)}.')
+        return attrs
+
+
+class TagOperationsSerializer(RelationOperationsSerializer):
+    """serializer class for tag operations"""
+    item_serializer = TagSerializer
+
+
+class IngridientOperationsSerializer(RelationOperationsSerializer):
+    """serializer class for ingridient operations"""
+    item_serializer = IngridientSerializer
+
+
 class RecipeSerializer(serializers.ModelSerializer):
     """serializer class for recipe objects"""
     tags = TagSerializer(many=True, required=False)
-    ingridients = IngridientSerializer(many=True, required=False)
+    ingridients = IngridientSerializer(
+        many=True, required=False, source='ingredients')
+    tag_operations = TagOperationsSerializer(
+        write_only=True, required=False)
+    ingridient_operations = IngridientOperationsSerializer(
+        write_only=True, required=False)
 
     class Meta:
         model = Recipe
         fields = ('id', 'title', 'time_minutes',
-                  'price', 'link', 'tags', 'ingridients')
-        read_only_fields = ('id',)
+                  'price', 'link', 'tags', 'ingridients',
+                  'tag_operations', 'ingridient_operations',
+                  'total_cost', 'total_calories')
+        read_only_fields = ('id', 'total_cost', 'total_calories')
+
+    def validate(self, attrs):
+        """
+        reject cost and calories on nested ingridients, which are only
+        linked by name and keep the values they have
+        """
+        nested = {'ingridients': attrs.get('ingredients', [])}
+        for key, items in attrs.get('ingridient_operations', {}).items():
+            nested[f'ingridient_operations.{key}'] = items
+        errors = {}
+        for field, items in nested.items():
+            for item in items:
+                values = [attr for attr in ('cost', 'calories')
+                          if item.get(attr) is not None]
+                if values:
+                    errors[field] = [
+                        f'Set {" and ".join(values)} of "{item["name"]}" '
+                        f'through the ingridients endpoint.']
+                    break
+        if errors:
+            raise serializers.ValidationError(errors)
+        return attrs
+
+    def _pop_operations(self, validated_data):
+        """
+        return {relation: apply_operations kwargs} from validated_data
+
+        nested tags and ingridients are only ever added, the explicit
+        operations can also remove or replace.
+        """
+        operations = {}
+        for field, operations_field in (
+            ('tags', 'tag_operations'),
+            ('ingredients', 'ingridient_operations'),
+        ):
+            ops = {
+                key: [item['name'] for item in items]
+                for key, items in validated_data.pop(
+                    operations_field, {}).items()
+            }
+            added = [item['name'] for item in validated_data.pop(field, [])]
+            replace = ops.get('set')
+            operations[field] = {
+                'add': ops.get('add', []) + added,
+                'remove': ops.get('remove', []),
+                'replace': None if replace is None else replace + added,
+            }
+        return operations
+
+    def _apply_operations(self, recipe, operations):
+        """apply relation changes, skipping relations left alone"""
+        author = self.context['request'].user
+        for field, kwargs in operations.items():
+            if kwargs['add'] or kwargs['remove'] or \
+                    kwargs['replace'] is not None:
+                apply_operations(recipe, field, author, **kwargs)
 
     def create(self, validated_data):
         """create a new recipe"""
-        tags = validated_data.pop('tags', [])
-        ingridients = validated_data.pop('ingridients', [])
-        recipe = Recipe.objects.create(**validated_data)
-        author = self.context['request'].user
-        for tag in tags:
-            tag_obj, created = Tag.objects.get_or_create(
-                user=author,
-                **tag,
-            )
-            recipe.tags.add(tag_obj)
-        for ingridient in ingridients:
-            ingridient_obj, created = Ingridient.objects.get_or_create(
-                user=author,
-                **ingridient,
-            )
-            recipe.ingridients.add(ingridient_obj)
+        operations = self._pop_operations(validated_data)
+        recipe = Recipe.objects.using(
+            db_for_user(validated_data['user'])).create(**validated_data)
+        self._apply_operations(recipe, operations)
         return recipe
 
     def update(self, instance, validated_data):
         """update a recipe"""
-        tags = validated_data.pop('tags', [])
-        ingridients = validated_data.pop('ingridients', [])
+        operations = self._pop_operations(validated_data)
         recipe = super().update(instance, validated_data)
         author = self.context['request'].user
         if author != recipe.user:
             raise serializers.ValidationError(
                 'You are not the author of this recipe.'
             )
-        for tag in tags:
-            tag_obj, created = Tag.objects.get_or_create(
-                user=author,
-                **tag,
-            )
-            recipe.tags.add(tag_obj)
-        for ingridient in ingridients:
-            ingridient_obj, created = Ingridient.objects.get_or_create(
-                user=author,
-                **ingridient,
-            )
-            recipe.ingridients.add(ingridient_obj)
+        self._apply_operations(recipe, operations)
         return recipe
 
 
@@ -87,3 +172,44 @@ class RecipeDetailSerializer(RecipeSerializer):
 
     class Meta(RecipeSerializer.Meta):
         fields = RecipeSerializer.Meta.fields + ('description',)
+
+
+class SimilarRecipeSerializer(RecipeSerializer):
+    """serializer class for recipes ranked by similarity"""
+    similarity = serializers.FloatField(read_only=True)
+
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + ('similarity',)
+
+
+class RecipeCloneSerializer(serializers.Serializer):
+    """serializer class for cloning many recipes at once"""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        min_length=1,
+        max_length=100,
+    )
+
+
+class RecipeBatchSerializer(serializers.Serializer):
+    """serializer class for recipes fetched by id in one request"""
+    results = RecipeDetailSerializer(many=True, read_only=True)
+    missing = serializers.ListField(
+        child=serializers.IntegerField(), read_only=True)
+
+
+class SyncDeletedSerializer(serializers.Serializer):
+    """serializer class for ids deleted since the last sync"""
+    recipes = serializers.ListField(child=serializers.IntegerField())
+    tags = serializers.ListField(child=serializers.IntegerField())
+    ingridients = serializers.ListField(child=serializers.IntegerField())
+
+
+class SyncSerializer(serializers.Serializer):
+    """serializer class for delta sync responses"""
+    recipes = RecipeDetailSerializer(many=True)
+    tags = TagSerializer(many=True)
+    ingridients = IngridientSerializer(many=True)
+    deleted = SyncDeletedSerializer()
+    next = serializers.CharField()
+    has_more = serializers.BooleanField()
@@ -0,0 +1,165 @@
+"""
+Delta sync of a user's recipes, tags and ingridients
+
+Rows are paged by their (updated_at, id) cursor. updated_at is taken
+before the write commits, so a slow transaction can commit a row
+behind a cursor a client has already moved past. Pages therefore only
+reach up to SYNC_SAFETY_LAG before the request; rows newer than that
+are sent on a later sync, once every transaction that could still
+commit behind them has finished.
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from core.models import Ingridient, Recipe, Tag, Tombstone
+from core.sharding import db_for_user
+
+# Response key -> model
+KINDS = {
+    'recipes': Recipe,
+    'tags': Tag,
+    'ingridients': Ingridient,
+}
+DELETED = 'deleted'
+TOMBSTONE_KEYS = {
+    Tombstone.RECIPE: 'recipes',
+    Tombstone.TAG: 'tags',
+    Tombstone.INGRIDIENT: 'ingridients',
+}
+
+
+class InvalidToken(ValueError):
+    """The sync token could not be decoded."""
+
+
+class TokenExpired(Exception):
+    """Tombstones the token relies on have been purged."""
+
+
+def encode_token(cursors, issued, until=None):
+    """
+    Pack {kind: (timestamp, id)} into an opaque URL safe string, with
+    the upper bound of the pages still to come, if any.
+    """
+    data = {
+        kind: [timestamp.isoformat(), pk]
+        for kind, (timestamp, pk) in cursors.items()
+    }
+    data['issued'] = issued.isoformat()
+    if until is not None:
+        data['until'] = until.isoformat()
+    raw = json.dumps(data, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_token(token):
+    """Unpack a token made by encode_token into (cursors, issued, until)."""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        data = json.loads(raw)
+        cursors = {
+            kind: (datetime.fromisoformat(data[kind][0]), int(data[kind][1]))
+            for kind in (*KINDS, DELETED)
+        }
+        issued = datetime.fromisoformat(data['issued'])
+        until = data.get('until')
+        if until is not None:
+            until = datetime.fromisoformat(until)
+    except (binascii.Error, ValueError, TypeError, KeyError, IndexError):
+        raise InvalidToken('Invalid sync token.')
+    timestamps = [issued] + [timestamp for timestamp, _ in cursors.values()]
+    if until is not None:
+        timestamps.append(until)
+    if any(timestamp.tzinfo is None for timestamp in timestamps):
+        raise InvalidToken('Invalid sync token.')
+    return cursors, issued, until
+
+
+def after(queryset, field, cursor, until):
+    """
+    Filter queryset to rows after (timestamp, id) and up to until, in
+    sync order.
+    """
+    timestamp, pk = cursor
+    return queryset.filter(
+        Q(**{f'{field}__gt': timestamp}) |
+        Q(**{field: timestamp, 'id__gt': pk}),
+        **{f'{field}__lte': until},
+    ).order_by(field, 'id')
+
+
+def initial_cursors(user, until):
+    """
+    Cursors for a client with no local data: every live row, and only
+    tombstones written after until.
+    """
+    epoch = datetime.min.replace(tzinfo=timezone.utc)
+    cursors = {kind: (epoch, 0) for kind in KINDS}
+    latest = Tombstone.objects.using(db_for_user(user)).filter(
+        user=user, deleted_at__lte=until,
+    ).order_by('-deleted_at', '-id').values_list('deleted_at', 'id').first()
+    cursors[DELETED] = latest or (epoch, 0)
+    return cursors
+
+
+def fetch_page(queryset, field, cursor, limit, until):
+    """Return (rows, new cursor, more rows waiting)."""
+    rows = list(after(queryset, field, cursor, until)[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if rows:
+        last = rows[-1]
+        cursor = (getattr(last, field), last.id)
+    return rows, cursor, has_more
+
+
+def sync(user, token=None, limit=None):
+    """
+    Return changes for user since token.
+
+    Each kind of row and the tombstones keep their own (timestamp, id)
+    cursor, so a page holds up to limit rows of each. The result holds
+    the changed rows, the ids deleted per kind, the token for the next
+    call and whether more changes are waiting. Rows are served up to
+    SYNC_SAFETY_LAG ago; while more pages are waiting, the token keeps
+    that bound so a catch-up ends.
+    """
+    limit = limit or settings.SYNC_PAGE_SIZE
+    now = timezone.now()
+    until = now - settings.SYNC_SAFETY_LAG
+    if token:
+        cursors, issued, pending = decode_token(token)
+        if issued < now - settings.SYNC_TOMBSTONE_TTL:
+            raise TokenExpired('Sync token expired, start a full sync.')
+        until = pending or until
+    else:
+        cursors = initial_cursors(user, until)
+
+    db = db_for_user(user)
+    result = {'deleted': {kind: [] for kind in KINDS}, 'has_more': False}
+    for kind, model in KINDS.items():
+        queryset = model.objects.using(db).filter(user=user)
+        if model is Recipe:
+            queryset = queryset.prefetch_related('tags', 'ingredients')
+        rows, cursors[kind], has_more = fetch_page(
+            queryset, 'updated_at', cursors[kind], limit, until)
+        result[kind] = rows
+        result['has_more'] |= has_more
+
+    tombstones, cursors[DELETED], has_more = fetch_page(
+        Tombstone.objects.using(db).filter(user=user).only(
+            'id', 'kind', 'object_id', 'deleted_at'),
+        'deleted_at', cursors[DELETED], limit, until)
+    for tombstone in tombstones:
+        result['deleted'][TOMBSTONE_KEYS[tombstone.kind]].append(
+            tombstone.object_id)
+    result['has_more'] |= has_more
+    result['next'] = encode_token(
+        cursors, now, until if result['has_more'] else None)
+    return result
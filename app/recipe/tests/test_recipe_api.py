@@ -2,20 +2,27 @@
 Test for the recipe APIs
 """
 
+from unittest.mock import patch
+
 from django.contrib.auth import get_user_model
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from core.models import Recipe
+from core.models import Recipe, RecipeBand, Tag, Ingridient
+from core.similarity import index_recipes
 from recipe.serializers import (
     RecipeSerializer,
     RecipeDetailSerializer
 )
 
 RECIPES_URL = reverse('recipe:recipe-list')
+CLONE_MANY_URL = reverse('recipe:recipe-clone-many')
+BATCH_URL = reverse('recipe:recipe-batch')
 
 
 def detail_url(recipe_id):
@@ -23,6 +30,16 @@ def detail_url(recipe_id):
     return reverse('recipe:recipe-detail', args=[recipe_id])
 
 
+def clone_url(recipe_id):
+    """return recipe clone url"""
+    return reverse('recipe:recipe-clone', args=[recipe_id])
+
+
+def similar_url(recipe_id):
+    """return similar recipes url"""
+    return reverse('recipe:recipe-similar', args=[recipe_id])
+
+
 def create_recipe(user, **params):
     """create and return a sample recipe"""
     defaults = {
@@ -136,3 +153,585 @@ class PrivateRecipeApiTests(TestCase):
         for key in payload.keys():
             self.assertEqual(payload[key], getattr(recipe, key))
         self.assertEqual(recipe.user, self.user)
+
+
+class RecipeRelationsApiTests(TestCase):
+    """test writing recipe tags and ingridients"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            "user@example.com",
+            "password213"
+        )
+        self.client.force_authenticate(self.user)
+
+    def create_tagged_recipe(self, *names):
+        """create a recipe tagged with names"""
+        recipe = create_recipe(user=self.user)
+        for name in names:
+            recipe.tags.add(Tag.objects.create(user=self.user, name=name))
+        return recipe
+
+    def tag_names(self, recipe):
+        return set(recipe.tags.values_list('name', flat=True))
+
+    def test_create_with_tags_and_ingridients(self):
+        """test creating a recipe with nested tags and ingridients"""
+        Tag.objects.create(user=self.user, name='vegan')
+        payload = {
+            'title': 'salad',
+            'time_minutes': 5,
+            'price': 300,
+            'tags': [{'name': 'vegan'}, {'name': 'quick'}],
+            'ingridients': [{'name': 'lettuce'}],
+        }
+
+        response = self.client.post(RECIPES_URL, payload, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        recipe = Recipe.objects.get(id=response.data['id'])
+        self.assertEqual(self.tag_names(recipe), {'vegan', 'quick'})
+        self.assertEqual(Tag.objects.filter(name='vegan').count(), 1)
+        self.assertEqual(
+            [i['name'] for i in response.data['ingridients']], ['lettuce'])
+
+    def test_add_keeps_existing_links(self):
+        """test adding a tag leaves existing through rows alone"""
+        recipe = self.create_tagged_recipe('a', 'b')
+        links = set(
+            Recipe.tags.through.objects.values_list('id', flat=True))
+
+        response = self.client.patch(
+            detail_url(recipe.id),
+            {'tag_operations': {'add': [{'name': 'b'}, {'name': 'c'}]}},
+            format='json',
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.tag_names(recipe), {'a', 'b', 'c'})
+        self.assertTrue(links < set(
+            Recipe.tags.through.objects.values_list('id', flat=True)))
+
+    def test_remove_tags(self):
+        """test removing tags from a recipe"""
+        recipe = self.create_tagged_recipe('a', 'b', 'c')
+
+        self.client.patch(
+            detail_url(recipe.id),
+            {'tag_operations': {'remove': [{'name': 'a'}, {'name': 'x'}]}},
+            format='json',
+        )
+
+        self.assertEqual(self.tag_names(recipe), {'b', 'c'})
+        self.assertTrue(Tag.objects.filter(name='a').exists())
+        self.assertFalse(Tag.objects.filter(name='x').exists())
+
+    def test_set_ingridients(self):
+        """test replacing the ingridients of a recipe"""
+        recipe = create_recipe(user=self.user)
+        recipe.ingredients.add(
+            Ingridient.objects.create(user=self.user, name='salt'),
+            Ingridient.objects.create(user=self.user, name='pepper'),
+        )
+
+        self.client.patch(
+            detail_url(recipe.id),
+            {'ingridient_operations': {
+                'set': [{'name': 'salt'}, {'name': 'sugar'}]}},
+            format='json',
+        )
+
+        self.assertEqual(
+            set(recipe.ingredients.values_list('name', flat=True)),
+            {'salt', 'sugar'},
+        )
+
+    def test_set_cannot_be_combined(self):
+        """test that set is rejected together with add or remove"""
+        recipe = self.create_tagged_recipe('a')
+
+        response = self.client.patch(
+            detail_url(recipe.id),
+            {'tag_operations': {'set': [], 'add': [{'name': 'b'}]}},
+            format='json',
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.tag_names(recipe), {'a'})
+
+    def test_update_queries_independent_of_size(self):
+        """test that patch cost depends on the change, not the recipe"""
+        small = self.create_tagged_recipe('t0')
+        large = self.create_tagged_recipe(*[f't{i}' for i in range(30)])
+        payload = {'tag_operations': {
+            'add': [{'name': 'new'}], 'remove': [{'name': 't0'}]}}
+
+        with CaptureQueriesContext(connection) as small_queries:
+            self.client.patch(detail_url(small.id), payload, format='json')
+        Tag.objects.filter(name='new').delete()
+        with CaptureQueriesContext(connection) as large_queries:
+            self.client.patch(detail_url(large.id), payload, format='json')
+
+        writes = [
+            q['sql'] for q in large_queries
+            if q['sql'].startswith(('INSERT', 'DELETE'))
+        ]
+        self.assertEqual(len(small_queries), len(large_queries))
+        # links deleted and inserted, the new tag, the similarity bands
+        self.assertEqual(len(writes), 5)
+
+
+class RecipeCloneApiTests(TestCase):
+    """test cloning recipes"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            "user@example.com",
+            "password213"
+        )
+        self.client.force_authenticate(self.user)
+
+    def create_full_recipe(self, tags=2, ingridients=2, **params):
+        """create a recipe with tags and ingridients"""
+        recipe = create_recipe(user=self.user, **params)
+        for i in range(tags):
+            recipe.tags.add(
+                Tag.objects.create(user=self.user, name=f'tag {i}'))
+        for i in range(ingridients):
+            recipe.ingredients.add(
+                Ingridient.objects.create(user=self.user, name=f'ing {i}'))
+        return recipe
+
+    def test_clone_recipe(self):
+        """test cloning a recipe copies its fields, tags and ingridients"""
+        recipe = self.create_full_recipe(title='soup')
+
+        response = self.client.post(clone_url(recipe.id))
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        clone = Recipe.objects.get(id=response.data['id'])
+        self.assertNotEqual(clone.id, recipe.id)
+        self.assertEqual(clone.user, self.user)
+        for field in ('title', 'description', 'time_minutes', 'price',
+                      'link'):
+            self.assertEqual(getattr(clone, field), getattr(recipe, field))
+        self.assertEqual(set(clone.tags.all()), set(recipe.tags.all()))
+        self.assertEqual(
+            set(clone.ingredients.all()), set(recipe.ingredients.all()))
+
+    def test_clone_queries_constant(self):
+        """test cloning runs the same queries whatever the recipe size"""
+        small = self.create_full_recipe(tags=1, ingridients=1)
+        large = self.create_full_recipe(tags=20, ingridients=30)
+
+        with CaptureQueriesContext(connection) as small_queries:
+            self.client.post(clone_url(small.id))
+        with CaptureQueriesContext(connection) as large_queries:
+            self.client.post(clone_url(large.id))
+
+        self.assertEqual(len(small_queries), len(large_queries))
+
+    def test_clone_other_users_recipe(self):
+        """test that recipes of other users can't be cloned"""
+        other = get_user_model().objects.create_user(
+            "other@example.com",
+            "password213",
+        )
+        recipe = create_recipe(user=other)
+
+        response = self.client.post(clone_url(recipe.id))
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(Recipe.objects.count(), 1)
+
+    def test_clone_many(self):
+        """test cloning many recipes at once keeps the requested order"""
+        recipes = [
+            self.create_full_recipe(title=f'recipe {i}') for i in range(3)]
+        ids = [recipes[2].id, recipes[0].id]
+
+        response = self.client.post(
+            CLONE_MANY_URL, {'ids': ids}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            [item['title'] for item in response.data],
+            ['recipe 2', 'recipe 0'],
+        )
+        self.assertEqual(Recipe.objects.count(), 5)
+
+    def test_clone_many_missing(self):
+        """test that nothing is cloned when an id is not found"""
+        recipe = create_recipe(user=self.user)
+
+        response = self.client.post(
+            CLONE_MANY_URL, {'ids': [recipe.id, recipe.id + 100]},
+            format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Recipe.objects.count(), 1)
+
+
+class RecipeTotalsApiTests(TestCase):
+    """test cost and calorie totals rolled up from ingridients"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            "user@example.com",
+            "password213"
+        )
+        self.client.force_authenticate(self.user)
+        self.rice = Ingridient.objects.create(
+            user=self.user, name='rice', cost=100, calories=300)
+        self.lamb = Ingridient.objects.create(
+            user=self.user, name='lamb', cost=900, calories=500)
+
+    def totals(self, recipe):
+        recipe.refresh_from_db()
+        return recipe.total_cost, recipe.total_calories
+
+    def test_create_rolls_up_ingridients(self):
+        """test creating a recipe sums its ingridients"""
+        payload = {
+            'title': 'plov',
+            'time_minutes': 90,
+            'price': 1500,
+            'ingridients': [{'name': 'rice'}, {'name': 'lamb'},
+                            {'name': 'carrot'}],
+        }
+
+        response = self.client.post(RECIPES_URL, payload, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['total_cost'], 1000)
+        self.assertEqual(response.data['total_calories'], 800)
+        recipe = Recipe.objects.get(id=response.data['id'])
+        self.assertEqual(self.totals(recipe), (1000, 800))
+
+    def test_nested_ingridient_values_rejected(self):
+        """test cost and calories on a recipe's ingridients are an error"""
+        payload = {
+            'title': 'plov',
+            'time_minutes': 90,
+            'price': 1500,
+            'ingridients': [{'name': 'rice', 'cost': 1}],
+        }
+
+        response = self.client.post(RECIPES_URL, payload, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('ingridients', response.data)
+        self.assertFalse(Recipe.objects.exists())
+
+        recipe = create_recipe(user=self.user)
+        response = self.client.patch(
+            detail_url(recipe.id),
+            {'ingridient_operations': {
+                'add': [{'name': 'carrot', 'calories': 40}]}},
+            format='json',
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('ingridient_operations.add', response.data)
+        self.assertFalse(Ingridient.objects.filter(name='carrot').exists())
+        self.rice.refresh_from_db()
+        self.assertEqual(self.rice.cost, 100)
+
+    def test_nested_ingridient_without_values(self):
+        """test ingridients echoed back without values are accepted"""
+        recipe = create_recipe(user=self.user)
+
+        response = self.client.patch(
+            detail_url(recipe.id),
+            {'ingridients': [
+                {'name': 'rice', 'cost': None, 'calories': None}]},
+            format='json',
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.totals(recipe), (100, 300))
+
+    def test_operations_adjust_totals(self):
+        """test adding and removing ingridients moves the totals"""
+        recipe = create_recipe(user=self.user)
+        recipe.ingredients.add(self.rice)
+        self.assertEqual(self.totals(recipe), (100, 300))
+
+        response = self.client.patch(
+            detail_url(recipe.id),
+            {'ingridient_operations': {
+                'add': [{'name': 'lamb'}], 'remove': [{'name': 'rice'}]}},
+            format='json',
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['total_cost'], 900)
+        self.assertEqual(self.totals(recipe), (900, 500))
+
+    def test_m2m_changes_adjust_totals(self):
+        """test ORM add, remove and clear keep totals in step"""
+        recipe = create_recipe(user=self.user)
+
+        recipe.ingredients.add(self.rice, self.lamb)
+        self.assertEqual(self.totals(recipe), (1000, 800))
+        recipe.ingredients.remove(self.rice)
+        recipe.ingredients.remove(self.rice)
+        self.assertEqual(self.totals(recipe), (900, 500))
+        self.lamb.recipe_set.add(create_recipe(user=self.user))
+        self.lamb.recipe_set.clear()
+        self.assertEqual(self.totals(recipe), (0, 0))
+
+    def test_ingridient_changes_adjust_totals(self):
+        """test editing or deleting an ingridient updates its recipes"""
+        recipe = create_recipe(user=self.user)
+        recipe.ingredients.add(self.rice, self.lamb)
+        url = reverse('recipe:ingridient-detail', args=[self.rice.id])
+
+        response = self.client.patch(url, {'cost': 150})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.totals(recipe), (1050, 800))
+        self.lamb.delete()
+        self.assertEqual(self.totals(recipe), (150, 300))
+
+    def test_order_and_filter_by_totals(self):
+        """test sorting and filtering the list by totals"""
+        cheap = create_recipe(user=self.user, title='cheap')
+        cheap.ingredients.add(self.rice)
+        dear = create_recipe(user=self.user, title='dear')
+        dear.ingredients.add(self.lamb)
+        create_recipe(user=self.user, title='free')
+
+        response = self.client.get(RECIPES_URL, {'ordering': '-total_cost'})
+        self.assertEqual(
+            [item['title'] for item in response.data],
+            ['dear', 'cheap', 'free'])
+
+        response = self.client.get(
+            RECIPES_URL, {'min_cost': 1, 'max_calories': 400})
+        self.assertEqual(
+            [item['title'] for item in response.data], ['cheap'])
+
+    def test_invalid_list_params(self):
+        """test bad ordering and range values are rejected"""
+        response = self.client.get(
+            RECIPES_URL, {'ordering': 'price', 'min_cost': 'x'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(set(response.data), {'ordering', 'min_cost'})
+
+
+class RecipeSimilarApiTests(TestCase):
+    """test recipes ranked by similar tags and ingridients"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            "user@example.com",
+            "password213"
+        )
+        self.client.force_authenticate(self.user)
+
+    def create_linked_recipe(self, tags=(), ingridients=(), user=None,
+                             **params):
+        """create a recipe linked to tags and ingridients by name"""
+        user = user or self.user
+        recipe = create_recipe(user=user, **params)
+        recipe.tags.add(*[
+            Tag.objects.get_or_create(user=user, name=name)[0]
+            for name in tags])
+        recipe.ingredients.add(*[
+            Ingridient.objects.get_or_create(user=user, name=name)[0]
+            for name in ingridients])
+        return recipe
+
+    def test_similar_recipes_ranked(self):
+        """test recipes are ranked by shared tags and ingridients"""
+        plov = self.create_linked_recipe(
+            ['rice', 'uzbek'], ['rice', 'lamb', 'carrot', 'onion'])
+        wedding_plov = self.create_linked_recipe(
+            ['rice', 'uzbek'], ['rice', 'lamb', 'carrot', 'onion', 'raisin'])
+        pilaf = self.create_linked_recipe(
+            ['rice'], ['rice', 'lamb', 'carrot'])
+        self.create_linked_recipe(['dessert'], ['sugar', 'flour'])
+
+        response = self.client.get(similar_url(plov.id))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data],
+            [wedding_plov.id, pilaf.id])
+        self.assertEqual(response.data[0]['similarity'], 0.8571)
+        self.assertEqual(response.data[1]['similarity'], 0.6667)
+
+    def test_similar_recipes_limited_to_user(self):
+        """test recipes of other users are never suggested"""
+        other = get_user_model().objects.create_user(
+            'other@example.com', 'password123')
+        plov = self.create_linked_recipe(['uzbek'], ['rice', 'lamb'])
+        self.create_linked_recipe(['uzbek'], ['rice', 'lamb'], user=other)
+
+        response = self.client.get(similar_url(plov.id))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, [])
+
+    def test_index_follows_operations(self):
+        """test changing a recipe's ingridients updates its neighbours"""
+        plov = self.create_linked_recipe(['uzbek'], ['rice', 'lamb'])
+        soup = self.create_linked_recipe([], ['water'])
+
+        response = self.client.patch(
+            detail_url(soup.id),
+            {'tag_operations': {'add': [{'name': 'uzbek'}]},
+             'ingridient_operations': {
+                 'add': [{'name': 'rice'}, {'name': 'lamb'}],
+                 'remove': [{'name': 'water'}]}},
+            format='json',
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.client.get(similar_url(plov.id))
+        self.assertEqual(
+            [(recipe['id'], recipe['similarity'])
+             for recipe in response.data],
+            [(soup.id, 1.0)])
+
+    def test_index_follows_deleted_ingridient(self):
+        """test deleting an ingridient updates the recipes using it"""
+        plov = self.create_linked_recipe([], ['rice', 'lamb'])
+        pilaf = self.create_linked_recipe([], ['rice', 'lamb', 'salt'])
+        self.assertEqual(
+            self.client.get(similar_url(plov.id)).data[0]['similarity'],
+            0.6667)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingridient.objects.get(name='salt').delete()
+
+        response = self.client.get(similar_url(plov.id))
+        self.assertEqual(
+            [(recipe['id'], recipe['similarity'])
+             for recipe in response.data],
+            [(pilaf.id, 1.0)])
+
+    def test_deleted_tag_reindexed_after_commit(self):
+        """test recipes losing a tag are rehashed once the delete commits"""
+        plov = self.create_linked_recipe(['uzbek', 'rice'], [])
+        before = set(RecipeBand.objects.filter(
+            recipe=plov).values_list('bucket', flat=True))
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            Tag.objects.get(name='uzbek').delete()
+        self.assertEqual(set(RecipeBand.objects.filter(
+            recipe=plov).values_list('bucket', flat=True)), before)
+
+        for callback in callbacks:
+            callback()
+        after = set(RecipeBand.objects.filter(
+            recipe=plov).values_list('bucket', flat=True))
+        self.assertNotEqual(after, before)
+        index_recipes([plov.id], 'default')
+        self.assertEqual(set(RecipeBand.objects.filter(
+            recipe=plov).values_list('bucket', flat=True)), after)
+
+    def test_index_in_batches(self):
+        """test recipes are indexed a bounded number at a time"""
+        recipes = [
+            self.create_linked_recipe(['uzbek'], [], title=f'copy {i}')
+            for i in range(5)
+        ]
+
+        with patch('core.similarity._index_batch') as index_batch:
+            index_recipes([recipe.id for recipe in recipes], 'default',
+                          batch_size=2)
+
+        self.assertEqual(
+            [len(call.args[0]) for call in index_batch.call_args_list],
+            [2, 2, 1])
+
+    def test_similar_recipes_limit(self):
+        """test the limit parameter caps the results"""
+        plov = self.create_linked_recipe(['uzbek'], ['rice'])
+        for i in range(3):
+            self.create_linked_recipe(['uzbek'], ['rice'], title=f'copy {i}')
+
+        response = self.client.get(similar_url(plov.id), {'limit': 2})
+        self.assertEqual(len(response.data), 2)
+
+        response = self.client.get(similar_url(plov.id), {'limit': 51})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('limit', response.data)
+
+
+class RecipeBatchApiTests(TestCase):
+    """test fetching many recipes by id"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            "user@example.com",
+            "password213"
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_batch_preserves_order(self):
+        """test recipes come back in the requested order"""
+        recipes = [
+            create_recipe(user=self.user, title=f'recipe {i}')
+            for i in range(3)
+        ]
+        recipes[0].tags.add(Tag.objects.create(user=self.user, name='tag'))
+        ids = [recipes[2].id, recipes[0].id, recipes[1].id]
+
+        response = self.client.get(
+            BATCH_URL, {'ids': ','.join(map(str, ids))})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        serializer = RecipeDetailSerializer(
+            [recipes[2], recipes[0], recipes[1]], many=True)
+        self.assertEqual(response.data['results'], serializer.data)
+        self.assertEqual(response.data['missing'], [])
+
+    def test_batch_reports_missing(self):
+        """test unknown ids and other users' recipes are reported"""
+        other = get_user_model().objects.create_user(
+            'other@example.com', 'password123')
+        mine = create_recipe(user=self.user)
+        theirs = create_recipe(user=other)
+
+        response = self.client.get(
+            BATCH_URL, {'ids': f'{theirs.id},{mine.id},{mine.id},999'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']], [mine.id])
+        self.assertEqual(response.data['missing'], [theirs.id, 999])
+
+    def test_batch_queries_independent_of_size(self):
+        """test the number of queries doesn't grow with the batch"""
+        ids = []
+        for i in range(10):
+            recipe = create_recipe(user=self.user, title=f'recipe {i}')
+            recipe.tags.add(
+                Tag.objects.create(user=self.user, name=f'tag {i}'))
+            recipe.ingredients.add(
+                Ingridient.objects.create(user=self.user, name=f'ing {i}'))
+            ids.append(recipe.id)
+
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(BATCH_URL, {'ids': ids[0]})
+        with CaptureQueriesContext(connection) as large:
+            self.client.get(BATCH_URL, {'ids': ','.join(map(str, ids))})
+
+        self.assertEqual(len(small), len(large))
+
+    def test_batch_validates_ids(self):
+        """test ids must be integers, between 1 and 100 of them"""
+        for ids in ('', 'abc', ','.join(map(str, range(1, 102)))):
+            response = self.client.get(BATCH_URL, {'ids': ids})
+            self.assertEqual(
+                response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('ids', response.data)
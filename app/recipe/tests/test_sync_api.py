@@ -0,0 +1,199 @@
+"""Test cases for the delta sync API."""
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Ingridient, Recipe, Tag
+from recipe.sync import decode_token, encode_token
+
+SYNC_URL = reverse('recipe:sync')
+
+
+def create_user(email="test@example.com", password="testpass123"):
+    """Helper function for creating a user."""
+    return get_user_model().objects.create_user(email, password)
+
+
+def create_recipe(user, **params):
+    """create and return a sample recipe"""
+    defaults = {'title': 'sample recipe', 'time_minutes': 10, 'price': 500}
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class PublicSyncApiTests(TestCase):
+    """Test the sync API without authentication."""
+
+    def test_login_required(self):
+        """Test that login is required for syncing."""
+        res = APIClient().get(SYNC_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+# Changes are synced as soon as they are written; the lag is tested on
+# its own in SyncSafetyLagTests.
+@override_settings(SYNC_SAFETY_LAG=timedelta(0))
+class PrivateSyncApiTests(TestCase):
+    """Test the sync API for an authenticated user."""
+
+    def setUp(self):
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def sync(self, since=None, **params):
+        if since:
+            params['since'] = since
+        res = self.client.get(SYNC_URL, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res.data
+
+    def test_full_sync(self):
+        """Test that a sync without a token returns all rows."""
+        recipe = create_recipe(self.user)
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        Ingridient.objects.create(user=self.user, name='Salt')
+        create_recipe(create_user('other@example.com'))
+        recipe.delete()
+
+        data = self.sync()
+
+        self.assertEqual(data['recipes'], [])
+        self.assertEqual([t['id'] for t in data['tags']], [tag.id])
+        self.assertEqual(len(data['ingridients']), 1)
+        self.assertEqual(
+            data['deleted'], {'recipes': [], 'tags': [], 'ingridients': []})
+        self.assertFalse(data['has_more'])
+
+    def test_delta_sync(self):
+        """Test that only rows changed since the token are returned."""
+        recipe = create_recipe(self.user)
+        create_recipe(self.user, title='unchanged')
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        token = self.sync()['next']
+
+        recipe.title = 'changed'
+        recipe.save()
+        tag_id = tag.id
+        tag.delete()
+        data = self.sync(token)
+
+        self.assertEqual([r['title'] for r in data['recipes']], ['changed'])
+        self.assertEqual(data['tags'], [])
+        self.assertEqual(data['deleted']['tags'], [tag_id])
+        self.assertEqual(self.sync(data['next'])['recipes'], [])
+
+    def test_tag_changes_touch_recipe(self):
+        """Test that adding or deleting a tag marks the recipe changed."""
+        recipe = create_recipe(self.user)
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        token = self.sync()['next']
+
+        recipe.tags.add(tag)
+        data = self.sync(token)
+        self.assertEqual([r['id'] for r in data['recipes']], [recipe.id])
+
+        tag_id = tag.id
+        tag.delete()
+        data = self.sync(data['next'])
+        self.assertEqual([r['id'] for r in data['recipes']], [recipe.id])
+        self.assertEqual(data['deleted']['tags'], [tag_id])
+
+    def test_paging(self):
+        """Test that large deltas are returned in pages."""
+        recipes = [create_recipe(self.user, title=f'r{i}') for i in range(3)]
+
+        first = self.sync(limit=2)
+        second = self.sync(first['next'], limit=2)
+
+        self.assertTrue(first['has_more'])
+        self.assertFalse(second['has_more'])
+        self.assertEqual(
+            [r['id'] for r in first['recipes'] + second['recipes']],
+            [recipe.id for recipe in recipes],
+        )
+
+    def test_invalid_token(self):
+        """Test that a malformed token is rejected."""
+        res = self.client.get(SYNC_URL, {'since': 'not-a-token'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_invalid_limit(self):
+        """Test that the page size is bounded."""
+        res = self.client.get(SYNC_URL, {'limit': 0})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_expired_token(self):
+        """Test that tokens older than the tombstone TTL need a full sync."""
+        cursors, _, _ = decode_token(self.sync()['next'])
+        token = encode_token(cursors, timezone.now() - timedelta(days=365))
+
+        res = self.client.get(SYNC_URL, {'since': token})
+
+        self.assertEqual(res.status_code, status.HTTP_410_GONE)
+
+
+@override_settings(SYNC_SAFETY_LAG=timedelta(seconds=30))
+class SyncSafetyLagTests(TestCase):
+    """Test that changes are only served once they are settled."""
+
+    def setUp(self):
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.start = timezone.now()
+
+    def sync_at(self, seconds, since=None, **params):
+        if since:
+            params['since'] = since
+        with patch('recipe.sync.timezone.now',
+                   return_value=self.start + timedelta(seconds=seconds)):
+            res = self.client.get(SYNC_URL, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res.data
+
+    def write(self, title, seconds):
+        """Create a recipe that took its timestamp at start + seconds."""
+        recipe = create_recipe(self.user, title=title)
+        Recipe.objects.filter(pk=recipe.pk).update(
+            updated_at=self.start + timedelta(seconds=seconds))
+        return recipe
+
+    def test_out_of_order_commits(self):
+        """Test a write committing after a later one is not skipped."""
+        self.write('fast', 1)
+        # The client syncs while the slow write is still uncommitted.
+        data = self.sync_at(2)
+        self.assertEqual(data['recipes'], [])
+
+        self.write('slow', 0)
+        data = self.sync_at(40, data['next'])
+
+        self.assertEqual(
+            [r['title'] for r in data['recipes']], ['slow', 'fast'])
+        self.assertEqual(self.sync_at(80, data['next'])['recipes'], [])
+
+    def test_pages_keep_their_bound(self):
+        """Test a paged catch-up stops at the bound of its first page."""
+        for i in range(3):
+            self.write(f'r{i}', i)
+
+        first = self.sync_at(40, limit=2)
+        self.write('late', 20)
+        second = self.sync_at(100, first['next'], limit=2)
+        third = self.sync_at(100, second['next'], limit=2)
+
+        self.assertTrue(first['has_more'])
+        self.assertEqual([r['title'] for r in second['recipes']], ['r2'])
+        self.assertFalse(second['has_more'])
+        self.assertEqual([r['title'] for r in third['recipes']], ['late'])
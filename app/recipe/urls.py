@@ -14,5 +14,6 @@ router.register('ingridients', views.IngridientViewSet)
 app_name = 'recipe'
 
 urlpatterns = [
+    path('sync/', views.SyncView.as_view(), name='sync'),
     path('', include(router.urls))
 ]
@@ -1,42 +1,239 @@
 """Views for recipe app."""
 
+from django.conf import settings
+from django.urls import reverse
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import (
+    OpenApiParameter,
+    extend_schema,
+    extend_schema_view,
+)
 from rest_framework import (
+    generics,
     viewsets,
     mixins,
+    status,
 )
-from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import ValidationError
+from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
 
+from core.authentication import ExpiringTokenAuthentication
+from core.idempotency import idempotent
 from core.models import (
     Recipe,
     Tag,
     Ingridient,
 )
+from core.sharding import db_for_user
+from core.similarity import similar_recipes
 from recipe import serializers
+from recipe.cloning import clone_recipes
+from recipe.sync import InvalidToken, TokenExpired, sync
 
 
+@extend_schema_view(list=extend_schema(parameters=[
+    OpenApiParameter(
+        'ordering', OpenApiTypes.STR,
+        enum=['total_cost', '-total_cost',
+              'total_calories', '-total_calories'],
+        description='Sort by ingridient totals; newest first by default.'),
+    OpenApiParameter('min_cost', OpenApiTypes.INT),
+    OpenApiParameter('max_cost', OpenApiTypes.INT),
+    OpenApiParameter('min_calories', OpenApiTypes.INT),
+    OpenApiParameter('max_calories', OpenApiTypes.INT),
+]))
 class RecipeViewSet(viewsets.ModelViewSet):
     """viewset for recipe objects apis"""
 
     serializer_class = serializers.RecipeDetailSerializer
     queryset = Recipe.objects.all()
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (ExpiringTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
+    # Throttled by ExpensiveThrottle on top of the per-user limits.
+    expensive_actions = ('list', 'create', 'clone_many')
+    # Each is served by a (user, total, id) index.
+    orderings = ('total_cost', '-total_cost',
+                 'total_calories', '-total_calories')
+    range_filters = {
+        'min_cost': 'total_cost__gte',
+        'max_cost': 'total_cost__lte',
+        'min_calories': 'total_calories__gte',
+        'max_calories': 'total_calories__lte',
+    }
+    similar_limit = 10
+    max_similar_limit = 50
+    max_batch_size = 100
 
     def get_queryset(self):
         """return recipes for authenticated user"""
-        return self.queryset.filter(user=self.request.user).order_by('-id')
+        queryset = self.queryset.using(db_for_user(self.request.user)).filter(
+            user=self.request.user)
+        if self.action == 'list':
+            return self.filter_list(queryset)
+        return queryset.order_by('-id')
+
+    def filter_list(self, queryset):
+        """apply the ordering and total range query parameters"""
+        params = self.request.query_params
+        errors = {}
+        for param, lookup in self.range_filters.items():
+            if param not in params:
+                continue
+            try:
+                queryset = queryset.filter(**{lookup: int(params[param])})
+            except ValueError:
+                errors[param] = ['A valid integer is required.']
+
+        ordering = params.get('ordering')
+        if ordering is None:
+            queryset = queryset.order_by('-id')
+        elif ordering in self.orderings:
+            id_ordering = '-id' if ordering.startswith('-') else 'id'
+            queryset = queryset.order_by(ordering, id_ordering)
+        else:
+            errors['ordering'] = [
+                f'Must be one of {", ".join(self.orderings)}.']
+        if errors:
+            raise ValidationError(errors)
+        return queryset
 
     def perform_create(self, serializer):
         """create a new recipe"""
         serializer.save(user=self.request.user)
 
+    def get_success_headers(self, data):
+        """point to the created recipe"""
+        return {'Location': reverse('recipe:recipe-detail', args=[data['id']])}
+
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        """create a recipe, replaying retries with the same key"""
+        return super().create(request, *args, **kwargs)
+
+    @idempotent
+    def update(self, request, *args, **kwargs):
+        """update a recipe, replaying retries with the same key"""
+        return super().update(request, *args, **kwargs)
+
     def get_serializer_class(self):
         """return appropriate serializer class"""
-        if self.action == 'list':
+        if self.action in ('list', 'clone_many'):
             return serializers.RecipeSerializer
+        if self.action == 'similar':
+            return serializers.SimilarRecipeSerializer
         return self.serializer_class
 
+    @action(methods=['post'], detail=True)
+    @idempotent
+    def clone(self, request, pk=None):
+        """copy a recipe with its tags and ingridients"""
+        recipe = self.get_object()
+        clones = clone_recipes([recipe.id], request.user)
+        clone = self.get_queryset().prefetch_related(
+            'tags', 'ingredients').get(id=clones[recipe.id])
+        serializer = self.get_serializer(clone)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    @extend_schema(
+        operation_id='recipe_recipes_clone_many',
+        request=serializers.RecipeCloneSerializer,
+        responses={201: serializers.RecipeSerializer(many=True)},
+    )
+    @action(methods=['post'], detail=False, url_path='clone')
+    @idempotent
+    def clone_many(self, request):
+        """copy many recipes at once"""
+        serializer = serializers.RecipeCloneSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = list(dict.fromkeys(serializer.validated_data['ids']))
+
+        found = set(self.get_queryset().filter(
+            id__in=ids).values_list('id', flat=True))
+        missing = [recipe_id for recipe_id in ids if recipe_id not in found]
+        if missing:
+            return Response(
+                {'ids': [f'Recipes not found: {missing}']},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        clones = clone_recipes(ids, request.user)
+        recipes = self.get_queryset().prefetch_related(
+            'tags', 'ingredients').in_bulk(clones.values())
+        data = self.get_serializer(
+            [recipes[clones[recipe_id]] for recipe_id in ids], many=True,
+        ).data
+        return Response(data, status=status.HTTP_201_CREATED)
+
+    def get_batch_ids(self):
+        """return the distinct recipe ids requested, in order"""
+        ids = []
+        for value in self.request.query_params.getlist('ids'):
+            for part in filter(None, value.split(',')):
+                try:
+                    ids.append(int(part))
+                except ValueError:
+                    raise ValidationError({'ids': [
+                        f'"{part}" is not a valid recipe id.']})
+        ids = list(dict.fromkeys(ids))
+        if not 1 <= len(ids) <= self.max_batch_size:
+            raise ValidationError({'ids': [
+                f'Give between 1 and {self.max_batch_size} recipe ids.']})
+        return ids
+
+    @extend_schema(
+        parameters=[OpenApiParameter(
+            'ids', OpenApiTypes.STR, required=True,
+            description='Comma separated recipe ids, at most 100.')],
+        responses=serializers.RecipeBatchSerializer,
+    )
+    @action(methods=['get'], detail=False)
+    def batch(self, request):
+        """fetch many recipes by id, in the order requested"""
+        ids = self.get_batch_ids()
+        recipes = self.get_queryset().prefetch_related(
+            'tags', 'ingredients').in_bulk(ids)
+        serializer = serializers.RecipeBatchSerializer({
+            'results': [recipes[pk] for pk in ids if pk in recipes],
+            'missing': [pk for pk in ids if pk not in recipes],
+        }, context=self.get_serializer_context())
+        return Response(serializer.data)
+
+    def get_similar_limit(self):
+        """return the number of similar recipes requested by the client"""
+        limit = self.request.query_params.get('limit')
+        if limit is None:
+            return self.similar_limit
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = 0
+        if not 1 <= limit <= self.max_similar_limit:
+            raise ValidationError({'limit': [
+                f'Must be between 1 and {self.max_similar_limit}.']})
+        return limit
+
+    @extend_schema(
+        parameters=[OpenApiParameter(
+            'limit', OpenApiTypes.INT,
+            description='Maximum recipes to return, 10 by default.')],
+        responses=serializers.SimilarRecipeSerializer(many=True),
+    )
+    @action(methods=['get'], detail=True)
+    def similar(self, request, pk=None):
+        """recipes sharing the most tags and ingridients, best first"""
+        recipe = self.get_object()
+        scores = similar_recipes(recipe, limit=self.get_similar_limit())
+        recipes = self.get_queryset().prefetch_related(
+            'tags', 'ingredients').in_bulk([pk for pk, _ in scores])
+        ranked = []
+        for recipe_id, similarity in scores:
+            if recipe_id in recipes:
+                recipes[recipe_id].similarity = round(similarity, 4)
+                ranked.append(recipes[recipe_id])
+        return Response(self.get_serializer(ranked, many=True).data)
+
 
 class TagViewSet(
     mixins.ListModelMixin,
@@ -50,12 +247,13 @@ class TagViewSet(
 
     serializer_class = serializers.TagSerializer
     queryset = Tag.objects.all()
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (ExpiringTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
 
     def get_queryset(self):
         """return tags for authenticated user"""
-        return self.queryset.filter(user=self.request.user).order_by('-id')
+        return self.queryset.using(db_for_user(self.request.user)).filter(
+            user=self.request.user).order_by('-id')
 
     def perform_create(self, serializer):
         """create a new tag"""
@@ -74,13 +272,59 @@ class IngridientViewSet(
 
     serializer_class = serializers.IngridientSerializer
     queryset = Ingridient.objects.all()
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (ExpiringTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
 
     def get_queryset(self):
         """return ingridients for authenticated user"""
-        return self.queryset.filter(user=self.request.user).order_by('-id')
+        return self.queryset.using(db_for_user(self.request.user)).filter(
+            user=self.request.user).order_by('-id')
 
     def perform_create(self, serializer):
         """create a new ingridient"""
         serializer.save(user=self.request.user)
+
+
+@extend_schema(parameters=[
+    OpenApiParameter(
+        'since', OpenApiTypes.STR,
+        description='`next` token from the previous sync. '
+                    'Leave out for a full sync.'),
+    OpenApiParameter(
+        'limit', OpenApiTypes.INT,
+        description='Maximum rows of each kind per page.'),
+])
+class SyncView(generics.GenericAPIView):
+    """changes to recipes, tags and ingridients since the last sync"""
+
+    serializer_class = serializers.SyncSerializer
+    authentication_classes = (ExpiringTokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+
+    def get_limit(self):
+        """return the page size requested by the client"""
+        limit = self.request.query_params.get('limit')
+        if limit is None:
+            return settings.SYNC_PAGE_SIZE
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = 0
+        if not 1 <= limit <= settings.SYNC_PAGE_SIZE:
+            raise ValidationError({'limit': [
+                f'Must be between 1 and {settings.SYNC_PAGE_SIZE}.']})
+        return limit
+
+    def get(self, request):
+        """return rows changed or deleted since the given token"""
+        try:
+            changes = sync(
+                request.user,
+                token=request.query_params.get('since'),
+                limit=self.get_limit(),
+            )
+        except InvalidToken as exc:
+            raise ValidationError({'since': [str(exc)]})
+        except TokenExpired as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_410_GONE)
+        return Response(self.get_serializer(changes).data)
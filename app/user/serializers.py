@@ -9,6 +9,8 @@ from django.contrib.auth import (
 from django.utils.translation import ugettext as _
 from rest_framework import serializers
 
+from core.models import DeletionJob
+
 
 class UserSerializer(serializers.ModelSerializer):
     """Serializer for user object"""
@@ -68,3 +70,20 @@ class AuthTokenSerializer(serializers.Serializer):
 
         attrs['user'] = user
         return attrs
+
+
+class TokenSerializer(serializers.Serializer):
+    """Serializer for an issued auth token"""
+
+    token = serializers.CharField(read_only=True)
+
+
+class DeletionJobSerializer(serializers.ModelSerializer):
+    """Serializer for the progress of an account deletion"""
+
+    class Meta:
+        """Meta class for deletion job serializer"""
+
+        model = DeletionJob
+        fields = ['id', 'status', 'deleted', 'created_at', 'updated_at']
+        read_only_fields = fields
@@ -2,18 +2,27 @@
 Tests model for user APIs
 """
 
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 
 from rest_framework.test import APIClient
 from rest_framework import status
 
+from core.deletion import get_job
+from core.models import AuthToken, Recipe
+
 CREATE_USER_URL = reverse("user:create")
 TOKEN_URL = reverse("user:token")
+TOKEN_ROTATE_URL = reverse("user:token-rotate")
 USER_PROFILE_URL = reverse("user:me")
 
 
+def deletion_url(job_id):
+    """Return the progress URL of an account deletion"""
+    return reverse("user:deletion", args=[job_id])
+
+
 def create_user(**params):
     """Helper function to create and return a new user"""
     return get_user_model().objects.create_user(**params)
@@ -84,6 +93,35 @@ class PublicUserApiTests(TestCase):
         self.assertIn('token', res.data)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
 
+    def test_token_authenticates_requests(self):
+        """Test that an issued token can be used for requests"""
+        user = create_user(email='test@example.com', password='testpass123')
+        token = AuthToken.objects.create(user=user)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        res = self.client.get(USER_PROFILE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_rotate_token(self):
+        """Test that rotating a token revokes the old one"""
+        user = create_user(email='test@example.com', password='testpass123')
+        token = AuthToken.objects.create(user=user)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        res = self.client.post(TOKEN_ROTATE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        new_key = res.data['token']
+        self.assertNotEqual(new_key, token.key)
+
+        res = self.client.get(USER_PROFILE_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {new_key}')
+        res = self.client.get(USER_PROFILE_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
     def test_create_token_invalid_credentials(self):
         """Test that token is not created if invalid credentials are given"""
         user_details = {
@@ -156,3 +194,49 @@ class PrivateUserApiTests(TestCase):
         self.assertEqual(self.user.name, payload['name'])
         self.assertTrue(self.user.check_password(payload['password']))
         self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    @override_settings(ACCOUNT_DELETION_ASYNC=False)
+    def test_delete_user(self):
+        """Test deleting the account removes the user and their data"""
+        AuthToken.objects.create(user=self.user)
+        Recipe.objects.create(
+            user=self.user, title='Soup', time_minutes=5, price=100)
+
+        res = self.client.delete(USER_PROFILE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        self.assertFalse(
+            get_user_model().objects.filter(pk=self.user.pk).exists())
+        self.assertFalse(Recipe.objects.exists())
+        self.assertFalse(AuthToken.objects.exists())
+        self.assertEqual(get_job(self.user.pk).status, 'done')
+        self.assertEqual(res.data['status'], 'done')
+        self.assertEqual(res.data['deleted']['recipes'], 1)
+
+    def test_delete_user_deactivates_first(self):
+        """Test the account is locked out before data is deleted"""
+        token = AuthToken.objects.create(user=self.user)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            res = self.client.delete(USER_PROFILE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(len(callbacks), 1)
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+        self.assertFalse(AuthToken.objects.filter(pk=token.pk).exists())
+        self.assertEqual(get_job(self.user.pk).status, 'pending')
+
+    def test_deletion_progress(self):
+        """Test the Location of a deletion reports progress without auth"""
+        with self.captureOnCommitCallbacks():
+            res = self.client.delete(USER_PROFILE_URL)
+        job = get_job(self.user.pk)
+
+        self.assertEqual(res['Location'], deletion_url(job.pk))
+        progress = APIClient().get(res['Location'])
+
+        self.assertEqual(progress.status_code, status.HTTP_200_OK)
+        self.assertEqual(progress.data['id'], str(job.pk))
+        self.assertEqual(progress.data['status'], 'pending')
+        self.assertNotIn('user_id', progress.data)
@@ -11,5 +11,9 @@ app_name = 'user'
 urlpatterns = [
     path('register/', views.CreateUserView.as_view(), name='create'),
     path('login/', views.CreateTokenView.as_view(), name='token'),
+    path('login/rotate/', views.RotateTokenView.as_view(),
+         name='token-rotate'),
     path('me/', views.ManageUserView.as_view(), name='me'),
+    path('deletions/<uuid:pk>/', views.DeletionJobView.as_view(),
+         name='deletion'),
 ]
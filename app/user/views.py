@@ -2,12 +2,23 @@
 Views for the user app API.
 """
 
-from rest_framework import generics, authentication, permissions
+from django.urls import reverse
+from drf_spectacular.utils import extend_schema
+from rest_framework import generics, permissions, status
 from rest_framework.authtoken.views import ObtainAuthToken
+from rest_framework.response import Response
 from rest_framework.settings import api_settings
 
 # local imports
-from user.serializers import UserSerializer, AuthTokenSerializer
+from core.authentication import ExpiringTokenAuthentication
+from core.deletion import schedule_deletion
+from core.models import AuthToken, DeletionJob
+from user.serializers import (
+    UserSerializer,
+    AuthTokenSerializer,
+    DeletionJobSerializer,
+    TokenSerializer,
+)
 
 
 class CreateUserView(generics.CreateAPIView):
@@ -22,14 +33,59 @@ class CreateTokenView(ObtainAuthToken):
     serializer_class = AuthTokenSerializer
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
 
+    def post(self, request, *args, **kwargs):
+        """Issue a new expiring token for the authenticated credentials."""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        token = AuthToken.objects.issue(serializer.validated_data['user'])
+        return Response({'token': token.key})
 
-class ManageUserView(generics.RetrieveUpdateAPIView):
+
+class RotateTokenView(generics.GenericAPIView):
+    """Replace the current auth token with a new one."""
+
+    serializer_class = TokenSerializer
+    authentication_classes = (ExpiringTokenAuthentication,)
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def post(self, request, *args, **kwargs):
+        """Issue a new token and revoke the one used for this request."""
+        token = AuthToken.objects.rotate(request.auth)
+        return Response(self.get_serializer({'token': token.key}).data)
+
+
+class ManageUserView(generics.RetrieveUpdateDestroyAPIView):
     """Manage the authenticated user."""
 
     serializer_class = UserSerializer
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = (ExpiringTokenAuthentication,)
     permission_classes = (permissions.IsAuthenticated,)
 
     def get_object(self):
         """Retrieve and return authenticated user."""
         return self.request.user
+
+    @extend_schema(responses={202: DeletionJobSerializer})
+    def destroy(self, request, *args, **kwargs):
+        """
+        Deactivate the account now and delete its data in chunks,
+        pointing to the job's progress in the Location header.
+        """
+        job = schedule_deletion(self.get_object())
+        return Response(
+            DeletionJobSerializer(job).data,
+            status=status.HTTP_202_ACCEPTED,
+            headers={'Location': reverse('user:deletion', args=[job.pk])},
+        )
+
+
+class DeletionJobView(generics.RetrieveAPIView):
+    """
+    Progress of an account deletion. The account's tokens are revoked
+    when it is deleted, so the unguessable job id is the credential.
+    """
+
+    serializer_class = DeletionJobSerializer
+    queryset = DeletionJob.objects.all()
+    authentication_classes = ()
+    permission_classes = (permissions.AllowAny,)